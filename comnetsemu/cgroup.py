@@ -0,0 +1,345 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+About: Resource accounting of containers based on cgroup counters.
+
+       The counters are read directly from the cgroup filesystem instead of
+       the stats API of Docker. Both cgroup v1 and the unified hierarchy
+       (cgroup v2) are supported.
+"""
+
+import os
+import time
+from collections import namedtuple
+
+PROC_MOUNTS = "/proc/mounts"
+
+# Files of counters, relative to the cgroup directory of a container.
+V1_FILES = {
+    "cpu": ("cpuacct", "cpuacct.usage"),
+    "mem": ("memory", "memory.usage_in_bytes"),
+    "io": ("blkio", "blkio.throttle.io_service_bytes"),
+}
+V2_FILES = {
+    "cpu": "cpu.stat",
+    "mem": "memory.current",
+    "io": "io.stat",
+}
+
+# Raw counters of a cgroup. cpu_ns: CPU time in nanoseconds, mem_bytes: memory
+# usage in bytes, io_read_bytes and io_write_bytes: bytes read from and written
+# to block devices, timestamp: time.monotonic() of the sample. Counters are
+# None if they are not available.
+CgroupStats = namedtuple(
+    "CgroupStats",
+    ["cpu_ns", "mem_bytes", "io_read_bytes", "io_write_bytes", "timestamp"],
+)
+
+# Usage between two CgroupStats. cpu: CPU usage in percent of one CPU, mem: memory
+# usage in MB, io_read and io_write: bytes per second.
+CgroupUsage = namedtuple("CgroupUsage", ["cpu", "mem", "io_read", "io_write"])
+
+
+def _cgroupMounts() -> tuple:
+    """Get the cgroup version and mount points.
+
+    :return: (1, {controller: mount point}) or (2, mount point).
+    :rtype: tuple
+    """
+    v1 = dict()
+    v2 = None
+    with open(PROC_MOUNTS, "r") as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 4:
+                continue
+            if fields[2] == "cgroup":
+                for opt in fields[3].split(","):
+                    v1[opt] = fields[1]
+            elif fields[2] == "cgroup2" and v2 is None:
+                v2 = fields[1]
+    # In the hybrid mode, controllers are still in the v1 hierarchies.
+    if "memory" in v1:
+        return 1, v1
+    return 2, v2
+
+
+_mounts = None
+
+
+def getCgroupVersion() -> int:
+    """Get the version of the cgroup hierarchy used by the controllers."""
+    global _mounts
+    if _mounts is None:
+        _mounts = _cgroupMounts()
+    return _mounts[0]
+
+
+def _cgroupDirs(pid: int):
+    """Get the cgroup directories of a process.
+
+    :return: The directory on cgroup v2 or a dict from controller to the
+        directory on cgroup v1.
+    """
+    getCgroupVersion()
+    version, mounts = _mounts
+    dirs = dict()
+    with open(f"/proc/{pid}/cgroup", "r") as f:
+        for line in f:
+            _, controllers, path = line.rstrip("\n").split(":", 2)
+            if version == 2 and controllers == "":
+                return os.path.join(mounts, path.lstrip("/"))
+            for c in controllers.split(","):
+                if c in mounts:
+                    dirs[c] = os.path.join(mounts[c], path.lstrip("/"))
+    return dirs
+
+
+def getCgroupFiles(pid: int) -> dict:
+    """Get the paths of the counter files of the cgroup of a process.
+
+    The cgroup of a container is found by its init process, so it works with
+    the cgroupfs and systemd drivers of Docker and the cgroup_parent used by
+    APPContainerManager.
+
+    :param pid: PID of a process in the container in the root PID namespace.
+    :type pid: int
+
+    :return: A dict from "cpu", "mem" and "io" to the file paths.
+    :rtype: dict
+    """
+    dirs = _cgroupDirs(pid)
+    if isinstance(dirs, str):
+        return {k: os.path.join(dirs, v) for k, v in V2_FILES.items()}
+    return {
+        k: os.path.join(dirs[controller], name)
+        for k, (controller, name) in V1_FILES.items()
+        if controller in dirs
+    }
+
+
+def _limitWrites(version: int, limits: dict, cpu_max: str = None) -> list:
+    """Convert resource limits to (controller, file, value) writes.
+
+    The CPU quota and period are only changed if they are given. On cgroup
+    v2, both are in cpu.max, so the missing one is taken from its current
+    content cpu_max.
+    """
+    writes = list()
+    period = limits.get("cpu_period", None)
+    quota = limits.get("cpu_quota", None)
+    if version == 2 and (period or "cpu_quota" in limits):
+        cur_quota, cur_period = (cpu_max or "max 100000").split()
+        if "cpu_quota" in limits:
+            cur_quota = "max" if quota is None or quota <= 0 else quota
+        writes.append(("cpu", "cpu.max", f"{cur_quota} {period or cur_period}"))
+    elif version == 1:
+        if period:
+            writes.append(("cpu", "cpu.cfs_period_us", period))
+        if quota is not None:
+            writes.append(("cpu", "cpu.cfs_quota_us", quota))
+    if "cpu_shares" in limits:
+        shares = limits["cpu_shares"]
+        if version == 2:
+            # Same conversion as runc.
+            writes.append(("cpu", "cpu.weight", 1 + ((shares - 2) * 9999) // 262142))
+        else:
+            writes.append(("cpu", "cpu.shares", shares))
+    if "cpuset_cpus" in limits:
+        writes.append(("cpuset", "cpuset.cpus", limits["cpuset_cpus"]))
+    if "cpuset_mems" in limits:
+        writes.append(("cpuset", "cpuset.mems", limits["cpuset_mems"]))
+    if "mem_limit" in limits:
+        mem = limits["mem_limit"]
+        if version == 2:
+            writes.append(("memory", "memory.max", "max" if mem <= 0 else mem))
+        else:
+            writes.append(("memory", "memory.limit_in_bytes", mem))
+    return writes
+
+
+# Limits which can be written by writeCgroupLimits().
+CGROUP_LIMITS = (
+    "cpu_period",
+    "cpu_quota",
+    "cpu_shares",
+    "cpuset_cpus",
+    "cpuset_mems",
+    "mem_limit",
+)
+
+
+def writeCgroupLimits(pid: int, limits: dict):
+    """Write resource limits to the cgroup of a process.
+
+    The limits take effect immediately without a call to the Docker daemon,
+    but the container configuration of Docker is not updated.
+
+    :param pid: PID of a process in the container in the root PID namespace.
+    :type pid: int
+    :param limits: Limits with the names of Docker-py arguments, see
+        CGROUP_LIMITS. mem_limit is given in bytes, -1 removes CPU quota and
+        memory limit.
+    :type limits: dict
+    :raise ValueError: A limit is not supported.
+    """
+    unknown = set(limits) - set(CGROUP_LIMITS)
+    if unknown:
+        raise ValueError(f"Unsupported cgroup limits: {sorted(unknown)}")
+    dirs = _cgroupDirs(pid)
+    version = 2 if isinstance(dirs, str) else 1
+    cpu_max = None
+    if version == 2 and ("cpu_period" in limits or "cpu_quota" in limits):
+        cpu_max = _read(os.path.join(dirs, "cpu.max"))
+    for controller, name, value in _limitWrites(version, limits, cpu_max):
+        base = dirs if version == 2 else dirs[controller]
+        with open(os.path.join(base, name), "w") as f:
+            f.write(str(value))
+
+
+def _read(path: str) -> str:
+    try:
+        with open(path, "r") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _parseCpu(data: str):
+    if not data:
+        return None
+    if data[0].isdigit():
+        # cpuacct.usage of cgroup v1 in nanoseconds.
+        return int(data)
+    for line in data.splitlines():
+        key, value = line.split()
+        if key == "usage_usec":
+            return int(value) * 1000
+    return None
+
+
+def _parseIO(data: str) -> tuple:
+    if data is None:
+        return None, None
+    rbytes, wbytes = 0, 0
+    for line in data.splitlines():
+        fields = line.split()
+        if len(fields) == 3:
+            # cgroup v1: "MAJ:MIN Read|Write|... BYTES"
+            if fields[1] == "Read":
+                rbytes += int(fields[2])
+            elif fields[1] == "Write":
+                wbytes += int(fields[2])
+            continue
+        # cgroup v2: "MAJ:MIN rbytes=N wbytes=N rios=N ..."
+        for field in fields[1:]:
+            key, _, value = field.partition("=")
+            if key == "rbytes":
+                rbytes += int(value)
+            elif key == "wbytes":
+                wbytes += int(value)
+    return rbytes, wbytes
+
+
+def readCgroupStats(files: dict) -> CgroupStats:
+    """Read the counters of one cgroup.
+
+    :param files: The counter files returned by getCgroupFiles().
+    :type files: dict
+    :rtype: CgroupStats
+    """
+    now = time.monotonic()
+    cpu = _parseCpu(_read(files["cpu"])) if "cpu" in files else None
+    mem = _read(files["mem"]) if "mem" in files else None
+    rbytes, wbytes = _parseIO(_read(files["io"]) if "io" in files else None)
+    return CgroupStats(cpu, int(mem) if mem else None, rbytes, wbytes, now)
+
+
+def calculateUsage(prev: CgroupStats, cur: CgroupStats) -> CgroupUsage:
+    """Calculate the resource usage between two samples of the same cgroup."""
+    interval = cur.timestamp - prev.timestamp
+
+    def _rate(a, b):
+        if a is None or b is None or interval <= 0:
+            return None
+        return (b - a) / interval
+
+    cpu = _rate(prev.cpu_ns, cur.cpu_ns)
+    return CgroupUsage(
+        None if cpu is None else cpu / 1e9 * 100.0,
+        None if cur.mem_bytes is None else cur.mem_bytes / (1024**2),
+        _rate(prev.io_read_bytes, cur.io_read_bytes),
+        _rate(prev.io_write_bytes, cur.io_write_bytes),
+    )
+
+
+class CgroupSampler:
+    """Sample the cgroup counters of many containers in one pass.
+
+    The counter files of a container are looked up once when it is added.
+    Each sample then only reads three small files per container, without
+    any call to the Docker daemon.
+    """
+
+    def __init__(self):
+        # Name -> counter files
+        self._files = dict()
+        # Name -> last CgroupStats
+        self._last = dict()
+        # Name -> PID used to find the counter files
+        self._pids = dict()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._files
+
+    def add(self, name: str, pid: int):
+        """Add a container by the PID of its init process. Nothing is done if
+        it is already added with the same PID."""
+        if self._pids.get(name, None) == pid:
+            return
+        self._files[name] = getCgroupFiles(pid)
+        self._pids[name] = pid
+        self._last.pop(name, None)
+
+    def remove(self, name: str):
+        """Remove a container."""
+        self._files.pop(name, None)
+        self._pids.pop(name, None)
+        self._last.pop(name, None)
+
+    def names(self) -> list:
+        return list(self._files)
+
+    def sampleAll(self, names: list = None) -> dict:
+        """Read the counters of all or the given containers.
+
+        :param names: Names of containers. All added containers if None.
+        :type names: list
+
+        :return: A dict from name to CgroupStats.
+        :rtype: dict
+        """
+        # Containers could be added or removed by other threads.
+        files = dict(self._files)
+        if names is None:
+            names = list(files)
+        return {n: readCgroupStats(files[n]) for n in names if n in files}
+
+    def usageAll(self, names: list = None) -> dict:
+        """Get the resource usages since the previous call of usageAll().
+
+        :param names: Names of containers. All added containers if None.
+        :type names: list
+
+        :return: A dict from name to CgroupUsage. Containers sampled for the
+            first time are not included.
+        :rtype: dict
+        """
+        usages = dict()
+        for name, stats in self.sampleAll(names).items():
+            prev = self._last.get(name, None)
+            self._last[name] = stats
+            if prev is not None:
+                usages[name] = calculateUsage(prev, stats)
+        return usages
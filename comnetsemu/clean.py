@@ -6,15 +6,20 @@
 About: ComNetsEmu cleanup
 """
 
+import os
 import re
 import subprocess
 from shlex import split
 import shutil
 
-import docker
-from mininet.log import info
+from mininet.log import debug, error, info
 from mininet.clean import cleanup as mn_cleanup
+from comnetsemu.dockerapi import getClient
 from comnetsemu.net import APPCONTAINERMANGER_MOUNTED_DIR
+from comnetsemu.util import concurrentMap, ipBatch
+
+SYS_CLASS_NET = "/sys/class/net"
+NETDEV_PATTERN = re.compile(r"[a-zA-Z]*[\d]+-[a-zA-Z]*[\d]+")
 
 
 def sh(cmd, check=True):
@@ -27,65 +32,117 @@ def sh(cmd, check=True):
     return ret.stdout.decode("utf-8")
 
 
-def cleanup():
-    """ComNetsEmu cleanup function."""
+def cleanup(dry_run=False):
+    """ComNetsEmu cleanup function.
+
+    :param dry_run: Only report the containers and network devices that
+        would be removed. No estimate of the duration is given: it depends on
+        the Docker daemon and the kernel, and measuring it would require
+        removing objects.
+    :type dry_run: bool
+    """
     info("-" * 80 + "\n" + "*** Run ComNetsEmu's cleanups\n" + "-" * 80 + "\n")
-    info("*** Run mininet's cleanups\n")
-    mn_cleanup()
-    cleanup_docker_containers()
-    cleanup_netdevs()
+    if dry_run:
+        info("*** Dry run, Mininet's cleanups are skipped\n")
+    else:
+        info("*** Run mininet's cleanups\n")
+        mn_cleanup()
+    num_containers = cleanup_docker_containers(dry_run)
+    num_netdevs = cleanup_netdevs(dry_run)
+    if dry_run:
+        if os.path.exists(APPCONTAINERMANGER_MOUNTED_DIR):
+            info(f"Would remove directory {APPCONTAINERMANGER_MOUNTED_DIR}\n")
+        info(
+            f"*** Would remove {num_containers} containers and "
+            f"{num_netdevs} network devices (no time estimate)\n"
+        )
+        return
     info("*** Remove temp directories\n")
     shutil.rmtree(APPCONTAINERMANGER_MOUNTED_DIR, ignore_errors=True)
 
 
-def cleanup_docker_containers():
-    """Cleanup Docker containers created by ComNetsEmu."""
+def _removeContainers(containers):
+    """Force remove containers concurrently."""
+    results = concurrentMap(lambda c: c.remove(force=True), containers)
+    for c, (_, exc) in zip(containers, results):
+        if exc is not None:
+            error(f"Failed to remove container {c.name}: {exc}\n")
+
+
+def cleanup_docker_containers(dry_run=False):
+    """Cleanup Docker containers created by ComNetsEmu.
+
+    DockerHost instances are removed first, then the internal containers.
+    Containers of each type are removed concurrently. The shared client is
+    not closed, since a network of this process may still use it.
+
+    :param dry_run: Only report the containers that would be removed.
+    :type dry_run: bool
+
+    :return: The number of (removed) containers.
+    :rtype: int
+    """
     info("*** Run docker container cleanups\n")
-    client = docker.from_env()
-    containers = client.containers.list(all=True)
+    client = getClient()
+    containers = client.containers.list(all=True, filters={"label": "comnetsemu"})
     docker_hosts = list()
     internal_containers = list()
     for c in containers:
         _type = c.labels.get("comnetsemu", None)
-        if not _type:
-            continue
         if _type == "dockerhost":
             docker_hosts.append(c)
         elif _type == "dockercontainer":
             internal_containers.append(c)
 
+    action = "Would force remove" if dry_run else "Force remove"
     if docker_hosts:
         info(
-            "Force remove all running DockerHost instances: {}\n".format(
-                ", ".join([c.name for c in docker_hosts])
+            "{} all {} running DockerHost instances: {}\n".format(
+                action, len(docker_hosts), ", ".join([c.name for c in docker_hosts])
             )
         )
-        for c in docker_hosts:
-            c.remove(force=True)
+        if not dry_run:
+            _removeContainers(docker_hosts)
 
     if internal_containers:
         info(
-            "Force remove all running internal Docker containers: {}\n".format(
-                ", ".join([c.name for c in internal_containers])
+            "{} all {} running internal Docker containers: {}\n".format(
+                action,
+                len(internal_containers),
+                ", ".join([c.name for c in internal_containers]),
             )
         )
-        for c in internal_containers:
-            c.remove(force=True)
+        if not dry_run:
+            _removeContainers(internal_containers)
 
-    client.close()
+    return len(docker_hosts) + len(internal_containers)
 
 
-def cleanup_netdevs():
+def cleanup_netdevs(dry_run=False):
     """Cleanup network devices created by ComNetsEmu.
     ISSUE: Maybe too aggressive.
+
+    All devices whose names contain the pattern, e.g. s1-eth1 and
+    vnf1-s1-eth1, are deleted with one ip batch.
+
+    :param dry_run: Only report the devices that would be deleted.
+    :type dry_run: bool
+
+    :return: The number of (deleted) devices.
+    :rtype: int
     """
     info(
         r"*** Remove all network devices in /sys/class/net/ "
         + r"with the pattern [a-zA-Z]*[\d]+-[a-zA-Z]*[\d]+"
         + "\n"
     )
-    links = sh("ip link show")
-    ret = re.findall(r"[a-zA-Z]*[\d]+-[a-zA-Z]*[\d]+", links)
-    if ret:
-        for link in ret:
-            sh("ip link delete {}".format(link), check=False)
+    links = [n for n in os.listdir(SYS_CLASS_NET) if NETDEV_PATTERN.search(n)]
+    if dry_run:
+        info(f"Would delete {len(links)} network devices\n")
+    elif links:
+        info(f"Delete {len(links)} network devices\n")
+        # The peer of a deleted veth is also deleted, so errors of devices
+        # that no longer exist are expected.
+        err = ipBatch(["link del dev {}".format(link) for link in links])
+        debug(err)
+    return len(links)
@@ -0,0 +1,463 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+About: Shared access to the Docker Engine API for ComNetsEmu's modules.
+"""
+
+import importlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import docker
+
+from comnetsemu.exceptions import MissingDockerImages
+from mininet.log import debug, info
+
+# Maximal number of connections to the Docker daemon kept in the pool of each
+# shared client. It can be overridden by the environment variable
+# COMNETSEMU_DOCKER_POOL_SIZE or setClientPoolSize().
+DEFAULT_POOL_SIZE = 64
+
+# Container runtimes: Name -> class of clients with the Docker-py API or
+# "module:class" of it, see comnetsemu.runtime. None is Docker-py.
+RUNTIMES = {
+    "docker": None,
+    "netns": "comnetsemu.runtime:NetnsRuntime",
+    "oci": "comnetsemu.runtime:OciRuntime",
+}
+
+# Container events watched by the DockerEventMonitor.
+CONTAINER_EVENTS = ("start", "die", "destroy")
+
+# Interval to re-check the container state with the Docker API when the event
+# stream is not available.
+POLL_INTERVAL_SECS = 0.01
+# Maximal time to block on one event before checking the health of the event
+# stream again.
+EVENT_WAIT_SLICE_SECS = 1.0
+# Number of the latest destroy events kept for late waiters. Waiters of older
+# ones fall back to the check of waitFor().
+MAX_DESTROY_EVENTS = 1024
+
+
+class DockerEventMonitor:
+    """Subscriber of the Docker event stream.
+
+    One stream (the /events endpoint) filtered by the comnetsemu label is read
+    by a daemon thread. Waiters block on a threading.Event per container and
+    event type instead of polling the container state with API calls.
+    """
+
+    def __init__(self, client=None):
+        """Create a DockerEventMonitor.
+
+        :param client: The Docker-py client used for the event stream. The
+            shared client is used if it is None.
+        """
+        self._client = client
+        self._stream = None
+        self._thread = None
+        self._lock = threading.Lock()
+        # (container ID, event type) -> threading.Event
+        self._events = dict()
+        # container ID -> bool, the latest known running state
+        self._running = dict()
+        # IDs of destroyed containers in the order of their destroy events
+        self._destroyed = OrderedDict()
+
+    @property
+    def alive(self) -> bool:
+        """The event stream is subscribed and read."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Subscribe the event stream and start the reader thread.
+
+        Events of containers created after this method returns are never
+        missed.
+        """
+        if self.alive:
+            return
+        if self._client is None:
+            self._client = getClient()
+        self._stream = self._client.events(
+            decode=True,
+            filters={
+                "type": "container",
+                "label": "comnetsemu",
+                "event": list(CONTAINER_EVENTS),
+            },
+        )
+        self._thread = threading.Thread(
+            target=self._run, args=(self._stream,), name="docker-events"
+        )
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Close the event stream."""
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        if self._thread is not None:
+            self._thread.join(timeout=EVENT_WAIT_SLICE_SECS)
+            self._thread = None
+
+    def _getEvent(self, cid: str, action: str) -> threading.Event:
+        """Get the threading.Event of the given container ID and event type.
+        Lock must be held by the caller."""
+        key = (cid, action)
+        event = self._events.get(key, None)
+        if event is None:
+            event = threading.Event()
+            self._events[key] = event
+        return event
+
+    def _run(self, stream):
+        try:
+            for e in stream:
+                cid = e.get("id", None)
+                action = e.get("status", e.get("Action", None))
+                if not cid or action not in CONTAINER_EVENTS:
+                    continue
+                with self._lock:
+                    self._getEvent(cid, action).set()
+                    if action == "destroy":
+                        # The ID is never reused, only the destroy state is
+                        # still needed for late waiters.
+                        self._events.pop((cid, "start"), None)
+                        self._events.pop((cid, "die"), None)
+                        self._running.pop(cid, None)
+                        self._destroyed[cid] = None
+                        if len(self._destroyed) > MAX_DESTROY_EVENTS:
+                            old, _ = self._destroyed.popitem(last=False)
+                            self._events.pop((old, "destroy"), None)
+                    else:
+                        self._running[cid] = action == "start"
+        except Exception as e:
+            debug(f"Docker event stream is closed: {e}\n")
+
+    def isRunning(self, cid: str):
+        """Get the running state of a container based on received events.
+
+        :param cid: ID of the container.
+        :type cid: str
+
+        :return: True or False if the container is known to be running or not.
+            None if the state is unknown, e.g. no event of this container is
+            received since the stream is subscribed or the stream is closed.
+        """
+        if not self.alive:
+            return None
+        return self._running.get(cid, None)
+
+    def waitFor(
+        self,
+        cid: str,
+        action: str,
+        timeout: float = None,
+        check=None,
+        precheck: bool = True,
+    ) -> bool:
+        """Wait until the given event of a container is received.
+
+        :param cid: ID of the container.
+        :type cid: str
+        :param action: Event type, one of CONTAINER_EVENTS.
+        :type action: str
+        :param timeout: Timeout in seconds. Wait forever if it is None.
+        :type timeout: float
+        :param check: An optional callable that returns True if the expected
+            state is already reached, e.g. via a Docker API call. It is only
+            called when no event is received for EVENT_WAIT_SLICE_SECS, or for
+            every POLL_INTERVAL_SECS if the event stream is not alive.
+        :param precheck: Call check once before waiting. It is required if the
+            event could happen before the event stream was subscribed.
+        :type precheck: bool
+
+        :return: True if the event is received or the check succeeds.
+        :rtype: bool
+        """
+        with self._lock:
+            event = self._getEvent(cid, action)
+        if check is not None and precheck and check():
+            return True
+
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            wait_secs = EVENT_WAIT_SLICE_SECS if self.alive else POLL_INTERVAL_SECS
+            if deadline is not None:
+                wait_secs = min(wait_secs, max(0.0, deadline - time.time()))
+            if event.wait(wait_secs):
+                return True
+            if check is not None and check():
+                return True
+            if deadline is not None and time.time() >= deadline:
+                return False
+
+
+_clients = dict()
+_clients_lock = threading.Lock()
+_pool_size = int(os.environ.get("COMNETSEMU_DOCKER_POOL_SIZE", DEFAULT_POOL_SIZE))
+_runtime = os.environ.get("COMNETSEMU_RUNTIME", "docker")
+
+
+def setRuntime(name: str):
+    """Select the container runtime of the shared clients. Existing shared
+    clients are closed if the runtime is changed.
+
+    :param name: Name of the runtime in RUNTIMES.
+    :type name: str
+    """
+    global _runtime
+    if name not in RUNTIMES:
+        raise ValueError(
+            f"Unknown container runtime: {name}. Supported: {tuple(RUNTIMES)}"
+        )
+    if name != _runtime:
+        closeClients()
+        _runtime = name
+
+
+def getRuntime() -> str:
+    """Get the name of the container runtime of the shared clients."""
+    return _runtime
+
+
+def _createRuntimeClient(name: str):
+    factory = RUNTIMES[name]
+    if isinstance(factory, str):
+        module, cls = factory.split(":")
+        factory = getattr(importlib.import_module(module), cls)
+    return factory()
+
+
+def setClientPoolSize(size: int):
+    """Set the connection pool size of shared clients created afterwards.
+
+    :param size: Maximal number of connections kept in the pool.
+    :type size: int
+    """
+    global _pool_size
+    if size < 1:
+        raise ValueError("The pool size must be a positive integer.")
+    _pool_size = size
+
+
+def getClient(base_url: str = None) -> docker.DockerClient:
+    """Get the shared Docker-py client of this process.
+
+    All nodes and managers borrow the same client instead of creating their
+    own connection pools to the Docker daemon. The borrower must not close it,
+    use closeClients() instead. A client of the runtime selected by
+    setRuntime() is created if it is not Docker.
+
+    :param base_url: URL of the Docker daemon. The environment variables are
+        used (like docker.from_env) if it is None.
+    :type base_url: str
+    :rtype: docker.DockerClient
+    """
+    with _clients_lock:
+        client = _clients.get(base_url, None)
+        if client is None:
+            if RUNTIMES[_runtime] is not None:
+                client = _createRuntimeClient(_runtime)
+            elif base_url is None:
+                client = docker.from_env(max_pool_size=_pool_size)
+            else:
+                client = docker.DockerClient(
+                    base_url=base_url, max_pool_size=_pool_size
+                )
+            _clients[base_url] = client
+        return client
+
+
+def setClient(client, base_url: str = None):
+    """Use the given client as the shared client for base_url, e.g. a stub
+    of the Docker API in benchmarks. The replaced client is not closed.
+
+    :param client: The Docker-py client or an object with the same API.
+    :param base_url: URL of the Docker daemon, see getClient().
+    :type base_url: str
+    """
+    with _clients_lock:
+        _clients[base_url] = client
+
+
+def closeClients():
+    """Stop the event monitor and close all shared clients.
+
+    Clients are created again by getClient() if they are needed afterwards.
+    """
+    stopEventMonitor()
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+def normalizeImageName(image: str) -> str:
+    """Add the default tag "latest" to an image name without tag or digest."""
+    if "@" in image or ":" in image.rsplit("/", 1)[-1]:
+        return image
+    return image + ":latest"
+
+
+def ensureImages(images, archives: dict = None, client=None) -> dict:
+    """Check that all images are available locally.
+
+    The local images are listed with one API call. Missing images are loaded
+    from local tar archives (created by docker save) if they are given.
+    Nothing is pulled from a registry.
+
+    :param images: Names of images.
+    :param archives: Image name -> path of a tar archive of the image.
+    :type archives: dict
+    :param client: The Docker-py client. The shared client is used if it is
+        None.
+
+    :return: Image name -> docker.models.images.Image
+    :rtype: dict
+    :raise comnetsemu.exceptions.MissingDockerImages: Images are missing.
+    """
+    if client is None:
+        client = getClient()
+    archives = {normalizeImageName(k): v for k, v in (archives or dict()).items()}
+
+    def _lookup():
+        found = dict()
+        for img in client.images.list():
+            found[img.id] = img
+            for tag in img.tags:
+                found[tag] = img
+        return found
+
+    found = _lookup()
+    wanted = {i: normalizeImageName(i) for i in images}
+    missing = {i for i, n in wanted.items() if n not in found and i not in found}
+    to_load = {archives[wanted[i]] for i in missing if wanted[i] in archives}
+    for path in sorted(to_load):
+        info(f"*** Loading Docker image archive {path}\n")
+        with open(path, "rb") as f:
+            client.images.load(f)
+    if to_load:
+        found = _lookup()
+    missing = {i for i, n in wanted.items() if n not in found and i not in found}
+    for i in sorted(missing):
+        # Not listed, e.g. given by ID or provided by the runtime on demand.
+        try:
+            found[i] = client.images.get(i)
+        except docker.errors.APIError:
+            continue
+        missing.discard(i)
+    if missing:
+        raise MissingDockerImages(missing)
+    return {i: found.get(n, found.get(i)) for i, n in wanted.items()}
+
+
+_event_monitor = None
+_event_monitor_lock = threading.Lock()
+
+
+def getEventMonitor() -> DockerEventMonitor:
+    """Get the process-wide DockerEventMonitor. It is started on the first
+    call. Its alive attribute is False if the event stream can not be
+    subscribed.
+    """
+    global _event_monitor
+    with _event_monitor_lock:
+        if _event_monitor is None:
+            _event_monitor = DockerEventMonitor()
+        if not _event_monitor.alive:
+            try:
+                _event_monitor.start()
+            except docker.errors.DockerException as e:
+                debug(f"Can not subscribe Docker events: {e}\n")
+        return _event_monitor
+
+
+def containerRunning(cid: str):
+    """Get the cached running state of a container without any API call.
+
+    :param cid: ID of the container.
+    :type cid: str
+
+    :return: True, False or None if the state is unknown.
+    """
+    monitor = _event_monitor
+    if monitor is None:
+        return None
+    return monitor.isRunning(cid)
+
+
+def stopEventMonitor():
+    """Stop the process-wide DockerEventMonitor if it is running."""
+    global _event_monitor
+    with _event_monitor_lock:
+        if _event_monitor is not None:
+            _event_monitor.stop()
+            _event_monitor = None
+
+
+def waitContainerRunning(dins, subscribed: bool = False, timeout: float = None) -> bool:
+    """Wait until the given container is running.
+
+    :param dins: The Docker-py container instance.
+    :param subscribed: The process-wide DockerEventMonitor was already alive
+        before the container was started. The container state is then not
+        checked with the Docker API before the start event is received.
+    :type subscribed: bool
+    :param timeout: Timeout in seconds. Wait forever if it is None.
+    :type timeout: float
+
+    :return: True if the container is running. The attrs of dins are then
+        refreshed.
+    :rtype: bool
+    """
+
+    def _check():
+        dins.reload()  # refresh information in 'attrs'
+        return dins.attrs["State"]["Running"]
+
+    if dins.attrs["State"]["Running"]:
+        return True
+    ret = getEventMonitor().waitFor(
+        dins.id, "start", timeout, check=_check, precheck=not subscribed
+    )
+    if ret and not dins.attrs["State"]["Running"]:
+        # The start event does not carry e.g. the PID of the container.
+        dins.reload()
+    return ret
+
+
+def waitContainerRemoved(
+    client, cid: str, subscribed: bool = False, timeout: float = None
+) -> bool:
+    """Wait until the given container is removed.
+
+    :param client: The Docker-py client.
+    :param cid: ID of the container.
+    :type cid: str
+    :param subscribed: The process-wide DockerEventMonitor was already alive
+        before the container was removed.
+    :type subscribed: bool
+    :param timeout: Timeout in seconds. Wait forever if it is None.
+    :type timeout: float
+
+    :return: True if the container is removed.
+    :rtype: bool
+    """
+
+    def _check():
+        try:
+            client.containers.get(cid)
+        except docker.errors.NotFound:
+            return True
+        return False
+
+    return getEventMonitor().waitFor(
+        cid, "destroy", timeout, check=_check, precheck=not subscribed
+    )
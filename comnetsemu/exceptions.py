@@ -7,8 +7,42 @@
 This module contains the set of ComNetsEmu's exceptions.
 """
 
-__all__ = ["InvalidDockerArgs"]
+__all__ = [
+    "ContainerExists",
+    "InvalidDockerArgs",
+    "MissingDockerImages",
+    "PlacementError",
+]
 
 
 class InvalidDockerArgs(ValueError):
     """The Docker arguments provided was somehow invalid."""
+
+
+class MissingDockerImages(ValueError):
+    """Docker images are neither available locally nor in local archives."""
+
+    def __init__(self, images):
+        self.images = sorted(images)
+        super(MissingDockerImages, self).__init__(
+            "Docker images not found: {}".format(", ".join(self.images))
+        )
+
+
+class ContainerExists(ValueError):
+    """A container with the same name is already added or being added."""
+
+    def __init__(self, name):
+        self.name = name
+        super(ContainerExists, self).__init__(f"Container {name} already exists")
+
+
+class PlacementError(ValueError):
+    """A container can not be placed on any DockerHost."""
+
+    def __init__(self, name, reason):
+        self.name = name
+        self.reason = reason
+        super(PlacementError, self).__init__(
+            f"Can not place container {name}: {reason}"
+        )
@@ -0,0 +1,28 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+About: ComNetsEmu Link Module.
+       Mininet's links and interfaces with tracing spans.
+"""
+
+from mininet import link
+
+from comnetsemu.trace import span
+
+
+class TCIntf(link.TCIntf):
+    """TCIntf whose traffic control configuration is traced as a span."""
+
+    def config(self, *args, **kwargs):
+        with span("tc.config", intf=self.name):
+            return super(TCIntf, self).config(*args, **kwargs)
+
+
+class TCLink(link.TCLink):
+    """TCLink with traced TC interfaces, see TCIntf."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("cls1", TCIntf)
+        kwargs.setdefault("cls2", TCIntf)
+        super(TCLink, self).__init__(*args, **kwargs)
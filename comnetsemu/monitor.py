@@ -0,0 +1,295 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+About: Streaming resource monitoring of containers.
+"""
+
+import threading
+import time
+from collections import deque, namedtuple
+
+from comnetsemu.cgroup import CgroupSampler
+from mininet.log import debug, error
+
+# Docker sends one sample per second on a stats stream.
+DOCKER_STATS_INTERVAL_SECS = 1.0
+# Number of samples kept per container.
+DEFAULT_BUFFER_LEN = 600
+
+# cpu: CPU usage in percent of one CPU, like docker stats, e.g. 200 for a
+# container using two CPUs fully. It is the same for both sources of
+# ResourceMonitor. mem: memory usage in MB, timestamp: Unix time.
+ResourceSample = namedtuple("ResourceSample", ["cpu", "mem", "timestamp"])
+
+
+def calculateCpuPercent(stats: dict) -> float:
+    """Calculate the CPU usage in percent of one CPU with given stats JSON data
+    of the Docker API. It is not capped at 100 for containers using several
+    CPUs, like the usage of comnetsemu.cgroup.calculateUsage()."""
+    # percpu_usage is not provided on cgroup v2.
+    cpu_count = stats["cpu_stats"].get("online_cpus", None) or len(
+        stats["cpu_stats"]["cpu_usage"].get("percpu_usage", None) or [None]
+    )
+    cpu_percent = 0.0
+    cpu_delta = float(stats["cpu_stats"]["cpu_usage"]["total_usage"]) - float(
+        stats["precpu_stats"]["cpu_usage"]["total_usage"]
+    )
+    system_delta = float(stats["cpu_stats"]["system_cpu_usage"]) - float(
+        stats["precpu_stats"]["system_cpu_usage"]
+    )
+    if system_delta > 0.0:
+        cpu_percent = cpu_delta / system_delta * 100.0 * cpu_count
+
+    return cpu_percent
+
+
+def statsToSample(stats: dict) -> ResourceSample:
+    """Convert stats JSON data of the Docker API to a ResourceSample.
+
+    :return: The sample or None if stats has no CPU delta, e.g. the first
+        sample of a stream, or no memory usage, e.g. the container is stopped.
+    :rtype: ResourceSample
+    """
+    if not stats.get("precpu_stats", dict()).get("system_cpu_usage", None):
+        return None
+    mem_stats = stats.get("memory_stats", dict())
+    if "usage" not in mem_stats:
+        return None
+    return ResourceSample(
+        calculateCpuPercent(stats), mem_stats["usage"] / (1024**2), time.time()
+    )
+
+
+class ResourceMonitor:
+    """Monitor of the CPU and memory usages of many containers.
+
+    Two sources of samples are supported:
+
+    - docker: One stats stream (stats(stream=True)) of the Docker API is read
+      by a daemon thread per watched container.
+    - cgroup: One daemon thread reads the cgroup counters of all watched
+      containers every interval, see comnetsemu.cgroup.
+
+    Samples are kept in a ring buffer per container and published to
+    subscribers.
+    """
+
+    sources = ("docker", "cgroup")
+
+    # Interval between two samples of a container in seconds.
+    interval = DOCKER_STATS_INTERVAL_SECS
+
+    def __init__(
+        self,
+        maxlen: int = DEFAULT_BUFFER_LEN,
+        source: str = "docker",
+        interval: float = None,
+    ):
+        """Create a ResourceMonitor.
+
+        :param maxlen: Number of samples kept per container.
+        :type maxlen: int
+        :param source: Source of samples, one of sources.
+        :type source: str
+        :param interval: Interval between two samples in seconds. Only the
+            cgroup source supports it, the interval of the docker source is
+            given by the Docker daemon.
+        :type interval: float
+        """
+        if source not in self.sources:
+            raise ValueError(f"Unknown monitor source: {source}")
+        if interval is not None:
+            if source != "cgroup":
+                raise ValueError("The interval is only supported by the cgroup source.")
+            self.interval = interval
+        self.source = source
+        self.maxlen = maxlen
+        self._sampler = CgroupSampler()
+        self._sampler_thread = None
+        self._cond = threading.Condition()
+        # Name -> deque of ResourceSample
+        self._buffers = dict()
+        # Name -> number of samples published since watch()
+        self._counts = dict()
+        # Name -> threading.Event to stop the reader
+        self._stops = dict()
+        self._subscribers = list()
+
+    def watch(self, name: str, dins):
+        """Start monitoring a container.
+
+        :param name: Name of the container used in samples queries.
+        :type name: str
+        :param dins: The Docker-py container instance.
+        """
+        with self._cond:
+            if name in self._stops:
+                return
+            stop = threading.Event()
+            self._stops[name] = stop
+            self._buffers[name] = deque(maxlen=self.maxlen)
+            self._counts[name] = 0
+            if self.source == "cgroup":
+                if not dins.attrs["State"]["Pid"]:
+                    dins.reload()
+                self._sampler.add(name, dins.attrs["State"]["Pid"])
+                if self._sampler_thread is None:
+                    self._sampler_thread = threading.Thread(
+                        target=self._runSampler, name="monitor-cgroup"
+                    )
+                    self._sampler_thread.daemon = True
+                    self._sampler_thread.start()
+                return
+        t = threading.Thread(
+            target=self._run, args=(name, dins, stop), name=f"monitor-{name}"
+        )
+        t.daemon = True
+        t.start()
+
+    def unwatch(self, name: str):
+        """Stop monitoring a container and drop its samples."""
+        with self._cond:
+            stop = self._stops.pop(name, None)
+            if stop is not None:
+                stop.set()
+            self._buffers.pop(name, None)
+            self._counts.pop(name, None)
+            self._sampler.remove(name)
+            self._cond.notify_all()
+
+    def watching(self, name: str) -> bool:
+        """The container is monitored."""
+        return name in self._stops
+
+    def stop(self):
+        """Stop monitoring all containers."""
+        for name in list(self._stops):
+            self.unwatch(name)
+
+    def _read(self, dins, stop):
+        """Yield samples of a container until stop is set."""
+        for stats in dins.stats(decode=True, stream=True):
+            if stop.is_set():
+                return
+            sample = statsToSample(stats)
+            if sample is not None:
+                yield sample
+
+    def _run(self, name, dins, stop):
+        try:
+            for sample in self._read(dins, stop):
+                self._publish(name, sample, stop)
+        except Exception as e:
+            debug(f"Stats stream of container {name} is closed: {e}\n")
+        finally:
+            with self._cond:
+                if self._stops.get(name, None) is stop:
+                    del self._stops[name]
+                self._cond.notify_all()
+
+    def _runSampler(self):
+        """Sample the cgroups of all watched containers every interval."""
+        next_time = time.monotonic()
+        while True:
+            with self._cond:
+                if not self._stops:
+                    self._sampler_thread = None
+                    return
+                stops = dict(self._stops)
+            now = time.time()
+            for name, usage in self._sampler.usageAll().items():
+                stop = stops.get(name, None)
+                if stop is None or usage.cpu is None:
+                    continue
+                self._publish(name, ResourceSample(usage.cpu, usage.mem, now), stop)
+            next_time += self.interval
+            time.sleep(max(0.0, next_time - time.monotonic()))
+
+    def _publish(self, name, sample, stop):
+        with self._cond:
+            if stop.is_set():
+                return
+            self._buffers[name].append(sample)
+            self._counts[name] += 1
+            self._cond.notify_all()
+            subscribers = tuple(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(name, sample)
+            except Exception as e:
+                error(f"Resource monitor subscriber {callback} failed: {e}\n")
+
+    def subscribe(self, callback):
+        """Call callback(name, sample) for every new sample. It is called in
+        the reader threads and should return quickly."""
+        with self._cond:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        """Remove a callback added by subscribe()."""
+        with self._cond:
+            self._subscribers.remove(callback)
+
+    def samples(self, name: str, num: int = None) -> list:
+        """Get the latest samples of a container.
+
+        :param name: Name of the container.
+        :type name: str
+        :param num: Maximal number of samples. All buffered samples if None.
+        :type num: int
+
+        :return: A list of ResourceSample from old to new.
+        :rtype: list
+        """
+        with self._cond:
+            buf = list(self._buffers.get(name, ()))
+        if num is not None:
+            buf = buf[-num:] if num > 0 else []
+        return buf
+
+    def latest(self, name: str) -> ResourceSample:
+        """Get the latest sample of a container or None."""
+        samples = self.samples(name, 1)
+        return samples[0] if samples else None
+
+    def waitSamples(
+        self, name: str, num: int, every: int = 1, timeout: float = None
+    ) -> list:
+        """Wait for new samples of a container.
+
+        :param name: Name of the watched container.
+        :type name: str
+        :param num: Number of samples.
+        :type num: int
+        :param every: Only use every n-th new sample.
+        :type every: int
+        :param timeout: Timeout in seconds. Wait forever if it is None.
+        :type timeout: float
+
+        :return: A list of ResourceSample. It is shorter than num if it times
+            out or the container is no longer monitored.
+        :rtype: list
+        """
+        every = max(1, every)
+        deadline = None if timeout is None else time.time() + timeout
+        samples = list()
+        with self._cond:
+            target = self._counts.get(name, 0) + every
+            while len(samples) < num and name in self._stops:
+                count = self._counts[name]
+                if count >= target:
+                    # Pick the target sample before it leaves the buffer.
+                    buf = self._buffers[name]
+                    back = count - target
+                    if back < len(buf):
+                        samples.append(buf[-1 - back])
+                    target += every
+                    continue
+                wait_secs = None
+                if deadline is not None:
+                    wait_secs = deadline - time.time()
+                    if wait_secs <= 0:
+                        break
+                self._cond.wait(wait_secs)
+        return samples
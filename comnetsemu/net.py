@@ -6,18 +6,40 @@
 import json
 import os
 import os.path
+import select
 import shutil
 import subprocess
 import threading
+import time
+import uuid
+from collections import deque
+import concurrent.futures
+from concurrent.futures import Future, ThreadPoolExecutor
 from functools import partial
-from time import sleep
+from itertools import groupby
 
 import docker
 
 from comnetsemu.cli import spawnXtermDocker
-from comnetsemu.exceptions import InvalidDockerArgs
-from comnetsemu.node import APPContainer, DockerHost
-from mininet.log import debug, error, info
+from comnetsemu.cgroup import CgroupSampler
+from comnetsemu.dockerapi import (
+    closeClients,
+    containerRunning,
+    ensureImages,
+    getClient,
+    getEventMonitor,
+    setRuntime,
+    waitContainerRemoved,
+    waitContainerRunning,
+)
+from comnetsemu.exceptions import ContainerExists, InvalidDockerArgs
+from comnetsemu.monitor import ResourceMonitor, calculateCpuPercent
+from comnetsemu.node import UPDATABLE_RESOURCES, APPContainer, DockerHost
+from comnetsemu.overrides import clearIntfPairs, makeIntfPairs
+from comnetsemu.trace import span, startTracing, stopTracing
+from comnetsemu.util import DEFAULT_WORKERS, PhaseTimer, concurrentMap, ipBatch
+from mininet.link import Link, OVSIntf, OVSLink
+from mininet.log import debug, error, info, warn
 from mininet.net import Mininet
 from mininet.term import cleanUpScreens, makeTerms
 from mininet.util import BaseString
@@ -26,16 +48,97 @@
 VERSION = "0.3.1"
 
 APPCONTAINERMANGER_MOUNTED_DIR = "/tmp/comnetsemu/appcontainermanger"
+# Extra time to wait for resource samples, e.g. for a slow Docker daemon.
+MONITOR_SLACK_SECS = 5.0
+
+
+def _updateAll(updates: list, direct: bool, max_workers: int = None) -> dict:
+    """Call updateResources() of (node, resources) tuples concurrently and
+    return the exceptions of failed updates by node name."""
+    if direct:
+        # Only a few small file writes per node.
+        max_workers = 1
+    results = concurrentMap(
+        lambda u: u[0].updateResources(direct=direct, **u[1]), updates, max_workers
+    )
+    failed = dict()
+    for (node, _), (_, e) in zip(updates, results):
+        if e is not None:
+            warn(f"Failed to update the resources of {node.name}: {e}\n")
+            failed[node.name] = e
+    return failed
 
 
 class Containernet(Mininet):
     """Network emulation with containerized network nodes."""
 
-    def __init__(self, **params):
+    # Time to wait for the prompt after a timed out command is interrupted.
+    interrupt_grace_secs = 1.0
+
+    def __init__(
+        self,
+        build_workers: int = None,
+        batch_links: bool = True,
+        image_archives: dict = None,
+        trace: str = None,
+        runtime: str = None,
+        **params,
+    ):
         """Create a Containernet object with the same parameters provided by
         Mininet.
+
+        :param build_workers: Maximal number of worker threads used to start
+            the containers of DockerHosts in the topology concurrently.
+            Use 1 to start them one by one.
+        :type build_workers: int
+        :param batch_links: Create the veth pairs of all links in the topology
+            with one ip batch instead of one ip process per link.
+        :type batch_links: bool
+        :param image_archives: Image name -> path of a local tar archive
+            (created by docker save). Missing images of DockerHosts in the
+            topology are loaded from these archives before the build.
+        :type image_archives: dict
+        :param trace: Path of a Chrome trace-event JSON file or "otel" to
+            record spans of building and stopping the network, e.g. per
+            container start, shell attach, veth pair and TC configuration.
+            The COMNETSEMU_TRACE environment variable is used if it is None.
+            The trace file is written by stop().
+        :type trace: str
+        :param runtime: Name of the container runtime of DockerHosts and APP
+            containers, e.g. "netns" to run them as processes in namespaces
+            without Docker, see comnetsemu.runtime. The runtime selected with
+            comnetsemu.dockerapi.setRuntime() or the COMNETSEMU_RUNTIME
+            environment variable is used if it is None.
+        :type runtime: str
+
+        :var dhost_startup_times: Time in seconds used to create and run the
+            container of each DockerHost started concurrently by build().
+        :var stop_times: Time in seconds spent in each phase of stop().
+        :var timed_out_hosts: Names of the hosts whose commands timed out in
+            the latest cmdAll() or cmdsAll() call. Their output is partial.
+        :var image_report: Image name -> dict with the size of the image in
+            bytes, the number of DockerHosts using it and the sum of their
+            memory limits in bytes (None if any of them is unlimited).
         """
-        self._appcontainers = list()
+        # APPContainerManagers of this network.
+        self._appcontainer_managers = list()
+        self.build_workers = build_workers
+        self.batch_links = batch_links
+        self.image_archives = image_archives
+        self.image_report = dict()
+        self.dhost_startup_times = dict()
+        self.stop_times = dict()
+        self.timed_out_hosts = list()
+        # DockerHost containers started before the hosts are added.
+        self._prestarted_dins = dict()
+        # Links of the topology added after all veth pairs are created.
+        self._deferred_links = None
+        # Created by the first sampleCgroups() call.
+        self._cgroup_sampler = None
+        if runtime is not None:
+            setRuntime(runtime)
+        # Tracing is process-wide, only the network which started it stops it.
+        self._tracing = startTracing(trace)
 
         # ISSUE: This is a bad workaround to allow X11 forwarding with sudo ...
         #        It is used because running mininet needs root privileges currently ...
@@ -51,6 +154,619 @@ def __init__(self, **params):
 
         Mininet.__init__(self, **params)
 
+    def build(self):
+        """Build the network. Lazy DockerHosts start their shells on first use
+        afterwards."""
+        try:
+            super(Containernet, self).build()
+        finally:
+            for h in self._getHosts():
+                h.oneshot_cmds = False
+
+    def buildFromTopo(self, topo=None):
+        """Build the network from a topology object.
+
+        The containers of all DockerHosts in the topology are created and
+        started concurrently before Mininet adds hosts, switches and links.
+        Shells and veth pairs are attached to the already running containers
+        afterwards. If batch_links is True, the veth pairs of all links are
+        created at once after all nodes are added.
+        """
+        with span("build"):
+            self._buildFromTopo(topo)
+
+    def _buildFromTopo(self, topo):
+        if topo:
+            self._checkImages(topo)
+            self._startDockerHosts(topo)
+        if self.batch_links:
+            self._deferred_links = list()
+        try:
+            super(Containernet, self).buildFromTopo(topo)
+            if self._deferred_links:
+                self._addLinksBatched(self._deferred_links)
+        finally:
+            self._deferred_links = None
+            clearIntfPairs()
+            # Containers of hosts that could not be added are useless.
+            for dins in self._prestarted_dins.values():
+                dins.remove(force=True)
+            self._prestarted_dins.clear()
+
+    def addHost(self, name, cls=None, **params):
+        """Add a host. Use the already running container if the host is a
+        DockerHost started by build()."""
+        dins = self._prestarted_dins.pop(name, None)
+        if dins is not None:
+            params["dins"] = dins
+        with span("addHost", node=name):
+            host = super(Containernet, self).addHost(name, cls=cls, **params)
+        if isinstance(host, DockerHost) and host.lazy_shell and not self.built:
+            # Configure the host with one-shot commands until build() is done.
+            host.oneshot_cmds = True
+        return host
+
+    def addSwitch(self, name, cls=None, **params):
+        """Add a switch."""
+        with span("addSwitch", node=name):
+            return super(Containernet, self).addSwitch(name, cls=cls, **params)
+
+    def addLink(self, node1, node2, port1=None, port2=None, cls=None, **params):
+        """Add a link from node1 to node2. Links of the topology are only
+        recorded while build() adds them in batch and None is returned."""
+        if self._deferred_links is None:
+            with span("addLink", link=self._linkName(node1, node2)):
+                return super(Containernet, self).addLink(
+                    node1, node2, port1, port2, cls, **params
+                )
+        self._deferred_links.append((node1, node2, port1, port2, cls, params))
+        return None
+
+    @staticmethod
+    def _linkName(node1, node2) -> str:
+        return "{}<->{}".format(
+            getattr(node1, "name", node1), getattr(node2, "name", node2)
+        )
+
+    @staticmethod
+    def _isBatchableLink(cls, options: dict) -> bool:
+        """Check if the veth pair of a link can be created in advance, i.e.
+        the link class uses the default interface names and veth pairs."""
+        if isinstance(cls, partial):
+            options = dict(cls.keywords, **options)
+            cls = cls.func
+        return (
+            isinstance(cls, type)
+            and issubclass(cls, Link)
+            and not issubclass(cls, OVSLink)
+            and cls.intfName is Link.intfName
+            and getattr(cls.makeIntfPair, "__func__", None)
+            is Link.makeIntfPair.__func__
+            and options.get("fast", True)
+        )
+
+    def _addLinksBatched(self, links: list):
+        """Create the veth pairs of the given links with one ip batch, then add
+        the links.
+
+        Ports and interface names are assigned in the same order as
+        Mininet.addLink() and Link would do, so the resulting network is the
+        same as adding the links one by one.
+
+        :param links: A list of (node1, node2, port1, port2, cls, params)
+            tuples recorded by addLink().
+        :type links: list
+        """
+        # Node -> port numbers assigned so far.
+        ports = dict()
+
+        def _port(node, port):
+            used = ports.setdefault(node, list(node.ports.values()))
+            if port is None:
+                port = max(used) + 1 if used else node.portBase
+            used.append(port)
+            return port
+
+        to_add = list()
+        pairs = list()
+        for node1, node2, port1, port2, cls, params in links:
+            node1 = node1 if not isinstance(node1, BaseString) else self[node1]
+            node2 = node2 if not isinstance(node2, BaseString) else self[node2]
+            cls = self.link if cls is None else cls
+            options = dict(params)
+            options.setdefault("addr1", self.randMac())
+            options.setdefault("addr2", self.randMac())
+            port1 = _port(node1, port1)
+            port2 = _port(node2, port2)
+            if self._isBatchableLink(cls, options):
+                options.setdefault("intfName1", f"{node1.name}-eth{port1}")
+                options.setdefault("intfName2", f"{node2.name}-eth{port2}")
+                pairs.append(
+                    (
+                        options["intfName1"],
+                        options["intfName2"],
+                        options["addr1"],
+                        options["addr2"],
+                        node1,
+                        node2,
+                    )
+                )
+            to_add.append((node1, node2, port1, port2, cls, options))
+
+        info(f"*** Creating {len(pairs)} veth pairs in batch\n")
+        start = time.time()
+        failed = makeIntfPairs(pairs)
+        debug(
+            "Created {} veth pairs in {:.3f} seconds\n".format(
+                len(pairs) - len(failed), time.time() - start
+            )
+        )
+        for pair in failed:
+            debug("Failed to create veth pair ({}, {}) in batch\n".format(*pair[:2]))
+
+        for node1, node2, port1, port2, cls, options in to_add:
+            with span("addLink", link=self._linkName(node1, node2)):
+                super(Containernet, self).addLink(
+                    node1, node2, port1, port2, cls, **options
+                )
+
+    def _getDockerHostParams(self, params: dict):
+        """Return the keyword arguments of a DockerHost based on the given host
+        parameters in the topology, or None if it is not a DockerHost.
+        """
+        cls = params.get("cls", None) or self.host
+        dparams = dict()
+        if isinstance(cls, partial):
+            dparams.update(cls.keywords)
+            cls = cls.func
+        if not (isinstance(cls, type) and issubclass(cls, DockerHost)):
+            return None
+        dparams.update(params)
+        if "dimage" not in dparams:
+            return None
+        return dparams
+
+    def _checkImages(self, topo):
+        """Check that the images of all DockerHosts in the topology exist
+        before any container is created. Missing images are loaded from
+        image_archives.
+
+        :raise comnetsemu.exceptions.MissingDockerImages: Images are missing.
+        """
+        report = dict()
+        for hostName in topo.hosts():
+            dparams = self._getDockerHostParams(topo.nodeInfo(hostName))
+            if dparams is None:
+                continue
+            r = report.setdefault(
+                dparams["dimage"], {"size": 0, "containers": 0, "mem_limit": 0}
+            )
+            r["containers"] += 1
+            docker_args = dparams.get("docker_args", None) or dict()
+            mem_limit = docker_args.get("mem_limit", None)
+            if mem_limit is None or r["mem_limit"] is None:
+                r["mem_limit"] = None
+            else:
+                r["mem_limit"] += docker.utils.parse_bytes(mem_limit)
+        if not report:
+            return
+
+        info(f"*** Checking {len(report)} Docker images\n")
+        images = ensureImages(list(report), self.image_archives)
+        for dimage, r in report.items():
+            r["size"] = images[dimage].attrs["Size"]
+            mem_limit = (
+                "unlimited"
+                if r["mem_limit"] is None
+                else "{:.1f} MB".format(r["mem_limit"] / (1024**2))
+            )
+            info(
+                "{}: {:.1f} MB, {} DockerHosts, memory limit: {}\n".format(
+                    dimage, r["size"] / (1024**2), r["containers"], mem_limit
+                )
+            )
+        self.image_report = report
+
+    def _startDockerHosts(self, topo):
+        """Create and start containers of all DockerHosts in the topology
+        concurrently.
+        """
+        to_start = list()
+        for hostName in topo.hosts():
+            dparams = self._getDockerHostParams(topo.nodeInfo(hostName))
+            if dparams is None:
+                continue
+            docker_args = DockerHost.buildDockerArgs(
+                hostName,
+                dparams["dimage"],
+                dparams.get("docker_args", None),
+                dparams.get("dcmd", None),
+            )
+            to_start.append((hostName, docker_args))
+        if not to_start:
+            return
+
+        dclient = getClient()
+
+        def _run(item):
+            _, docker_args = item
+            start = time.time()
+            dins = DockerHost.runContainer(dclient, docker_args)
+            return dins, time.time() - start
+
+        info(f"*** Starting {len(to_start)} DockerHost containers\n")
+        start = time.time()
+        results = concurrentMap(_run, to_start, self.build_workers)
+        total = time.time() - start
+
+        failed = None
+        for (name, _), (ret, exc) in zip(to_start, results):
+            if exc is not None:
+                error(f"Failed to start the container of DockerHost {name}: {exc}\n")
+                failed = failed or exc
+                continue
+            dins, duration = ret
+            self._prestarted_dins[name] = dins
+            self.dhost_startup_times[name] = duration
+        if failed:
+            for dins in self._prestarted_dins.values():
+                dins.remove(force=True)
+            self._prestarted_dins.clear()
+            raise failed
+
+        slowest = max(self.dhost_startup_times, key=self.dhost_startup_times.get)
+        info(
+            "*** Started {} DockerHost containers in {:.3f} seconds. Slowest: {} ({:.3f} seconds)\n".format(
+                len(to_start), total, slowest, self.dhost_startup_times[slowest]
+            )
+        )
+        for name, duration in self.dhost_startup_times.items():
+            debug(f"DockerHost {name} container startup time: {duration:.3f}s\n")
+
+    def _getHosts(self, hosts: list = None) -> list:
+        """Get host objects based on the given hosts or their names. Return
+        all DockerHosts in the network if hosts is None."""
+        if hosts is None:
+            return [h for h in self.hosts if isinstance(h, DockerHost)]
+        return [h if not isinstance(h, BaseString) else self[h] for h in hosts]
+
+    @staticmethod
+    def _readToPrompt(h) -> tuple:
+        """Read the output of an interrupted command up to the next prompt.
+
+        The tty discards the input queued after the interrupt, e.g. the rest
+        of a batch sent by sendCmds(), so the next prompt is the last one.
+
+        :return: (data, done) like the monitor of _pollShells().
+        :rtype: tuple
+        """
+        data = h.read(1024)
+        if chr(127) not in data:
+            return data, False
+        data, _, h.readbuf = data.partition(chr(127))
+        h.waiting = False
+        return data, True
+
+    def _pollShells(
+        self, hosts: list, monitor, timeout: float = None, timed_out: list = None
+    ):
+        """Multiplex the output of the shells of many hosts with one poll loop.
+
+        :param hosts: Hosts that are waiting for their commands to complete.
+        :type hosts: list
+        :param monitor: Callable that reads the available output of a host and
+            returns (data, done). done is True if the command completes.
+        :param timeout: Timeout in seconds for each host. The running command
+            of a host is interrupted with sendInt() when it times out and its
+            output is read up to the next prompt. If the shell does not print
+            it within interrupt_grace_secs, the host stops waiting and the
+            shell of a DockerHost is closed, so its next command starts a
+            new shell.
+        :type timeout: float
+        :param timed_out: Hosts that time out are appended to this list.
+        :type timed_out: list
+
+        :return: An iterator which yields (host, data, done).
+        """
+        poller = select.poll()
+        pending = dict()
+        for h in hosts:
+            if h.waiting:
+                poller.register(h.stdout.fileno(), select.POLLIN)
+                pending[h.stdout.fileno()] = h
+        deadline = None if timeout is None else time.time() + timeout
+        interrupted = False
+        while pending:
+            timeoutms = -1
+            if deadline is not None:
+                timeoutms = max(0, int((deadline - time.time()) * 1000))
+            for fd, event in poller.poll(timeoutms):
+                h = pending[fd]
+                if event & select.POLLIN:
+                    data, done = (self._readToPrompt if interrupted else monitor)(h)
+                else:
+                    error(f"The shell of {h.name} is closed.\n")
+                    h.waiting = False
+                    data, done = "", True
+                if done:
+                    poller.unregister(fd)
+                    del pending[fd]
+                yield h, data, done
+            if not pending or deadline is None or time.time() < deadline:
+                continue
+            if not interrupted:
+                for h in pending.values():
+                    warn(f"*** Command on {h.name} timed out. Interrupt it.\n")
+                    h.sendInt()
+                    if timed_out is not None:
+                        timed_out.append(h)
+                # Give the shells a short time to print the prompt.
+                deadline = time.time() + self.interrupt_grace_secs
+                interrupted = True
+            else:
+                for fd, h in pending.items():
+                    error(f"*** Shell of {h.name} does not respond.\n")
+                    poller.unregister(fd)
+                    if isinstance(h, DockerHost):
+                        h.closeShell()
+                    h.waiting = False
+                    yield h, "", True
+                break
+
+    def cmdAllIter(
+        self,
+        cmd: str,
+        hosts: list = None,
+        timeout: float = None,
+        timed_out: list = None,
+    ):
+        """Send a command to many hosts at once and yield their output as it
+        arrives.
+
+        :param cmd: The command in string format.
+        :type cmd: str
+        :param hosts: A list of hosts or their names. All DockerHosts in the
+            network are used if it is None.
+        :type hosts: list
+        :param timeout: Timeout in seconds for each host.
+        :type timeout: float
+        :param timed_out: Hosts that time out are appended to this list.
+        :type timed_out: list
+
+        :return: An iterator which yields (host, data). data is None when the
+            command on the host completes.
+        """
+        hosts = self._getHosts(hosts)
+        for h in hosts:
+            h.sendCmd(cmd)
+
+        def _monitor(h):
+            data = h.monitor(timeoutms=0)
+            return data, not h.waiting
+
+        for h, data, done in self._pollShells(hosts, _monitor, timeout, timed_out):
+            if data:
+                yield h, data
+            if done:
+                yield h, None
+
+    def cmdAll(self, cmd: str, hosts: list = None, timeout: float = None) -> dict:
+        """Run a command on many hosts in parallel and return their outputs.
+
+        The command is sent to all shells at once and the outputs are
+        collected with one poll loop over the file descriptors of all shells.
+        So it takes as long as the slowest host instead of the sum of all
+        hosts.
+
+        :param cmd: The command in string format.
+        :type cmd: str
+        :param hosts: A list of hosts or their names. All DockerHosts in the
+            network are used if it is None.
+        :type hosts: list
+        :param timeout: Timeout in seconds for each host. The command on a host
+            is interrupted if it times out and its output is incomplete. The
+            names of these hosts are stored in timed_out_hosts.
+        :type timeout: float
+
+        :return: A dict from host name to the output.
+        :rtype: dict
+        """
+        hosts = self._getHosts(hosts)
+        outputs = {h.name: "" for h in hosts}
+        timed_out = list()
+        for h, data in self.cmdAllIter(cmd, hosts, timeout, timed_out):
+            if data:
+                outputs[h.name] += data
+        self.timed_out_hosts = [h.name for h in timed_out]
+        return outputs
+
+    def cmdsAll(self, cmds: list, hosts: list = None, timeout: float = None) -> dict:
+        """Run a batch of commands on many DockerHosts in parallel.
+
+        The batch is sent to all hosts at once with DockerHost.sendCmds() and
+        the outputs are collected with one poll loop over the file descriptors
+        of all shells.
+
+        :param cmds: A list of single line commands in string format.
+        :type cmds: list
+        :param hosts: A list of DockerHosts or their names. All DockerHosts in
+            the network are used if it is None.
+        :type hosts: list
+        :param timeout: Timeout in seconds for each host. The running command
+            of a host is interrupted if it times out and the remaining
+            commands of its batch are dropped. The output of these hosts ends
+            with the partial output of the interrupted command, their names
+            are stored in timed_out_hosts.
+        :type timeout: float
+
+        :return: A dict from host name to the list of outputs per command.
+        :rtype: dict
+        """
+        hosts = self._getHosts(hosts)
+        for h in hosts:
+            h.sendCmds(cmds)
+
+        def _monitor(h):
+            return "", h.monitorCmds(timeoutms=0)
+
+        timed_out = list()
+        for h, data, done in self._pollShells(hosts, _monitor, timeout, timed_out):
+            if h in timed_out:
+                h._batch_buf += data
+                if done:
+                    h._batch_outputs.append(h._batch_buf)
+                    h._batch_buf = ""
+                    h._batch_num = len(h._batch_outputs)
+        self.timed_out_hosts = [h.name for h in timed_out]
+        return {
+            h.name: h._batch_outputs if h.shell or h in timed_out else list()
+            for h in hosts
+        }
+
+    def updateResources(self, updates: dict, direct: bool = False) -> dict:
+        """Update the resource limits of many DockerHosts concurrently.
+
+        :param updates: A dict from host name to a dict of resources, see
+            DockerHost.updateResources().
+        :type updates: dict
+        :param direct: Write the limits to the cgroup files directly.
+        :type direct: bool
+
+        :return: A dict from host name to the exception of failed updates.
+        :rtype: dict
+        """
+        return _updateAll(
+            [(self[name], resources) for name, resources in updates.items()],
+            direct,
+            self.build_workers,
+        )
+
+    def sampleCgroups(self, hosts: list = None) -> dict:
+        """Read the cgroup counters of many DockerHosts in one pass.
+
+        The counters are read from the cgroup filesystem without any call to
+        the Docker daemon. Counters of a DockerHost include its APP containers.
+        Use comnetsemu.cgroup.calculateUsage() to get the usage between two
+        samples.
+
+        :param hosts: A list of DockerHosts or their names. All DockerHosts in
+            the network are used if it is None.
+        :type hosts: list
+
+        :return: A dict from host name to comnetsemu.cgroup.CgroupStats.
+        :rtype: dict
+        """
+        if self._cgroup_sampler is None:
+            self._cgroup_sampler = CgroupSampler()
+        sampler = self._cgroup_sampler
+        hosts = self._getHosts(hosts)
+        for h in hosts:
+            sampler.add(h.name, h.dins.attrs["State"]["Pid"])
+        return sampler.sampleAll([h.name for h in hosts])
+
+    def start(self):
+        """Start controller(s) and switches."""
+        with span("start"):
+            super(Containernet, self).start()
+
+    def stop(self):
+        """Stop the controller(s), switches and hosts.
+
+        Compared to Mininet.stop(), containers of all DockerHosts are removed
+        concurrently first. Their veth pairs disappear with their network
+        namespaces, the remaining veths in the root namespace are deleted with
+        one ip batch. Shells are collected at the end. Time spent in each phase
+        is stored in stop_times.
+        """
+        timer = PhaseTimer()
+        with timer.phase("controllers"):
+            info("*** Stopping %i controllers\n" % len(self.controllers))
+            for controller in self.controllers:
+                info(controller.name + " ")
+                controller.stop()
+            info("\n")
+        if self.terms:
+            with timer.phase("terms"):
+                info("*** Stopping %i terms\n" % len(self.terms))
+                self.stopXterms()
+
+        dhosts = [h for h in self.hosts if isinstance(h, DockerHost)]
+        with timer.phase("containers"):
+            info("*** Removing %i DockerHost containers\n" % len(dhosts))
+            concurrentMap(lambda h: h.removeContainer(), dhosts, self.build_workers)
+
+        with timer.phase("links"):
+            info("*** Stopping %i links\n" % len(self.links))
+            self._stopLinks(set(dhosts))
+
+        with timer.phase("switches"):
+            info("*** Stopping %i switches\n" % len(self.switches))
+            stopped = {}
+            for swclass, switches in groupby(
+                sorted(self.switches, key=lambda s: str(type(s))), type
+            ):
+                switches = tuple(switches)
+                if hasattr(swclass, "batchShutdown"):
+                    success = swclass.batchShutdown(switches)
+                    stopped.update({s: s for s in success})
+            for switch in self.switches:
+                info(switch.name + " ")
+                if switch not in stopped:
+                    switch.stop()
+                switch.terminate()
+            info("\n")
+
+        with timer.phase("hosts"):
+            info("*** Stopping %i hosts\n" % len(self.hosts))
+            for host in self.hosts:
+                info(host.name + " ")
+                host.terminate()
+            info("\n")
+        closeClients()
+        self.stop_times = timer.durations
+        info(f"*** Time spent to stop: {timer.report()}\n")
+        if self._tracing:
+            stopTracing()
+            self._tracing = False
+        info("*** Done\n")
+
+    def _stopLinks(self, removed: set):
+        """Stop links. Veth pairs with one end in the root namespace are
+        deleted with one ip batch.
+
+        :param removed: DockerHosts whose containers are already removed.
+        :type removed: set
+        """
+        to_delete = list()
+        for link in self.links:
+            intfs = (link.intf1, link.intf2)
+            if any(isinstance(i, OVSIntf) for i in intfs):
+                link.stop()
+                continue
+            in_root = [i for i in intfs if not i.node.inNamespace]
+            if not in_root and not any(i.node in removed for i in intfs):
+                link.stop()
+                continue
+            # Deleting one end of a veth pair also deletes the other end.
+            to_delete.extend(i.name for i in in_root)
+            for i in intfs:
+                i.node.delIntf(i)
+                i.link = None
+            link.intf1, link.intf2 = None, None
+        err = ipBatch(["link del dev {}".format(name) for name in to_delete])
+        # Interfaces could be already removed with the namespaces of removed
+        # DockerHosts.
+        debug(err)
+
+    @property
+    def _appcontainers(self) -> list:
+        """Names of APP containers added by all managers of this network."""
+        return [
+            name
+            for mgr in tuple(self._appcontainer_managers)
+            for name in mgr.getAllContainers()
+        ]
+
     def addDockerHost(self, name: str, **params):  # pragma: no cover
         """Wrapper for addHost method that adds a Docker container as a host.
 
@@ -92,15 +808,35 @@ def addLinkNamedIfce(self, src, dst, *args, **kwargs):  # pragma: no cover
         )
 
 
+class APPContainerManagerHTTPServer(http.server.ThreadingHTTPServer):
+    """HTTP server which handles each request in a new thread."""
+
+    # Backlog of the listening socket. Many clients, e.g. all hosts of a
+    # network, may connect at the same time.
+    request_queue_size = 128
+
+
 class APPContainerManagerRequestHandler(http.server.BaseHTTPRequestHandler):
     """Basic implementation of a REST API for app containers.
 
     Python's built-in http server only does basic security checks and this class
     has basic and limited sanity checks on the requests. Designed only for
     teaching.
+
+    Resources:
+
+    - GET /containers: List names of all containers.
+    - POST /containers: Create a container asynchronously. 202 is returned
+      with the status URL in the Location header, 409 if a container with
+      the name is already added or being added.
+    - GET /containers/<name>: Get the status of a container.
+    - DELETE /containers/<name>: Remove a container.
+    - POST /containers:batch: Create a list of containers asynchronously.
+    - DELETE /containers:batch: Remove a list of containers given by names.
     """
 
     _container_resource_path = "/containers"
+    _batch_resource_path = "/containers:batch"
 
     def __init__(self, appcontainermanager, enable_log=True, *args, **kargs):
         self.mgr = appcontainermanager
@@ -111,6 +847,37 @@ def _send_bad_request(self):
         self.send_response(400)
         self.end_headers()
 
+    def _send_json(self, code, data, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or dict()).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        """Read the JSON body. Return None if it is empty or invalid."""
+        content_length = int(self.headers.get("content-length", 0))
+        if content_length == 0:
+            return None
+        post_data = self.rfile.read(content_length).decode("utf-8")
+        try:
+            return json.loads(post_data)
+        except ValueError:
+            return None
+
+    def _container_name(self):
+        """Get the container name of a /containers/<name> path or None."""
+        paths = os.path.split(self.path)
+        if len(paths) == 2 and paths[0] == self._container_resource_path:
+            return paths[1]
+        return None
+
+    def _status_url(self, name):
+        return "/".join((self._container_resource_path, name))
+
     def log_message(self, format, *args):
         if not self.enable_log:
             return
@@ -119,37 +886,62 @@ def log_message(self, format, *args):
 
     def do_GET(self):
         if self.path == self._container_resource_path:
-            self.send_response(200)
+            self._send_json(200, self.mgr.getAllContainers())
+            return
+        name = self._container_name()
+        if not name:
+            self._send_bad_request()
+            return
+        status = self.mgr.getContainerStatus(name)
+        if status is None:
+            self.send_response(404)
             self.end_headers()
-            ret = json.dumps(self.mgr.getAllContainers()).encode("utf-8")
-            self.wfile.write(ret)
         else:
-            self._send_bad_request()
+            self._send_json(200, status)
 
     @staticmethod
     def _post_sanity_check(post_dict):
         # Check for essential keys.
+        if not isinstance(post_dict, dict):
+            return False
         for k in ["name", "dhost", "dimage", "dcmd", "docker_args"]:
             if k not in post_dict:
                 return False
         else:
             return True
 
+    def _add_container(self, container_para):
+        """Start the creation of a container. Return the status code and the
+        response item."""
+        name = container_para["name"]
+        try:
+            self.mgr.addContainerAsync(**container_para)
+        except ContainerExists as e:
+            return 409, {"name": name, "error": str(e)}
+        except (KeyError, TypeError, ValueError) as e:
+            return 400, {"name": name, "error": str(e)}
+        return 202, {"name": name, "status_url": self._status_url(name)}
+
     def do_POST(self):
-        """Create a new APP container."""
+        """Create new APP containers."""
         if self.path == self._container_resource_path:
-            content_length = int(self.headers.get("content-length", 0))
-            if content_length == 0:
+            container_para = self._read_json()
+            if not self._post_sanity_check(container_para):
                 self._send_bad_request()
+                return
+            code, ret = self._add_container(container_para)
+            if code != 202:
+                self._send_json(code, ret)
             else:
-                post_data = self.rfile.read(content_length).decode("utf-8")
-                container_para = json.loads(post_data)
-                if not self._post_sanity_check(container_para):
-                    self._send_bad_request()
-                else:
-                    self.mgr.addContainer(**container_para)
-                    self.send_response(200)
-                    self.end_headers()
+                self._send_json(code, ret, {"Location": ret["status_url"]})
+        elif self.path == self._batch_resource_path:
+            container_paras = self._read_json()
+            if not isinstance(container_paras, list) or not all(
+                self._post_sanity_check(p) for p in container_paras
+            ):
+                self._send_bad_request()
+                return
+            self._send_json(202, [self._add_container(p)[1] for p in container_paras])
         else:
             self._send_bad_request()
 
@@ -159,17 +951,212 @@ def _delete_sanity_check(self, container_name):
         return True if c else False
 
     def do_DELETE(self):
-        paths = os.path.split(self.path)
-        if len(paths) == 2 and paths[0] == self._container_resource_path:
-            container_name = paths[1]
-            if not self._delete_sanity_check(container_name):
+        if self.path == self._batch_resource_path:
+            names = self._read_json()
+            if not isinstance(names, list) or not all(
+                isinstance(n, str) for n in names
+            ):
                 self._send_bad_request()
-            else:
-                self.mgr.removeContainer(container_name)
-                self.send_response(200)
-                self.end_headers()
-        else:
+                return
+            results = concurrentMap(self.mgr.removeContainer, names)
+            self._send_json(
+                200,
+                {
+                    name: "removed" if e is None else str(e)
+                    for name, (_, e) in zip(names, results)
+                },
+            )
+            return
+        container_name = self._container_name()
+        if not container_name or not self._delete_sanity_check(container_name):
             self._send_bad_request()
+        else:
+            self.mgr.removeContainer(container_name)
+            self.send_response(200)
+            self.end_headers()
+
+
+class APPContainerRegistry:
+    """Index of APP containers by name and by DockerHost.
+
+    Writers hold a lock for the constant-time index updates. Readers get an
+    immutable snapshot of all containers which is rebuilt on the first read
+    after a write (copy-on-write), so reading does not block writers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Name -> APPContainer, in the order of addition.
+        self._by_name = dict()
+        # Name of DockerHost -> {Name: APPContainer}, used as an ordered set.
+        self._by_dhost = dict()
+        # Tuple of all containers, None if it is outdated.
+        self._snapshot = None
+
+    def __len__(self) -> int:
+        return len(self._by_name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._by_name
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def add(self, container: APPContainer):
+        """Add a container. A container with the same name is replaced."""
+        with self._lock:
+            old = self._by_name.pop(container.name, None)
+            if old is not None:
+                del self._by_dhost[old.dhost][old.name]
+            self._by_name[container.name] = container
+            on_dhost = self._by_dhost.setdefault(container.dhost, dict())
+            on_dhost[container.name] = container
+            self._snapshot = None
+
+    def remove(self, name: str, container: APPContainer = None) -> APPContainer:
+        """Remove the container with the given name.
+
+        :param name: Name of the container.
+        :type name: str
+        :param container: Only remove the container if it is this instance.
+        :type container: APPContainer
+
+        :return: The removed container or None if it is not found.
+        :rtype: APPContainer
+        """
+        with self._lock:
+            c = self._by_name.get(name, None)
+            if c is None or (container is not None and c is not container):
+                return None
+            del self._by_name[name]
+            on_dhost = self._by_dhost[c.dhost]
+            del on_dhost[name]
+            if not on_dhost:
+                del self._by_dhost[c.dhost]
+            self._snapshot = None
+            return c
+
+    def get(self, name: str, default=None) -> APPContainer:
+        """Get the container with the given name."""
+        return self._by_name.get(name, default)
+
+    def getDhost(self, dhost: str) -> list:
+        """Get containers on the given DockerHost in the order of addition."""
+        with self._lock:
+            return list(self._by_dhost.get(dhost, dict()).values())
+
+    def snapshot(self) -> tuple:
+        """Get a tuple of all containers in the order of addition."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = tuple(self._by_name.values())
+                snapshot = self._snapshot
+        return snapshot
+
+
+class APPContainerPool:
+    """Idle, paused containers of APPContainerManager per (DockerHost, image).
+
+    Only the bookkeeping is done here, the containers are created, paused and
+    removed by the manager. All methods are thread-safe.
+    """
+
+    def __init__(self, size: int = 0):
+        """
+        :param size: Default number of idle containers per (DockerHost,
+            image) used by the manager.
+        :type size: int
+        """
+        self.size = size
+        self.closed = False
+        self._lock = threading.Lock()
+        # (DockerHost name, image) -> deque of paused container instances.
+        self._idle = dict()
+        # (DockerHost name, image) -> number of idle containers to keep.
+        self._sizes = dict()
+        # (DockerHost name, image) -> number of containers being created.
+        self._pending = dict()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(q) for q in self._idle.values())
+
+    def keys(self) -> list:
+        """Get keys with a set size or idle containers."""
+        with self._lock:
+            return list(set(self._idle) | set(self._sizes))
+
+    def getSize(self, key: tuple) -> int:
+        """Get the number of idle containers kept for the given key."""
+        return self._sizes.get(key, self.size)
+
+    def setSize(self, key: tuple, size: int) -> list:
+        """Set the number of idle containers kept for the given key.
+
+        :return: Idle containers above the new size. The caller has to remove
+            them.
+        :rtype: list
+        """
+        with self._lock:
+            self._sizes[key] = size
+            q = self._idle.get(key, deque())
+            surplus = list()
+            while len(q) > size:
+                surplus.append(q.pop())
+            return surplus
+
+    def idle(self, key: tuple) -> int:
+        """Get the number of idle containers for the given key."""
+        with self._lock:
+            return len(self._idle.get(key, ()))
+
+    def take(self, key: tuple):
+        """Take an idle container or None if there is no one."""
+        with self._lock:
+            q = self._idle.get(key, None)
+            return q.popleft() if q else None
+
+    def reserve(self, key: tuple) -> int:
+        """Get the number of containers to create to refill the given key.
+        They are counted as pending until put() or cancel() is called."""
+        with self._lock:
+            if self.closed:
+                return 0
+            have = len(self._idle.get(key, ())) + self._pending.get(key, 0)
+            num = max(0, self.getSize(key) - have)
+            self._pending[key] = self._pending.get(key, 0) + num
+            return num
+
+    def put(self, key: tuple, dins) -> bool:
+        """Add a created container reserved by reserve().
+
+        :return: False if the pool is closed or full. The caller has to remove
+            the container.
+        :rtype: bool
+        """
+        with self._lock:
+            self._pending[key] -= 1
+            q = self._idle.setdefault(key, deque())
+            if self.closed or len(q) >= self.getSize(key):
+                return False
+            q.append(dins)
+            return True
+
+    def cancel(self, key: tuple):
+        """Cancel a creation reserved by reserve()."""
+        with self._lock:
+            self._pending[key] -= 1
+
+    def drain(self, key: tuple = None) -> list:
+        """Remove and return idle containers of the given or all keys."""
+        with self._lock:
+            keys = list(self._idle) if key is None else [key]
+            drained = list()
+            for k in keys:
+                drained.extend(self._idle.pop(k, ()))
+            return drained
 
 
 class APPContainerManager:
@@ -195,6 +1182,17 @@ class APPContainerManager:
         "security_opt": ["seccomp:unconfined"],
     }
 
+    # Command of idle containers in the warm pool. Like the commonly used
+    # "bash", it keeps running with the allocated TTY.
+    pool_cmd = "sh"
+    pool_name_prefix = "comnetsemu-pool-"
+    # Docker arguments which can still be applied to an idle container with
+    # the update API. Containers with other arguments are never pooled.
+    pool_update_args = UPDATABLE_RESOURCES
+    # Time in seconds to keep a failed creation of addContainerAsync() which
+    # is not queried with getContainerStatus().
+    failed_deployment_ttl = 600.0
+
     docker_volumes_default = {
         # Shared directory in host OS
         APPCONTAINERMANGER_MOUNTED_DIR: {
@@ -203,26 +1201,59 @@ class APPContainerManager:
         }
     }
 
-    # Default delay between tries for Docker API
-    retry_delay_secs = 0.1
-
-    def __init__(self, net: Mininet):
+    def __init__(
+        self,
+        net: Mininet,
+        max_workers: int = None,
+        monitor_source: str = "docker",
+        monitor_interval: float = None,
+        pool_size: int = 0,
+    ):
         """Init the APPContainerManager.
 
         :param net (Mininet): The mininet object, used to manage hosts via Mininet's API.
+        :param max_workers: Maximal number of containers created and started
+            concurrently by addContainerAsync().
+        :type max_workers: int
+        :param monitor_source: Source of resource samples: "docker" for the
+            stats API or "cgroup" for the cgroup counters.
+        :type monitor_source: str
+        :param monitor_interval: Interval of resource samples in seconds. Only
+            supported by the cgroup source.
+        :type monitor_interval: float
+        :param pool_size: Number of idle containers kept in the warm pool per
+            (DockerHost, image) after the first container of them is added.
+            0 disables the pool, see warmPool().
+        :type pool_size: int
         """
         self.net = net
-        self.dclt = docker.from_env()
-
-        # Following resources can be shared by main and httpd threads.
-        # A simple lock is used.
-        self._container_queue_lock = threading.Lock()
-        self._container_queue = list()
-        # Fast search for added containers.
-        self._name_container_map = dict()
+        self.dclt = getClient()
+        self.max_workers = max_workers or DEFAULT_WORKERS
+
+        # Following resources can be shared by main, httpd and worker threads.
+        # The registry has its own lock which is never held during Docker API
+        # calls.
+        self._registry = APPContainerRegistry()
+        # Created on the first addContainerAsync() call.
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._pool = APPContainerPool(pool_size)
+        # Created on the first refill of the pool.
+        self._pool_executor = None
+        if hasattr(net, "_appcontainer_managers"):
+            net._appcontainer_managers.append(self)
 
         self._http_server_started = False
         self._http_server_thread = None
+        self._httpd = None
+        # Name -> Future of creations started by addContainerAsync() which
+        # are pending.
+        self._deployments = dict()
+        # Name -> (Future, time.monotonic() of the failure) of failed
+        # creations, until they are reported by getContainerStatus().
+        self._failed_deployments = dict()
+        self.monitor = ResourceMonitor(source=monitor_source, interval=monitor_interval)
+        self._monitor_all = False
 
         os.makedirs(APPCONTAINERMANGER_MOUNTED_DIR, exist_ok=True)
 
@@ -250,21 +1281,13 @@ def _createContainer(self, name, dhost, dimage, dcmd, docker_args):
         ret = self.dclt.containers.create(**docker_args)
         return ret
 
-    def _waitContainerStart(self, name):  # pragma: no cover
+    def _waitContainerStart(self, dins, subscribed=False):  # pragma: no cover
         """Wait for container to start up running"""
-        while not self._getDockerIns(name):
-            debug("Failed to get container:%s" % (name))
-            sleep(self.retry_delay_secs)
-        dins = self._getDockerIns(name)
-
-        while not dins.attrs["State"]["Running"]:
-            sleep(self.retry_delay_secs)
-            dins.reload()  # refresh information in 'attrs'
+        waitContainerRunning(dins, subscribed)
 
-    def _waitContainerRemoved(self, name):  # pragma: no cover
+    def _waitContainerRemoved(self, dins, subscribed=False):  # pragma: no cover
         """Wait for container to be removed"""
-        while self._getDockerIns(name):
-            sleep(self.retry_delay_secs)
+        waitContainerRemoved(self.dclt, dins.id, subscribed)
 
     def _getDockerIns(self, name):
         """Get the APPContainer instance by name.
@@ -285,32 +1308,24 @@ def getContainerInstance(self, name: str, default=None) -> APPContainer:
         :param default: The default return value if not found.
         :rtype: APPContainer
         """
-        with self._container_queue_lock:
-            for c in self._container_queue:
-                if c.name == name:
-                    return c
-            else:
-                return default
+        return self._registry.get(name, default)
 
     def getContainersDhost(self, dhost: str) -> list:
         """Get containers deployed on the given DockerHost.
 
         :param dhost: Name of the DockerHost.
         :type dhost: str
-        :return: A list of APPContainer instances on given DockerHost.
+        :return: A list of names of APPContainer instances on given DockerHost.
         :rtype: list
         """
-        with self._container_queue_lock:
-            clist = [c.name for c in self._container_queue if c.dhost == dhost]
-            return clist
+        return [c.name for c in self._registry.getDhost(dhost)]
 
     def getAllContainers(self) -> list:
         """Get a list of names of all containers in current container queue.
 
         :rtype: list
         """
-        with self._container_queue_lock:
-            return [c.name for c in self._container_queue]
+        return [c.name for c in self._registry.snapshot()]
 
     def addContainer(
         self,
@@ -343,20 +1358,283 @@ def addContainer(
         :return: Added APPContainer instance or None if the creation process failed.
         :rtype: APPContainer
         """
-        container = None
         if not docker_args:
             docker_args = dict()
         dhost = self.net.get(dhost)
-        with self._container_queue_lock:
+        return self._deployContainer(name, dhost, dimage, dcmd, docker_args, wait)
+
+    def addContainerAsync(
+        self,
+        name: str,
+        dhost: str,
+        dimage: str,
+        dcmd: str,
+        docker_args: dict = None,
+        wait: bool = True,
+    ) -> Future:
+        """Create and run a new container inside a Mininet DockerHost in a
+        worker thread.
+
+        The call returns immediately. At most max_workers containers are
+        created and started concurrently, further calls are queued. The
+        container is added to the manager when it is started.
+
+        :param name: Name of the container.
+        :type name: str
+        :param dhost: Name of the host used for deployment.
+        :type name: str
+        :param dimage: Name of the docker image.
+        :type dimage: str
+        :param dcmd: Command to run after the creation.
+        :type dcmd: str
+        :param docker_args: All other keyword arguments supported by Docker-py.
+        :type docker_args: dict
+        :param wait: Wait until the container has the running state if True.
+        :type wait: bool
+
+        :return: A future of the added APPContainer instance. Its result()
+            raises the exception of a failed creation.
+        :rtype: concurrent.futures.Future
+        :raise ContainerExists: A container with the name is already added or
+            its creation is pending.
+        """
+        if not docker_args:
+            docker_args = dict()
+        dhost = self.net.get(dhost)
+        with self._executor_lock:
+            if name in self._deployments or name in self._registry:
+                raise ContainerExists(name)
+            now = time.monotonic()
+            for failed, (_, failed_at) in list(self._failed_deployments.items()):
+                if failed == name or now - failed_at > self.failed_deployment_ttl:
+                    del self._failed_deployments[failed]
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="appcontainer",
+                )
+            executor = self._executor
+            future = executor.submit(
+                self._deployContainer, name, dhost, dimage, dcmd, docker_args, wait
+            )
+            self._deployments[name] = future
+        future.add_done_callback(partial(self._deploymentDone, name))
+        return future
+
+    def _deploymentDone(self, name, future):
+        """Forget a successful creation, the container is in the registry.
+        Failed ones are kept for getContainerStatus()."""
+        with self._executor_lock:
+            if self._deployments.get(name, None) is not future:
+                return
+            del self._deployments[name]
+            if future.cancelled() or future.exception() is not None:
+                self._failed_deployments[name] = (future, time.monotonic())
+
+    def getContainerStatus(self, name: str) -> dict:
+        """Get the status of a container added by the manager.
+
+        :param name: Name of the container.
+        :type name: str
+
+        :return: A dict with the name and status of the container. The status
+            is "pending" or "failed" (with the error) for creations started by
+            addContainerAsync(), or the Docker status of added containers.
+            None if the container is unknown. A failed creation is reported
+            once.
+        :rtype: dict
+        """
+        container = self._registry.get(name, None)
+        if container is not None:
+            running = containerRunning(container.dins.id)
+            if running is None:
+                status = container.dins.attrs["State"]["Status"]
+            else:
+                status = "running" if running else "exited"
+            return {
+                "name": name,
+                "dhost": container.dhost,
+                "dimage": container.dimage,
+                "status": status,
+            }
+        with self._executor_lock:
+            future = self._deployments.get(name, None)
+            if future is None:
+                future, _ = self._failed_deployments.pop(name, (None, None))
+        if future is None:
+            return None
+        if not future.done():
+            return {"name": name, "status": "pending"}
+        if future.cancelled():
+            return {"name": name, "status": "failed", "error": "cancelled"}
+        return {"name": name, "status": "failed", "error": str(future.exception())}
+
+    def _deployContainer(self, name, dhost, dimage, dcmd, docker_args, wait):
+        """Create, start and register a container. An idle container of the
+        pool is used if possible. The registry lock is only held to add the
+        started container."""
+        user_args = dict(docker_args)
+        dins = self._takePooled(name, dhost, dimage, dcmd, docker_args)
+        if dins is None:
+            subscribed = getEventMonitor().alive
             dins = self._createContainer(name, dhost, dimage, dcmd, docker_args)
+            try:
+                dins.start()
+                if wait:
+                    self._waitContainerStart(dins, subscribed)
+            except Exception:
+                dins.remove(force=True)
+                raise
+        container = APPContainer(
+            name, dhost.name, dimage, dins, dcmd, docker_args=user_args
+        )
+        self._registry.add(container)
+        if self._monitor_all:
+            self.monitor.watch(name, dins)
+        return container
+
+    def updateResources(self, updates: dict, direct: bool = False) -> dict:
+        """Update the resource limits of many APP containers concurrently.
+
+        :param updates: A dict from container name to a dict of resources, see
+            APPContainer.updateResources().
+        :type updates: dict
+        :param direct: Write the limits to the cgroup files directly.
+        :type direct: bool
+
+        :return: A dict from container name to the exception of failed
+            updates.
+        :rtype: dict
+        :raise ValueError: A container is not found.
+        """
+        targets = list()
+        for name, resources in updates.items():
+            container = self._registry.get(name, None)
+            if container is None:
+                raise ValueError(f"Can not found container with name: {name}")
+            targets.append((container, resources))
+        return _updateAll(targets, direct, self.max_workers)
+
+    def warmPool(self, dhost: str, dimage: str, size: int = None, wait: bool = False):
+        """Keep idle containers of the given image paused in the given
+        DockerHost.
+
+        addContainer() and addContainerAsync() take an idle container if the
+        pool of the DockerHost and image is not empty and docker_args only
+        contains keys of pool_update_args. The container is renamed,
+        unpaused and the command is executed in it with docker exec, which
+        takes milliseconds instead of seconds. Unlike a newly created
+        container, the container keeps running after the command exits and
+        its output is not in the container logs. The pool is refilled in the
+        background.
+
+        :param dhost: Name of the DockerHost.
+        :type dhost: str
+        :param dimage: Name of the docker image.
+        :type dimage: str
+        :param size: Number of idle containers. The pool_size of the manager
+            is used if it is None. Surplus idle containers are removed.
+        :type size: int
+        :param wait: Wait until the pool is filled if True.
+        :type wait: bool
+        """
+        dhost = self.net.get(dhost)
+        if size is not None:
+            surplus = self._pool.setSize((dhost.name, dimage), size)
+            self._removePooled(surplus)
+        futures = self._refillPool(dhost, dimage)
+        if wait:
+            concurrent.futures.wait(futures)
+
+    def getPoolStatus(self) -> dict:
+        """Get the number of idle containers in the warm pool.
+
+        :return: A dict from (DockerHost name, image) to the number of idle
+            containers.
+        :rtype: dict
+        """
+        return {k: self._pool.idle(k) for k in self._pool.keys()}
+
+    def _refillPool(self, dhost, dimage) -> list:
+        """Create idle containers in the background until the pool of the
+        DockerHost and image is full.
+
+        :return: A list of futures of the creations.
+        :rtype: list
+        """
+        key = (dhost.name, dimage)
+        with self._executor_lock:
+            num = self._pool.reserve(key)
+            if num == 0:
+                return []
+            if self._pool_executor is None:
+                self._pool_executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="appcontainer-pool"
+                )
+            return [
+                self._pool_executor.submit(self._createPooled, dhost, dimage)
+                for _ in range(num)
+            ]
+
+    def _createPooled(self, dhost, dimage):
+        """Create an idle container and add it to the pool."""
+        key = (dhost.name, dimage)
+        name = self.pool_name_prefix + uuid.uuid4().hex[:12]
+        dins = None
+        try:
+            subscribed = getEventMonitor().alive
+            dins = self._createContainer(name, dhost, dimage, self.pool_cmd, dict())
             dins.start()
-            if wait:
-                self._waitContainerStart(name)
-            container = APPContainer(name, dhost.name, dimage, dins)
-            self._container_queue.append(container)
-            self._name_container_map[container.name] = container
-            self.net._appcontainers.append(name)
-            return container
+            self._waitContainerStart(dins, subscribed)
+            dins.pause()
+        except Exception as e:
+            self._pool.cancel(key)
+            error(
+                f"Failed to create an idle container of {dimage} on {dhost.name}: {e}\n"
+            )
+            if dins is not None:
+                self._removePooled([dins])
+            return
+        if not self._pool.put(key, dins):
+            self._removePooled([dins])
+
+    def _takePooled(self, name, dhost, dimage, dcmd, docker_args):
+        """Take an idle container from the pool and run the command in it.
+
+        :return: The container instance or None if no idle container can be
+            used.
+        """
+        key = (dhost.name, dimage)
+        if self._pool.getSize(key) <= 0 or not set(docker_args).issubset(
+            self.pool_update_args
+        ):
+            return None
+        dins = self._pool.take(key)
+        self._refillPool(dhost, dimage)
+        if dins is None:
+            return None
+        try:
+            dins.rename(name)
+            if docker_args:
+                dins.update(**docker_args)
+            dins.unpause()
+            if dcmd:
+                dins.exec_run(dcmd, detach=True)
+        except Exception as e:
+            warn(f"Failed to use the idle container {dins.id[:12]} for {name}: {e}\n")
+            self._removePooled([dins])
+            return None
+        dins.attrs["Name"] = f"/{name}"
+        debug(f"Use the idle container {dins.id[:12]} for {name}\n")
+        return dins
+
+    def _removePooled(self, dinss: list):
+        def _remove(dins):
+            dins.remove(force=True)
+
+        for dins, (_, e) in zip(dinss, concurrentMap(_remove, dinss)):
+            if e is not None:
+                warn(f"Failed to remove the idle container {dins.id[:12]}: {e}\n")
 
     def removeContainer(self, name: str, wait: bool = True):
         """Remove the APP container with the given name.
@@ -366,100 +1644,272 @@ def removeContainer(self, name: str, wait: bool = True):
         :param wait: Wait until the container is fully removed if True.
         :type wait: bool
         """
-        with self._container_queue_lock:
-            container = self._name_container_map.get(name, None)
-            # The container could be already removed by the user via CLI or
-            # other approaches, raise the exception to let user handle this
-            # situation.
-            if not container:
-                raise ValueError(f"Can not find container with name: {container}")
-
-            container.dins.remove(force=True)
-            if wait:
-                self._waitContainerRemoved(container.name)
-            self._container_queue.remove(container)
-            self.net._appcontainers.remove(name)
-            del self._name_container_map[name]
+        container = self._registry.get(name, None)
+        # The container could be already removed by the user via CLI or
+        # other approaches, raise the exception to let user handle this
+        # situation.
+        if not container:
+            raise ValueError(f"Can not find container with name: {container}")
+
+        self.monitor.unwatch(name)
+        subscribed = getEventMonitor().alive
+        container.dins.remove(force=True)
+        if wait:
+            self._waitContainerRemoved(container.dins, subscribed)
+        self._registry.remove(name, container)
 
     @staticmethod
     def _calculate_cpu_percent(stats):
         """Calculate the CPU usage in percent with given stats JSON data"""
-        cpu_count = len(stats["cpu_stats"]["cpu_usage"]["percpu_usage"])
-        cpu_percent = 0.0
-        cpu_delta = float(stats["cpu_stats"]["cpu_usage"]["total_usage"]) - float(
-            stats["precpu_stats"]["cpu_usage"]["total_usage"]
-        )
-        system_delta = float(stats["cpu_stats"]["system_cpu_usage"]) - float(
-            stats["precpu_stats"]["system_cpu_usage"]
-        )
-        if system_delta > 0.0:
-            cpu_percent = cpu_delta / system_delta * 100.0 * cpu_count
+        return calculateCpuPercent(stats)
 
-        if cpu_percent > 100:  # pragma: no cover
-            cpu_percent = 100
+    def startMonitor(self):
+        """Monitor the resource usages of all current and future containers.
 
-        return cpu_percent
+        Samples are kept in the ring buffers of self.monitor. Use
+        getResourceSamples() or subscribeResourceStats() to read them.
+        """
+        self._monitor_all = True
+        for c in self._registry.snapshot():
+            self.monitor.watch(c.name, c.dins)
+
+    def stopMonitor(self):
+        """Stop monitoring all containers."""
+        self._monitor_all = False
+        self.monitor.stop()
+
+    def getResourceSamples(self, name: str, num: int = None) -> list:
+        """Get the latest resource samples of a monitored container.
+
+        :param name: Name of the container.
+        :type name: str
+        :param num: Maximal number of samples. All buffered samples if None.
+        :type num: int
+
+        :return: A list of ResourceSample(cpu, mem, timestamp) from old to new.
+        :rtype: list
+        """
+        return self.monitor.samples(name, num)
+
+    def subscribeResourceStats(self, callback):
+        """Call callback(name, sample) for every new resource sample of all
+        monitored containers."""
+        self.monitor.subscribe(callback)
 
     def monResourceStats(
         self, name: str, sample_num: int = 3, sample_period: float = 1.0
     ) -> list:
         """Monitor the resource stats of a container within the given name.
-        This function measure the CPU and memory usages sample_num times and
-        sleep for sample_period between each time. All measurement results are
-        returned as a list.
+        This function waits for the next sample_num samples of the streaming
+        monitor. The container is monitored for the duration of this call if
+        it is not monitored yet. All measurement results are returned as a
+        list.
 
         :param container: Name of the container
         :type container: str
         :param sample_num: Number of samples.
         :type sample_num: int
-        :param sample_period: Sleep period for each sample
+        :param sample_period: Period between two samples. It is rounded to a
+            multiple of the monitor's sample interval.
         :type sample_period: float
 
         :return: A list of resource usages. Each item is a tuple (cpu_usg, mem_usg)
+            with the CPU usage in percent of one CPU and the memory usage in MB.
         :rtype: list
         :raise ValueError: container is not found
         """
 
-        container = self._name_container_map.get(name, None)
+        container = self._registry.get(name, None)
         if not container:
             raise ValueError(f"Can not found container with name: {container}")
 
-        n = 0
-        usages = list()
-        while n < sample_num:
-            stats = container.getCurrentStats()
-            mem_stats = stats["memory_stats"]
-            mem_usg = mem_stats["usage"] / (1024**2)
-            cpu_usg = self._calculate_cpu_percent(stats)
-            usages.append((cpu_usg, mem_usg))
-            sleep(sample_period)
-            n += 1
-
-        return usages
-
-    # BUG: Checkpoint inside container breaks the networking of outside
-    # container if container networking mode is used.
-    # def checkpoint(self, container: str) -> str:
-    #     container = self._name_container_map.get(container, None)
-    #     if not container:
-    #         raise ValueError(f"Can not found container with name: {container}")
-    #     ckpath = os.path.join(APPCONTAINERMANGER_MOUNTED_DIR, f"{container.name}")
-    #     # MARK: Docker-py does not provide API for checkpoint and restore,
-    #     # Docker CLI is directly used with subprocess as a temp workaround.
-    #     subprocess.run(split(
-    #         f"docker checkpoint create --checkpoint-dir={ckpath} {container.name} {container.name}"
-    #     ),
-    #                    check=True,
-    #                    stdout=subprocess.DEVNULL,
-    #                    stderr=subprocess.DEVNULL)
-
-    #     return ckpath
-
-    def _runHTTPServer(self, ip_addr, port, enable_log):
-        """Generate HTTPServer with partial parameters and run it forever."""
-        handler = partial(APPContainerManagerRequestHandler, self, enable_log)
-        httpd = http.server.HTTPServer((ip_addr, port), handler)
-        info(f"Start REST API server on address: {ip_addr}:{port}.\n")
+        watched = self.monitor.watching(name)
+        if not watched:
+            self.monitor.watch(name, container.dins)
+        every = max(1, round(sample_period / self.monitor.interval))
+        # The first sample of a new stream needs one more interval.
+        timeout = (sample_num * every + 1) * self.monitor.interval + MONITOR_SLACK_SECS
+        try:
+            samples = self.monitor.waitSamples(name, sample_num, every, timeout)
+        finally:
+            if not watched:
+                self.monitor.unwatch(name)
+        if len(samples) < sample_num:
+            warn(f"Only {len(samples)} resource samples of {name} are received.\n")
+        return [(s.cpu, s.mem) for s in samples]
+
+    def _runDockerCLI(self, args: list):
+        """Run a Docker CLI command. Docker-py does not provide API for
+        checkpoint and restore.
+
+        :raise RuntimeError: The command failed.
+        """
+        ret = subprocess.run(
+            ["docker"] + args,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            check=False,
+        )
+        if ret.returncode != 0:
+            raise RuntimeError(
+                "docker {} failed: {}".format(" ".join(args), ret.stderr.strip())
+            )
+
+    def checkpoint(
+        self, name: str, checkpoint: str = None, leave_running: bool = False
+    ) -> str:
+        """Checkpoint a container with CRIU.
+
+        This requires CRIU and a Docker daemon with experimental features.
+
+        :param name: Name of the container.
+        :type name: str
+        :param checkpoint: Name of the checkpoint. The name of the container
+            is used if it is None.
+        :type checkpoint: str
+        :param leave_running: Keep the container running after the checkpoint.
+        :type leave_running: bool
+
+        :return: The checkpoint directory in APPCONTAINERMANGER_MOUNTED_DIR.
+        :rtype: str
+        :raise ValueError: container is not found
+        """
+        container = self._registry.get(name, None)
+        if not container:
+            raise ValueError(f"Can not found container with name: {name}")
+        ckpath = os.path.join(APPCONTAINERMANGER_MOUNTED_DIR, "checkpoints", name)
+        os.makedirs(ckpath, exist_ok=True)
+        args = ["checkpoint", "create", f"--checkpoint-dir={ckpath}"]
+        if leave_running:
+            args.append("--leave-running")
+        self._runDockerCLI(args + [container.dins.id, checkpoint or name])
+        return ckpath
+
+    def migrateContainer(
+        self, name: str, dst_dhost: str, trial_checkpoints: int = 0
+    ) -> dict:
+        """Migrate a container to another DockerHost with CRIU checkpoint and
+        restore.
+
+        The container on the destination is created while the source is
+        still running. The downtime is the time of the final checkpoint and
+        the restore on the destination. The checkpoint is shared through
+        APPCONTAINERMANGER_MOUNTED_DIR. The restored container joins the
+        network namespace of the destination DockerHost.
+
+        :param name: Name of the container.
+        :type name: str
+        :param dst_dhost: Name of the destination DockerHost.
+        :type dst_dhost: str
+        :param trial_checkpoints: Number of full checkpoints made with
+            --leave-running before the final one. Docker does not expose the
+            incremental pre-dump of CRIU, so they do not reduce the downtime
+            and each one freezes the container for a full dump. They only
+            find a container which can not be checkpointed (e.g. due to
+            established TCP connections) while it is still running.
+        :type trial_checkpoints: int
+
+        :return: A dict with the DockerHosts, the downtime and the time of
+            each phase in seconds, and the size of the checkpoint in bytes.
+        :rtype: dict
+        :raise ValueError: container is not found or already on dst_dhost
+        """
+        container = self._registry.get(name, None)
+        if not container:
+            raise ValueError(f"Can not found container with name: {name}")
+        dst = self.net.get(dst_dhost)
+        if dst.name == container.dhost:
+            raise ValueError(f"Container {name} is already on {dst.name}")
+
+        timer = PhaseTimer()
+        ckpath = os.path.join(APPCONTAINERMANGER_MOUNTED_DIR, "checkpoints", name)
+        shutil.rmtree(ckpath, ignore_errors=True)
+        tmp_name = "{}-migrate-{}".format(name, uuid.uuid4().hex[:8])
+        with timer.phase("create"):
+            new_dins = self._createContainer(
+                tmp_name,
+                dst,
+                container.dimage,
+                container.dcmd,
+                dict(container.docker_args),
+            )
+        downtime_start = None
+        try:
+            for i in range(trial_checkpoints):
+                with timer.phase("trial_checkpoint"):
+                    self.checkpoint(name, f"trial{i}", leave_running=True)
+            downtime_start = time.time()
+            with timer.phase("checkpoint"):
+                self.checkpoint(name, "final")
+            with timer.phase("restore"):
+                self._runDockerCLI(
+                    [
+                        "start",
+                        "--checkpoint=final",
+                        f"--checkpoint-dir={ckpath}",
+                        new_dins.id,
+                    ]
+                )
+            downtime = time.time() - downtime_start
+        except Exception:
+            new_dins.remove(force=True)
+            if downtime_start is not None:
+                # The source could be stopped by the final checkpoint.
+                container.dins.reload()
+                if not container.dins.attrs["State"]["Running"]:
+                    warn(f"Restart container {name} on {container.dhost}.\n")
+                    container.dins.start()
+            raise
+        finally:
+            size = sum(
+                os.path.getsize(os.path.join(root, f))
+                for root, _, files in os.walk(os.path.join(ckpath, "final"))
+                for f in files
+            )
+            shutil.rmtree(ckpath, ignore_errors=True)
+
+        watched = self.monitor.watching(name)
+        self.monitor.unwatch(name)
+        container.dins.remove(force=True)
+        new_dins.rename(name)
+        new_dins.reload()
+        migrated = APPContainer(
+            name,
+            dst.name,
+            container.dimage,
+            new_dins,
+            container.dcmd,
+            container.docker_args,
+        )
+        self._registry.add(migrated)
+        if watched:
+            self.monitor.watch(name, new_dins)
+
+        report = {
+            "name": name,
+            "src": container.dhost,
+            "dst": dst.name,
+            "downtime": downtime,
+            "phases": timer.durations,
+            "size": size,
+        }
+        info(
+            "Migrate container {} from {} to {}: downtime {:.3f}s, checkpoint "
+            "{:.1f} MB ({})\n".format(
+                name,
+                container.dhost,
+                dst.name,
+                downtime,
+                size / (1024**2),
+                timer.report(),
+            )
+        )
+        return report
+
+    def _runHTTPServer(self, httpd):
+        """Run the HTTP server until stop() is called."""
+        info("Start REST API server on address: {}:{}.\n".format(*httpd.server_address))
         httpd.serve_forever()
 
     def runRESTServerThread(
@@ -470,7 +1920,8 @@ def runRESTServerThread(
         scripts. Since to be performed operation is more IO-bounded and this
         server should have no impact on the concurrency approach of main thread,
         the threading with a Lock is used instead of multi-processing or
-        asyncio.
+        asyncio. Each request is handled in its own thread, container
+        creations run in the worker pool of addContainerAsync().
 
         :param ip: Listening IP address.
         :type ip: str
@@ -479,9 +1930,11 @@ def runRESTServerThread(
         :param enable_log: Print logs using stdout if True.
         :type enable_log: bool
         """
+        handler = partial(APPContainerManagerRequestHandler, self, enable_log)
+        self._httpd = APPContainerManagerHTTPServer((ip, port), handler)
         self._http_server_started = True
         self._http_server_thread = threading.Thread(
-            target=self._runHTTPServer, args=(ip, port, enable_log)
+            target=self._runHTTPServer, args=(self._httpd,)
         )
         # It will die if all non-daemon threads (including main) exist.
         self._http_server_thread.daemon = True
@@ -489,20 +1942,44 @@ def runRESTServerThread(
 
     def stop(self):
         """Stop the APPContainerManager."""
-        if len(self._container_queue) > 0:
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+            self._http_server_started = False
+        with self._executor_lock:
+            self._pool.closed = True
+        if self._executor is not None:
+            # Wait for pending creations, their containers are removed below.
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._pool_executor is not None:
+            self._pool_executor.shutdown(wait=True)
+            self._pool_executor = None
+        self._removePooled(self._pool.drain())
+        self.stopMonitor()
+        containers = self._registry.snapshot()
+        if len(containers) > 0:
             info(
                 "Stop {} containers in the App container queue: {}\n".format(
-                    len(self._container_queue),
-                    ", ".join((c.name for c in self._container_queue)),
+                    len(containers),
+                    ", ".join((c.name for c in containers)),
                 )
             )
 
-            # Avoid missing delete internal containers manually before stop
-            for c in self._container_queue:
+            def _remove(c):
                 c._terminate()
                 c.dins.remove(force=True)
 
-        self.dclt.close()
+            # Avoid missing delete internal containers manually before stop
+            for c, (_, e) in zip(containers, concurrentMap(_remove, containers)):
+                if e is not None:
+                    warn(f"Failed to remove the APP container {c.name}: {e}\n")
+                else:
+                    self._registry.remove(c.name, c)
+        if self in getattr(self.net, "_appcontainer_managers", ()):
+            self.net._appcontainer_managers.remove(self)
+
         shutil.rmtree(APPCONTAINERMANGER_MOUNTED_DIR)
 
 
@@ -6,14 +6,112 @@
 import pty
 import select
 import shlex
+import subprocess
+import threading
 import time
+import weakref
 
 import docker
 
+from comnetsemu.cgroup import CGROUP_LIMITS, writeCgroupLimits
+from comnetsemu.dockerapi import (
+    containerRunning,
+    getClient,
+    getEventMonitor,
+    waitContainerRunning,
+)
 from comnetsemu.exceptions import InvalidDockerArgs
+from comnetsemu.trace import span
 from mininet.log import debug, error, info, warn
 from mininet.node import Host
 
+# Resource limits which can be updated while the container is running.
+UPDATABLE_RESOURCES = (
+    "blkio_weight",
+    "cpu_period",
+    "cpu_quota",
+    "cpu_shares",
+    "cpuset_cpus",
+    "cpuset_mems",
+    "mem_limit",
+    "mem_reservation",
+    "memswap_limit",
+)
+
+# Upper bound of the interval in seconds to check for idle shells.
+SHELL_REAP_INTERVAL_SECS = 1.0
+# Time in seconds to wait for a closed shell to exit before it is killed.
+SHELL_EXIT_TIMEOUT_SECS = 1.0
+
+
+def _updateResources(dins, resources: dict, direct: bool):
+    """Update the resource limits of a running container."""
+    supported = CGROUP_LIMITS if direct else UPDATABLE_RESOURCES
+    unknown = set(resources) - set(supported)
+    if unknown:
+        error(
+            f"Resources {sorted(unknown)} can not be updated. Supported: {supported}\n"
+        )
+        raise InvalidDockerArgs
+    if not direct or not getattr(dins, "own_cgroup", True):
+        # Containers of e.g. the netns runtime share the cgroup of ComNetsEmu.
+        dins.update(**resources)
+        return
+    limits = dict(resources)
+    if isinstance(limits.get("mem_limit", None), str):
+        limits["mem_limit"] = docker.utils.parse_bytes(limits["mem_limit"])
+    if not dins.attrs["State"]["Pid"]:
+        dins.reload()
+    writeCgroupLimits(dins.attrs["State"]["Pid"], limits)
+
+
+class ShellReaper:
+    """Close the interactive shells of DockerHosts which are idle for longer
+    than their shell_idle_timeout. The shells are checked in a daemon thread
+    which exits when no DockerHost is registered.
+    """
+
+    def __init__(self):
+        self._hosts = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, host):
+        with self._lock:
+            self._hosts.add(host)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="ShellReaper", daemon=True
+                )
+                self._thread.start()
+
+    def discard(self, host):
+        with self._lock:
+            self._hosts.discard(host)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                hosts = list(self._hosts)
+                if not hosts:
+                    self._thread = None
+                    return
+            time.sleep(
+                min(
+                    [SHELL_REAP_INTERVAL_SECS]
+                    + [h.shell_idle_timeout / 2 for h in hosts]
+                )
+            )
+            now = time.monotonic()
+            for h in hosts:
+                try:
+                    h._closeShellIfIdle(now)
+                except Exception as e:
+                    warn(f"Failed to close the idle shell of {h.name}: {e}\n")
+
+
+_shell_reaper = ShellReaper()
+
 
 class DockerHost(Host):
     """Node that represents a docker container.
@@ -36,6 +134,14 @@ class DockerHost(Host):
         "privileged": True,
     }
 
+    # Supported approaches to run commands inside the container.
+    exec_modes = ("docker", "nsenter")
+
+    # Maximal bytes of a command batch written to the shell at once. The tty
+    # buffers about 4 KiB of input, a larger write blocks while the shell is
+    # blocked on writing its output.
+    batch_write_size = 2048
+
     def __init__(
         self,
         name: str,
@@ -43,7 +149,11 @@ def __init__(
         docker_args: dict = None,
         dcmd: str = None,
         ishell: str = "bash",
-        ishell_args: str = "--norc -is",
+        ishell_args: str = None,
+        dins=None,
+        exec_mode: str = None,
+        lazy_shell: bool = False,
+        shell_idle_timeout: float = None,
         **kwargs,
     ):
         """
@@ -55,7 +165,32 @@ def __init__(
             e.g. CPU and memory related limitations. Some parameters are overriden for DockerHost's functionalities.
         :param dcmd: Command to execute when create the DockerHost.
         :param ishell: The command to run interactive shell on the host.
-        :param ishell_args: Arguments for running the ishell.
+        :param ishell_args: Arguments for running the ishell. The default of
+            the container runtime is used if it is None, "--norc -is" for
+            Docker.
+        :param dins: An already running container created with the docker_args
+            returned by buildDockerArgs(). It is used by Containernet to start
+            the containers of all DockerHosts concurrently before the hosts are
+            added to the network. A new container is created if it is None.
+        :param exec_mode: Approach to run the interactive shell and the
+            processes created by popen() inside the container.
+            "docker" uses docker exec, which forks the docker CLI and goes
+            through the Docker daemon for each command. "nsenter" enters the
+            namespaces of the container's init process directly, like Mininet
+            does for its hosts. Processes started with "nsenter" are not moved
+            into the cgroup of the container, so they are not limited by the
+            resource limits given in docker_args. The first exec mode
+            supported by the container runtime is used if it is None, e.g.
+            "nsenter" for the netns runtime.
+        :param lazy_shell: Start the interactive shell on the first use of
+            cmd() or sendCmd() instead of when the host is created. While
+            Containernet builds the network, commands of a host without shell
+            (e.g. to configure its interfaces) run in one-shot processes which
+            enter the namespaces of the container with nsenter. So shells are
+            only started for hosts that are actually used.
+        :param shell_idle_timeout: Close the interactive shell if no command
+            is sent for this time in seconds. Shells with running background
+            jobs are kept. The shell is started again by the next command.
 
         :var dins: Docker container instance created by the Docker-py run API.
             Check https://docker-py.readthedocs.io/en/stable/containers.html#container-objects
@@ -65,29 +200,44 @@ def __init__(
         self.dcmd = dcmd if dcmd is not None else "/usr/bin/env sh"
         self.dimage = dimage
         self.ishell = ishell
-        self.ishell_args = ishell_args
-        self.docker_args = docker_args if docker_args is not None else dict()
+        self.docker_args = self.buildDockerArgs(name, dimage, docker_args, dcmd)
 
-        self.dclient = docker.from_env()
+        # The shared client is borrowed, it is closed by Containernet.stop()
+        self.dclient = getClient()
         self.dcli = self.dclient.api
+        if ishell_args is None:
+            ishell_args = getattr(self.dclient, "ishell_args", "--norc -is")
+        self.ishell_args = ishell_args
+        exec_modes = getattr(self.dclient, "exec_modes", self.exec_modes)
+        if exec_mode is None:
+            exec_mode = exec_modes[0]
+        if exec_mode not in exec_modes:
+            raise ValueError(
+                f"Invalid exec_mode: {exec_mode}. Supported modes: {exec_modes}"
+            )
+        self.exec_mode = exec_mode
         # Container object instance created via self.dclient API
         self.dins = None
         self.master = None
         self.slave = None
         self.resources = dict()
-
-        # Override the essential parameters
-        for key in self.docker_args_default:
-            if key in docker_args:
-                error(
-                    f"Given argument: {key} is invalid. This key is reserved for internal usages."
-                )
-                raise InvalidDockerArgs
-
-        self.docker_args.update(self.docker_args_default)
-        self.docker_args["name"] = self.name
-        self.docker_args["command"] = self.dcmd
-        self.docker_args["image"] = self.dimage
+        # Result of the latest container state query via the Docker API.
+        self._running = False
+        # State of the command batch sent by sendCmds()
+        self._batch_num = 0
+        self._batch_cmds = list()
+        self._batch_sent = 0
+        self._batch_outputs = list()
+        self._batch_buf = ""
+        self.lazy_shell = lazy_shell
+        self.shell_idle_timeout = shell_idle_timeout
+        # Run commands without shell in one-shot processes, set by Containernet
+        # while the network is built.
+        self.oneshot_cmds = False
+        self._defer_shell = lazy_shell
+        # Held while a command is sent, so an idle shell is not closed meanwhile.
+        self._shell_lock = threading.RLock()
+        self._shell_used = time.monotonic()
 
         # FIXME(Zuo): Remove this in v1.0
         # Legacy arguments given in kwargs
@@ -110,17 +260,71 @@ def __init__(
             if arg in kwargs.keys():
                 error(f"Argument {arg} should be given in docker_args dictionary!\n")
 
-        debug("Created docker container object %s\n" % name)
-        debug("image: %s\n" % str(self.dimage))
-        debug("Before creating the container\n")
-        # Create and run the new docker container
-        self.dins = self.dclient.containers.run(**self.docker_args)
-        while not self.dins.attrs["State"]["Running"]:
-            time.sleep(0.01)
-            self.dins.reload()  # refresh information in 'attrs'
+        if dins is None:
+            debug("Created docker container object %s\n" % name)
+            debug("image: %s\n" % str(self.dimage))
+            debug("Before creating the container\n")
+            self.dins = self.runContainer(self.dclient, self.docker_args)
+        else:
+            debug("Use the already running docker container of %s\n" % name)
+            self.dins = dins
 
         debug("Docker container %s started. ID:%s\n" % (name, self.dins.id))
         super(DockerHost, self).__init__(name, **kwargs)
+        if shell_idle_timeout:
+            _shell_reaper.add(self)
+
+    @classmethod
+    def buildDockerArgs(
+        cls, name: str, dimage: str, docker_args: dict = None, dcmd: str = None
+    ) -> dict:
+        """Build the arguments used to run the container of a DockerHost.
+
+        The given docker_args is not modified.
+
+        :param name: Name of the DockerHost.
+        :type name: str
+        :param dimage: Name of the docker image.
+        :type dimage: str
+        :param docker_args: Docker-py arguments given by the user.
+        :type docker_args: dict
+        :param dcmd: Command to execute when create the DockerHost.
+        :type dcmd: str
+
+        :return: Arguments for the Docker-py run API.
+        :rtype: dict
+        :raise InvalidDockerArgs: A reserved key is given in docker_args.
+        """
+        docker_args = dict(docker_args) if docker_args is not None else dict()
+        # Override the essential parameters
+        for key in cls.docker_args_default:
+            if key in docker_args:
+                error(
+                    f"Given argument: {key} is invalid. This key is reserved for internal usages."
+                )
+                raise InvalidDockerArgs
+
+        docker_args.update(cls.docker_args_default)
+        docker_args["name"] = name
+        docker_args["command"] = dcmd if dcmd is not None else "/usr/bin/env sh"
+        docker_args["image"] = dimage
+        return docker_args
+
+    @staticmethod
+    def runContainer(dclient, docker_args: dict):
+        """Create and run a new docker container and wait until it is running.
+
+        :param dclient: The Docker-py client.
+        :param docker_args: Arguments built by buildDockerArgs().
+        :type docker_args: dict
+
+        :return: The running container instance.
+        """
+        with span("containers.run", node=docker_args["name"]):
+            subscribed = getEventMonitor().alive
+            dins = dclient.containers.run(**docker_args)
+            waitContainerRunning(dins, subscribed)
+        return dins
 
     # Command support via shell process in namespace
     def startShell(self):
@@ -128,15 +332,16 @@ def startShell(self):
         if self.shell:
             error("%s: shell is already running\n" % self.name)
             return
+        if self._defer_shell:
+            # Called by Node.__init__, the first command starts the shell.
+            self._defer_shell = False
+            self.pid = self.dins.attrs["State"]["Pid"]
+            return
 
         # bash -i: force interactive
         # -s: pass $* to shell, and make process easy to find in ps
         # prompt is set to sentinel chr( 127 )
-        cmd = [
-            "docker",
-            "exec",
-            "-it",
-            self.name,
+        cmd = self._execPrefix(interactive=True) + [
             "env",
             "PS1=" + chr(127),
             "mininet:" + self.name,
@@ -152,9 +357,14 @@ def startShell(self):
         # received by the parent
         self.master, self.slave = pty.openpty()
         debug("Docker host master:{}, slave:{}\n".format(self.master, self.slave))
-        self.shell = self._popen(
-            cmd, stdin=self.slave, stdout=self.slave, stderr=self.slave, close_fds=False
-        )
+        with span("dhost.spawnShell", node=self.name):
+            self.shell = self._popen(
+                cmd,
+                stdin=self.slave,
+                stdout=self.slave,
+                stderr=self.slave,
+                close_fds=False,
+            )
         self.stdin = os.fdopen(self.master, "r")
         self.stdout = self.stdin
         self.pid = self.dins.attrs["State"]["Pid"]
@@ -170,11 +380,12 @@ def startShell(self):
         self.lastPid = None
         self.readbuf = ""
         # Wait for prompt
-        while True:
-            data = self.read(1024)
-            if data[-1] == chr(127):
-                break
-            self.pollOut.poll()
+        with span("dhost.waitPrompt", node=self.name):
+            while True:
+                data = self.read(1024)
+                if data[-1] == chr(127):
+                    break
+                self.pollOut.poll()
         self.waiting = False
         # +m: disable job control notification
         self.cmd("unset HISTFILE; stty -echo; set +m")
@@ -187,21 +398,81 @@ def cleanup(self):
             if self.slave:
                 os.close(self.slave)
             if self.waitExited:
+                if self._is_container_running() and self.shell.poll() is None:
+                    # The shell only exits by itself if the container is removed.
+                    self.shell.kill()
                 debug("waiting for", self.pid, "to terminate\n")
                 self.shell.wait()
         self.shell = None
-        self.dclient.close()
 
-    def terminate(self):
-        """Stop docker container"""
-        if not self._is_container_running():
-            return
+    def closeShell(self):
+        """Close the interactive shell. It is started again by the next
+        command. Background jobs of the shell are stopped with it."""
+        with self._shell_lock:
+            if not self.shell:
+                return
+            del self.outToNode[self.stdout.fileno()]
+            del self.inToNode[self.stdin.fileno()]
+            if self.shell.poll() is None and not self.waiting:
+                # Let the shell exit by itself, killing the docker CLI does
+                # not stop the shell inside the container.
+                try:
+                    self.write("exit\n")
+                    self.shell.wait(SHELL_EXIT_TIMEOUT_SECS)
+                except (OSError, subprocess.TimeoutExpired):
+                    pass
+            self.cleanup()
+            self.waiting = False
+            self.readbuf = ""
+
+    def _closeShellIfIdle(self, now: float) -> bool:
+        """Close the shell if it is idle for longer than shell_idle_timeout.
+
+        :param now: Current time of time.monotonic().
+        :type now: float
+
+        :return: True if the shell is closed.
+        :rtype: bool
+        """
+        if not self._shell_lock.acquire(blocking=False):
+            return False
+        try:
+            if not self.shell or self.waiting:
+                self._shell_used = now
+                return False
+            if now - self._shell_used < self.shell_idle_timeout:
+                return False
+            if self.cmd("jobs -p").strip():
+                self._shell_used = now
+                return False
+            debug(f"*** Close the idle shell of docker host '{self.name}'\n")
+            self.closeShell()
+            return True
+        finally:
+            self._shell_lock.release()
+
+    def removeContainer(self):
+        """Remove the container of this DockerHost.
+
+        The interactive shell is not cleaned up, use terminate() for a full
+        stop. It can be called concurrently for many DockerHosts.
+        """
         try:
             debug("Try to remove container. ID:{}\n".format(self.dins.id))
-            self.dins.remove(force=True)
+            with span("containers.remove", node=self.name):
+                self.dins.remove(force=True)
+        except docker.errors.NotFound:
+            debug("Container {} is already removed.\n".format(self.dins.id))
         except docker.errors.APIError as e:
             print(e)
             warn("Warning: API error during container removal.\n")
+        self._running = False
+
+    def terminate(self):
+        """Stop docker container"""
+        _shell_reaper.discard(self)
+        if self._is_container_running():
+            self.removeContainer()
 
         debug(
             "Terminate. Docker host master:{}, slave:{}\n".format(
@@ -213,10 +484,12 @@ def terminate(self):
     def sendCmd(self, *args, **kwargs):
         """Send a command, followed by a command to echo a sentinel,
         and return without waiting for the command to complete."""
-        self._check_shell()
-        if not self.shell:
-            return
-        Host.sendCmd(self, *args, **kwargs)
+        with self._shell_lock:
+            self._check_shell()
+            if not self.shell:
+                return
+            Host.sendCmd(self, *args, **kwargs)
+            self._shell_used = time.monotonic()
 
     def popen(self, *args, **kwargs):
         """Return a Popen() object in node's namespace
@@ -228,19 +501,192 @@ def popen(self, *args, **kwargs):
                 % (self.dins.id, self.name)
             )
             return None
-        # MARK: Use -t option to allocate pseudo-TTY for each DockerHost
-        mncmd = ["docker", "exec", "-t", f"{self.name}"]
+        mncmd = self._execPrefix()
         return Host.popen(self, *args, mncmd=mncmd, **kwargs)
 
+    def _execPrefix(self, interactive: bool = False, exec_mode: str = None) -> list:
+        """Get the command prefix to run a program inside the container.
+
+        :param interactive: Keep STDIN open for an interactive program.
+        :type interactive: bool
+        :param exec_mode: Exec mode to use instead of the one of the host.
+        :type exec_mode: str
+        :rtype: list
+        """
+        if (exec_mode or self.exec_mode) == "nsenter":
+            return [
+                "nsenter",
+                "--target",
+                str(self.dins.attrs["State"]["Pid"]),
+                "--mount",
+                "--uts",
+                "--ipc",
+                "--net",
+                "--pid",
+            ]
+        # MARK: Use -t option to allocate pseudo-TTY for each DockerHost
+        return ["docker", "exec", "-it" if interactive else "-t", self.name]
+
     def cmd(self, *args, **kwargs):
         """Send a command, wait for output, and return it.
         cmd: string"""
         verbose = kwargs.get("verbose", False)
         log = info if verbose else debug
         log("*** %s : %s\n" % (self.name, args))
+        if self.oneshot_cmds and not self.shell:
+            output = self._cmdOneshot(*args)
+            if output is not None:
+                log(output)
+                return output
         self.sendCmd(*args, **kwargs)
         return self.waitOutput(verbose)
 
+    def _cmdOneshot(self, *args) -> str:
+        """Run a command in a new process inside the container without the
+        interactive shell.
+
+        nsenter is used in all exec modes, since a docker exec per command is
+        slower than attaching a shell.
+
+        :return: The output of the command or None if it is a background
+            command, which needs the shell.
+        :rtype: str
+        """
+        cmd = args[0] if len(args) == 1 else args
+        if not isinstance(cmd, str):
+            cmd = " ".join(str(c) for c in cmd)
+        if cmd.rstrip().endswith("&"):
+            return None
+        with span("dhost.cmdOneshot", node=self.name):
+            ret = subprocess.run(
+                self._execPrefix(exec_mode="nsenter") + [self.ishell, "-c", cmd],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+                check=False,
+            )
+        return ret.stdout
+
+    def sendCmds(self, cmds: list):
+        """Send a batch of commands and return without waiting for them to
+        complete.
+
+        Each command must be a single line. The interactive shell prints the
+        sentinel prompt chr(127) after each command, which is used to split
+        the output per command. A command must not read STDIN, otherwise it
+        consumes the following commands of the batch.
+
+        The commands are written in chunks of at most batch_write_size bytes.
+        The first chunk is written here, monitorCmds() writes the next chunk
+        after all commands of the previous one are completed. So the shell
+        waits for input during each write and a large batch can not deadlock
+        with a shell blocked on its output.
+
+        :param cmds: A list of commands in string format.
+        :type cmds: list
+        """
+        for c in cmds:
+            if "\n" in c:
+                raise ValueError(f"Command in a batch must be a single line: {c}")
+        with self._shell_lock:
+            self._check_shell()
+            if not self.shell:
+                return
+            assert not self.waiting
+            # Replace empty commands with something harmless
+            cmds = [c if c.strip() else "echo -n" for c in cmds]
+            self._batch_num = len(cmds)
+            self._batch_cmds = cmds
+            self._batch_sent = 0
+            self._batch_outputs = list()
+            self._batch_buf = ""
+            self.lastCmd = cmds[-1] if cmds else None
+            if not cmds:
+                return
+            self._writeBatchChunk()
+            self.lastPid = None
+            self.waiting = True
+
+    def _writeBatchChunk(self):
+        """Write the next commands of the batch, at most batch_write_size
+        bytes unless a single command is longer."""
+        start = end = self._batch_sent
+        size = 0
+        while end < len(self._batch_cmds):
+            size += len(self._batch_cmds[end].encode("utf-8")) + 1
+            if end > start and size > self.batch_write_size:
+                break
+            end += 1
+        self.write("\n".join(self._batch_cmds[start:end]) + "\n")
+        self._batch_sent = end
+        self._shell_used = time.monotonic()
+
+    def monitorCmds(self, timeoutms: int = None) -> bool:
+        """Read the available output of the batch sent by sendCmds().
+
+        :param timeoutms: Timeout in ms or None to wait indefinitely.
+        :type timeoutms: int
+
+        :return: True if the outputs of all commands in the batch are read.
+        :rtype: bool
+        """
+        if not self.waiting:
+            return True
+        if len(self.readbuf) == 0 and not self.pollOut.poll(timeoutms):
+            return False
+        data = self.read(1024)
+        parts = data.split(chr(127))
+        self._batch_buf += parts[0]
+        for part in parts[1:]:
+            self._batch_outputs.append(self._batch_buf)
+            self._batch_buf = part
+        if len(self._batch_outputs) >= self._batch_num:
+            self._batch_buf = ""
+            self.waiting = False
+            return True
+        if len(self._batch_outputs) >= self._batch_sent:
+            self._writeBatchChunk()
+        return False
+
+    def waitCmdsOutput(self, verbose: bool = False) -> list:
+        """Wait for all commands sent by sendCmds() to complete.
+
+        :param verbose: Print output interactively.
+        :type verbose: bool
+
+        :return: A list of outputs, one for each command in the batch.
+        :rtype: list
+        """
+        log = info if verbose else debug
+        while not self.monitorCmds():
+            pass
+        for output in self._batch_outputs:
+            log(output)
+        return self._batch_outputs
+
+    def cmds(self, cmds: list, verbose: bool = False) -> list:
+        """Send a batch of commands, wait for all of them and return the output
+        of each command.
+
+        The shell round trip is paid once per chunk of the batch (see
+        sendCmds()) instead of once per command like cmd().
+
+        :param cmds: A list of single line commands in string format.
+        :type cmds: list
+        :param verbose: Print output interactively.
+        :type verbose: bool
+
+        :return: A list of outputs, one for each command.
+        :rtype: list
+        """
+        log = info if verbose else debug
+        log("*** %s : %s\n" % (self.name, cmds))
+        self.sendCmds(cmds)
+        if not self.waiting:
+            return list()
+        return self.waitCmdsOutput(verbose)
+
     def _check_shell(self):
         """Verify if shell is alive and
         try to restart if needed"""
@@ -264,13 +710,42 @@ def _check_shell(self):
                 self.shell = None
 
     def _is_container_running(self):
-        """Verify if container is alive"""
+        """Verify if container is alive
+
+        The state is cached to avoid a Docker API call for each command. It is
+        updated by the start and die events of the container. If the event
+        stream is not available, the container is considered alive as long as
+        the interactive shell (a docker exec process) is alive. The Docker API
+        is only queried if both sources can not tell.
+        """
+        running = containerRunning(self.dins.id)
+        if running is not None:
+            return running
+        if self._running and self.shell and self.shell.poll() is None:
+            return True
         container_list = self.dcli.containers(
             filters={"id": self.dins.id, "status": "running"}
         )
-        if len(container_list) == 0:
-            return False
-        return True
+        self._running = len(container_list) != 0
+        return self._running
+
+    def updateResources(self, direct: bool = False, **resources):
+        """Update the resource limits of the running container.
+
+        The limits also apply to the APP containers deployed on this host.
+
+        :param direct: Write the limits to the cgroup files of the container
+            instead of using the Docker API. It is faster, but the container
+            configuration of Docker is not updated.
+        :type direct: bool
+        :param resources: Docker-py arguments in UPDATABLE_RESOURCES, e.g.
+            cpu_quota=25000, cpuset_cpus="0" or mem_limit="256m". Only
+            CGROUP_LIMITS are supported if direct is True.
+
+        :raise InvalidDockerArgs: A resource can not be updated.
+        """
+        _updateResources(self.dins, resources, direct)
+        self.docker_args.update(resources)
 
     # MARK (Zuo): Use iproute2 instead of ifconfig to configure the IP address
     # of the default interface of the DockerHost.
@@ -305,7 +780,15 @@ class APPContainer:
     them).
     """
 
-    def __init__(self, name: str, dhost: str, dimage: str, dins, dcmd: str = None):
+    def __init__(
+        self,
+        name: str,
+        dhost: str,
+        dimage: str,
+        dins,
+        dcmd: str = None,
+        docker_args: dict = None,
+    ):
         """Create a APPContainer.
 
         :param name: Name of the APP container.
@@ -317,12 +800,16 @@ def __init__(self, name: str, dhost: str, dimage: str, dins, dcmd: str = None):
         :param dins: The Docker container instance.
         :param dcmd: The Docker command.
         :type dcmd: str
+        :param docker_args: Docker arguments given by the user, used to
+            re-create the container, e.g. for migration.
+        :type docker_args: dict
         """
         self.name = name
         self.dhost = dhost
         self.dimage = dimage
         self.dcmd = dcmd if dcmd is not None else "/usr/bin/env sh"
         self.dins = dins
+        self.docker_args = docker_args if docker_args is not None else dict()
 
     def getCurrentStats(self):
         """Get decoded current stats of the Docker container."""
@@ -332,6 +819,21 @@ def getLogs(self):
         """Get logs from this container."""
         return self.dins.logs(timestamps=True).decode("utf-8")
 
+    def updateResources(self, direct: bool = False, **resources):
+        """Update the resource limits of the running container.
+
+        :param direct: Write the limits to the cgroup files of the container
+            instead of using the Docker API. It is faster, but the container
+            configuration of Docker is not updated.
+        :type direct: bool
+        :param resources: Docker-py arguments in UPDATABLE_RESOURCES. Only
+            CGROUP_LIMITS are supported if direct is True.
+
+        :raise InvalidDockerArgs: A resource can not be updated.
+        """
+        _updateResources(self.dins, resources, direct)
+        self.docker_args.update(resources)
+
     def _terminate(self):
         """APPContainer specific cleanups."""
         pass
@@ -9,8 +9,16 @@
 from importlib import __import__
 from mininet.log import debug
 from mininet.util import errRun, quietRun
+import re
 import sys
 
+from comnetsemu.trace import span
+from comnetsemu.util import ipBatch
+
+# Veth pairs created in advance by makeIntfPairs() which are not yet claimed
+# by makeIntfPair(). (intf1, intf2) -> (netns1, netns2)
+_created_pairs = dict()
+
 
 def override(module, name):
     """
@@ -54,6 +62,17 @@ def makeIntfPairFixed(
        deleteIntfs: delete intfs before creating them
        runCmd: function to run shell commands (quietRun)
        raises Exception on failure"""
+    with span("makeIntfPair", link="%s<->%s" % (intf1, intf2)):
+        _makeIntfPair(intf1, intf2, addr1, addr2, node1, node2, deleteIntfs, runCmd)
+
+
+def _makeIntfPair(intf1, intf2, addr1, addr2, node1, node2, deleteIntfs, runCmd):
+    if node1 is not None and _created_pairs.pop((intf1, intf2), None) == (
+        node1.pid,
+        1 if not node2 else node2.pid,
+    ):
+        # Already created by makeIntfPairs()
+        return
     if not runCmd:
         runCmd = quietRun if not node1 else node1.cmd
         runCmd2 = quietRun if not node2 else node2.cmd
@@ -64,19 +83,7 @@ def makeIntfPairFixed(
     # Create new pair
     netns1 = node1.pid
     netns2 = 1 if not node2 else node2.pid
-    if addr1 is None and addr2 is None:
-        cmd = "ip link add name %s netns %s " "type veth peer name %s netns %s" % (
-            intf1,
-            netns1,
-            intf2,
-            netns2,
-        )
-    else:
-        cmd = (
-            "ip link add name %s address %s netns %s "
-            "type veth peer name %s address %s netns %s"
-            % (intf1, addr1, netns1, intf2, addr2, netns2)
-        )
+    cmd = "ip " + _linkAddCmd(intf1, intf2, addr1, addr2, netns1, netns2)
 
     _, cmdOutput, _ = errRun(cmd)
 
@@ -96,3 +103,71 @@ def makeIntfPairFixed(
         raise Exception(
             "Error creating interface pair (%s,%s): %s " % (intf1, intf2, cmdOutput)
         )
+
+
+def _linkAddCmd(intf1, intf2, addr1, addr2, netns1, netns2):
+    "Return the ip command (without leading ip) to create a veth pair"
+    if addr1 is None and addr2 is None:
+        return "link add name %s netns %s type veth peer name %s netns %s" % (
+            intf1,
+            netns1,
+            intf2,
+            netns2,
+        )
+    return (
+        "link add name %s address %s netns %s "
+        "type veth peer name %s address %s netns %s"
+        % (intf1, addr1, netns1, intf2, addr2, netns2)
+    )
+
+
+def makeIntfPairs(pairs):
+    """Make many veth pairs with one ip -batch process instead of one ip
+       process per pair
+       pairs: list of (intf1, intf2, addr1, addr2, node1, node2) tuples
+              with the same meaning as the arguments of makeIntfPair
+       returns: list of pairs that could not be created
+
+       Interfaces are not deleted before they are created. The following
+       makeIntfPair call with the same names and nodes does not create the
+       pair again. Pairs that are not claimed should be released with
+       clearIntfPairs()."""
+    cmds = []
+    keys = []
+    for intf1, intf2, addr1, addr2, node1, node2 in pairs:
+        netns1 = node1.pid
+        netns2 = 1 if not node2 else node2.pid
+        cmds.append(_linkAddCmd(intf1, intf2, addr1, addr2, netns1, netns2))
+        keys.append(((intf1, intf2), (netns1, netns2)))
+
+    with span("makeIntfPairs", pairs=len(cmds)):
+        err = ipBatch(cmds)
+    # ip prints the error of a command followed by "Command failed -:LINE".
+    failed = set()
+    msg = ""
+    for line in err.splitlines():
+        m = re.match(r"Command failed -:(\d+)", line)
+        if not m:
+            msg += line + "\n"
+            continue
+        idx = int(m.group(1)) - 1
+        # See the workaround for iproute2 5.1 in makeIntfPairFixed
+        if "No such device" in msg:
+            debug(
+                "Ignored error creating interface pair (%s,%s): %s "
+                % (keys[idx][0] + (msg,))
+            )
+        else:
+            failed.add(idx)
+        msg = ""
+
+    for idx, (names, netns) in enumerate(keys):
+        if idx not in failed:
+            _created_pairs[names] = netns
+    return [pairs[idx] for idx in sorted(failed)]
+
+
+def clearIntfPairs():
+    """Forget veth pairs created by makeIntfPairs() which are not claimed by
+       makeIntfPair, e.g. because building the network failed"""
+    _created_pairs.clear()
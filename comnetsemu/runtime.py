@@ -0,0 +1,1274 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+About: Container runtimes of ComNetsEmu.
+
+       DockerHost, APPContainerManager and the other modules only use
+       containers through a client with the Docker-py API returned by
+       comnetsemu.dockerapi.getClient(). A runtime is a class of such clients,
+       it is selected by name with comnetsemu.dockerapi.setRuntime() or the
+       COMNETSEMU_RUNTIME environment variable. New runtimes are added to
+       comnetsemu.dockerapi.RUNTIMES.
+
+       The following subset of the Docker-py API is used:
+
+       - client.containers: run(**docker_args), create(**docker_args),
+         get(id_or_name) and list(all=False, filters=None).
+       - Containers: id, name, labels, status, attrs["Name"],
+         attrs["State"] (Running, Status, Pid), attrs["HostConfig"], start(),
+         reload(), remove(force), kill(), rename(name), pause(), unpause(),
+         update(**resources), exec_run(cmd, detach), stats(decode, stream)
+         and logs().
+       - client.images: list(), get(name) and load(data).
+       - client.api.containers(filters): Dicts with the "Id" of containers.
+       - client.events(decode, filters): An iterable stream of container
+         events with a close() method.
+       - client.close()
+       - client.exec_modes (optional): Exec modes of DockerHost supported by
+         the runtime. The first one is the default.
+       - client.ishell_args (optional): Default arguments of the interactive
+         shell of DockerHosts.
+
+       Raised errors are the ones of docker.errors, e.g. NotFound.
+"""
+
+import hashlib
+import io
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import threading
+import time
+import uuid
+from signal import SIGCONT, SIGKILL, SIGSTOP
+
+import docker
+from docker.models.containers import ExecResult
+
+from comnetsemu.dockerapi import CONTAINER_EVENTS, normalizeImageName
+from mininet.log import debug, info
+
+# Command of containers created without a command. The runtime has no image
+# configuration, so the default command of the image is unknown.
+NETNS_DEFAULT_CMD = "sleep infinity"
+# Interval of samples returned by stats(stream=True), the same as Docker.
+NETNS_STATS_INTERVAL_SECS = 1.0
+
+# Docker-py arguments -> keys of HostConfig in the container attrs.
+HOST_CONFIG_KEYS = {
+    "cpu_period": "CpuPeriod",
+    "cpu_quota": "CpuQuota",
+    "cpu_shares": "CpuShares",
+    "cpuset_cpus": "CpusetCpus",
+    "mem_limit": "Memory",
+    "network_mode": "NetworkMode",
+}
+
+_CLK_TCK = os.sysconf("SC_CLK_TCK")
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def _matchLabels(labels: dict, wanted) -> bool:
+    """Check labels against a label filter of the Docker API, "key" or
+    "key=value" or a list of them."""
+    if isinstance(wanted, str):
+        wanted = [wanted]
+    for w in wanted:
+        key, sep, value = w.partition("=")
+        if key not in labels or (sep and labels[key] != value):
+            return False
+    return True
+
+
+def _systemCpuUsage() -> int:
+    """Get the total CPU time of the system in nanoseconds, like the
+    system_cpu_usage of Docker stats."""
+    with open("/proc/stat", "r") as f:
+        fields = f.readline().split()[1:]
+    return sum(int(v) for v in fields) * 10**9 // _CLK_TCK
+
+
+class NetnsEventStream:
+    """Stream of container events like the one returned by client.events()."""
+
+    def __init__(self, filters: dict = None, on_close=None):
+        self.filters = filters or dict()
+        self._cond = threading.Condition()
+        self._events = list()
+        self._closed = False
+        # Called with the stream when it is closed.
+        self._on_close = on_close
+
+    def __iter__(self):
+        while True:
+            with self._cond:
+                while not self._events and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                e = self._events.pop(0)
+            yield e
+
+    def accepts(self, container, action: str) -> bool:
+        events = self.filters.get("event", CONTAINER_EVENTS)
+        if action not in events:
+            return False
+        return _matchLabels(container.labels, self.filters.get("label", []))
+
+    def put(self, e: dict):
+        with self._cond:
+            self._events.append(e)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._on_close is not None:
+            self._on_close(self)
+
+
+class NetnsContainer:
+    """A container of the netns runtime.
+
+    Its init process is the command of the container running in new PID,
+    UTS, IPC and mount namespaces, and a new network namespace or the one of
+    another container (network_mode="container:<id>"). The root filesystem
+    and the cgroup are the ones of ComNetsEmu.
+    """
+
+    # The container has no cgroup of its own, cgroup limits must not be
+    # written for its PID.
+    own_cgroup = False
+
+    def __init__(
+        self,
+        client,
+        name: str,
+        image: str,
+        command=None,
+        labels: dict = None,
+        network_mode: str = None,
+        environment=None,
+        tty: bool = False,
+        stdin_open: bool = False,
+        auto_remove: bool = False,
+        **kwargs,
+    ):
+        self.client = client
+        self.id = uuid.uuid4().hex + uuid.uuid4().hex
+        self.name = name
+        self.image = image
+        self.command = self._command(command)
+        self.network_mode = network_mode
+        self.environment = environment
+        self.keep_stdin = tty or stdin_open
+        self.auto_remove = auto_remove
+        self.proc = None
+        self._removed = False
+        # Serializes the state changes of the exit of the init process and of
+        # the removal, which run in the watcher thread and in API calls.
+        self._state_lock = threading.Lock()
+        self._precpu = None
+        self._log_path = os.path.join(client.log_dir, f"{self.id}.log")
+        self.attrs = {
+            "Id": self.id,
+            "Name": f"/{name}",
+            "State": {"Running": False, "Status": "created", "Pid": 0},
+            "Config": {
+                "Hostname": self.id[:12],
+                "Cmd": self.command,
+                "Image": image,
+                "Labels": dict(labels or dict()),
+            },
+            "HostConfig": {"NetworkMode": network_mode or "bridge"},
+        }
+        self.update(**kwargs)
+
+    @property
+    def labels(self) -> dict:
+        return self.attrs["Config"]["Labels"]
+
+    @property
+    def status(self) -> str:
+        return self.attrs["State"]["Status"]
+
+    @property
+    def _pid(self) -> int:
+        return self.attrs["State"]["Pid"]
+
+    def _command(self, command) -> list:
+        """Get the arguments of the init process."""
+        if isinstance(command, str):
+            command = shlex.split(command)
+        return command or shlex.split(NETNS_DEFAULT_CMD)
+
+    def _env(self) -> dict:
+        env = {
+            "PATH": os.environ.get("PATH", os.defpath),
+            "HOSTNAME": self.attrs["Config"]["Hostname"],
+        }
+        if isinstance(self.environment, dict):
+            env.update({k: str(v) for k, v in self.environment.items()})
+        elif self.environment:
+            env.update(e.split("=", 1) for e in self.environment if "=" in e)
+        return env
+
+    def _spawnArgs(self) -> list:
+        args = list()
+        ns = ["--pid", "--mount-proc", "--uts", "--ipc"]
+        if self.network_mode and self.network_mode.startswith("container:"):
+            other = self.client.containers.get(self.network_mode.split(":", 1)[1])
+            if not other.attrs["State"]["Running"]:
+                raise docker.errors.APIError(
+                    f"Container {other.name} of the network is not running"
+                )
+            args = ["nsenter", f"--net=/proc/{other._pid}/ns/net"]
+        elif self.network_mode != "host":
+            ns.append("--net")
+        # unshare forks the init process of the new PID namespace.
+        return args + ["unshare", "--fork", "--kill-child"] + ns + self.command
+
+    def _initPid(self) -> int:
+        """Get the PID of the process forked by unshare."""
+        path = f"/proc/{self.proc.pid}/task/{self.proc.pid}/children"
+        while True:
+            try:
+                with open(path, "r") as f:
+                    children = f.read().split()
+            except FileNotFoundError:
+                children = []
+            if children:
+                return int(children[0])
+            if self.proc.poll() is not None:
+                with open(self._log_path, "r", errors="replace") as f:
+                    log = f.read().strip()
+                raise docker.errors.APIError(
+                    f"Failed to start container {self.name}: {log}"
+                )
+            time.sleep(0.001)
+
+    def start(self, **kwargs):
+        if self._removed:
+            raise docker.errors.NotFound(f"No such container: {self.name}")
+        if self.attrs["State"]["Running"]:
+            return
+        with open(self._log_path, "ab") as log:
+            # A new session like the daemon, e.g. SIGINT of the terminal does
+            # not stop the container.
+            self.proc = subprocess.Popen(
+                self._spawnArgs(),
+                stdin=subprocess.PIPE if self.keep_stdin else subprocess.DEVNULL,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                env=self._env(),
+                start_new_session=True,
+            )
+        pid = self._initPid()
+        self.attrs["State"] = {"Running": True, "Status": "running", "Pid": pid}
+        self.client.emit(self, "start")
+        # Like the daemon, wait for the exit of the init process, so the die
+        # event is sent even if nothing polls the container.
+        threading.Thread(
+            target=self._watch,
+            args=(self.proc,),
+            name=f"netns-watch-{self.name}",
+            daemon=True,
+        ).start()
+
+    def _watch(self, proc: subprocess.Popen):
+        proc.wait()
+        self._reap(proc)
+
+    def _poll(self):
+        """Update the state if the init process exited."""
+        if self.proc is not None and self.proc.poll() is not None:
+            self._reap(self.proc)
+
+    def _reap(self, proc: subprocess.Popen):
+        """Update the state after the exit of the given init process, once."""
+        with self._state_lock:
+            if proc is not self.proc or not self.attrs["State"]["Running"]:
+                return
+            self._exited(proc.returncode)
+        if self.auto_remove:
+            self._remove()
+
+    def _exited(self, code: int):
+        if self.proc.stdin:
+            self.proc.stdin.close()
+        self.attrs["State"] = {
+            "Running": False,
+            "Status": "exited",
+            "Pid": 0,
+            "ExitCode": code,
+        }
+        self.client.emit(self, "die")
+
+    def _remove(self):
+        with self._state_lock:
+            if self._removed:
+                return
+            self._removed = True
+        self._release()
+        with self.client.lock:
+            self.client.containers.by_id.pop(self.id, None)
+        if os.path.exists(self._log_path):
+            os.remove(self._log_path)
+        self.client.emit(self, "destroy")
+
+    def _release(self):
+        """Release the resources of the removed container."""
+
+    def reload(self):
+        if self._removed:
+            raise docker.errors.NotFound(f"No such container: {self.name}")
+        self._poll()
+
+    def kill(self, signal: int = None):
+        """Send a signal to the init process, SIGKILL by default. The other
+        processes of the container are killed with it."""
+        self._poll()
+        if not self.attrs["State"]["Running"]:
+            raise docker.errors.APIError(f"Container {self.name} is not running")
+        signal = SIGKILL if signal is None else signal
+        os.kill(self._pid, signal)
+        if signal == SIGKILL:
+            self.proc.wait()
+            self._reap(self.proc)
+
+    def stop(self, timeout: int = None):
+        self._poll()
+        if self.attrs["State"]["Running"]:
+            self.kill()
+
+    def remove(self, force: bool = False, **kwargs):
+        if self._removed:
+            raise docker.errors.NotFound(f"No such container: {self.name}")
+        self._poll()
+        if self.attrs["State"]["Running"]:
+            if not force:
+                raise docker.errors.APIError(
+                    f"Can not remove the running container {self.name}"
+                )
+            self.kill()
+        if not self._removed:
+            self._remove()
+
+    def rename(self, name: str):
+        with self.client.lock:
+            if any(c.name == name for c in self.client.containers.by_id.values()):
+                raise docker.errors.APIError(f"Conflict: name {name} is in use")
+            self.name = name
+            self.attrs["Name"] = f"/{name}"
+
+    def _nsPids(self) -> list:
+        """Get the PIDs of all processes in the PID namespace."""
+        try:
+            ns = os.readlink(f"/proc/{self._pid}/ns/pid")
+        except FileNotFoundError:
+            return []
+        pids = list()
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                if os.readlink(f"/proc/{entry}/ns/pid") == ns:
+                    pids.append(int(entry))
+            except OSError:
+                continue
+        return pids
+
+    def _signalAll(self, sig):
+        for pid in self._nsPids():
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                continue
+
+    def pause(self):
+        self._poll()
+        if self.status != "running":
+            raise docker.errors.APIError(f"Container {self.name} is not running")
+        self._signalAll(SIGSTOP)
+        self.attrs["State"]["Status"] = "paused"
+
+    def unpause(self):
+        if self.status != "paused":
+            raise docker.errors.APIError(f"Container {self.name} is not paused")
+        self._signalAll(SIGCONT)
+        self.attrs["State"]["Status"] = "running"
+
+    def update(self, **kwargs):
+        """Record resource limits in the HostConfig. They are not enforced."""
+        if "mem_limit" in kwargs:
+            kwargs["mem_limit"] = docker.utils.parse_bytes(kwargs["mem_limit"])
+        self.attrs["HostConfig"].update(
+            {HOST_CONFIG_KEYS.get(k, k): v for k, v in kwargs.items()}
+        )
+        return {"Warnings": None}
+
+    def exec_run(self, cmd, detach: bool = False, environment=None, **kwargs):
+        self._poll()
+        if not self.attrs["State"]["Running"]:
+            raise docker.errors.APIError(f"Container {self.name} is not running")
+        if isinstance(cmd, str):
+            cmd = shlex.split(cmd)
+        args = ["nsenter", "--target", str(self._pid)]
+        args += ["--mount", "--uts", "--ipc", "--net", "--pid"] + cmd
+        env = self._env()
+        if environment:
+            env.update(
+                environment
+                if isinstance(environment, dict)
+                else (e.split("=", 1) for e in environment)
+            )
+        if detach:
+            subprocess.Popen(
+                args,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                env=env,
+                start_new_session=True,
+            )
+            return ExecResult(None, None)
+        ret = subprocess.run(
+            args,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env=env,
+            check=False,
+        )
+        return ExecResult(ret.returncode, ret.stdout)
+
+    def logs(self, **kwargs) -> bytes:
+        if not os.path.exists(self._log_path):
+            return b""
+        with open(self._log_path, "rb") as f:
+            return f.read()
+
+    def _stats(self) -> dict:
+        """Get stats in the format of the Docker API from /proc. CPU and
+        memory usages are summed over all processes in the container."""
+        cpu = 0
+        mem = 0
+        for pid in self._nsPids():
+            try:
+                with open(f"/proc/{pid}/stat", "r") as f:
+                    # The command name in parentheses could contain spaces.
+                    fields = f.read().rsplit(")", 1)[1].split()
+            except (FileNotFoundError, ProcessLookupError):
+                continue
+            # utime, stime and rss are the 14th, 15th and 24th field.
+            cpu += int(fields[11]) + int(fields[12])
+            mem += int(fields[21]) * _PAGE_SIZE
+        cpu_stats = {
+            "cpu_usage": {"total_usage": cpu * 10**9 // _CLK_TCK},
+            "system_cpu_usage": _systemCpuUsage(),
+            "online_cpus": os.cpu_count(),
+        }
+        stats = {
+            "read": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "cpu_stats": cpu_stats,
+            "precpu_stats": self._precpu or {"cpu_usage": {"total_usage": 0}},
+            "memory_stats": {"usage": mem} if self._pid else dict(),
+        }
+        self._precpu = cpu_stats
+        return stats
+
+    def stats(self, decode: bool = None, stream: bool = True, **kwargs):
+        if not stream:
+            return self._stats()
+        return self._streamStats(decode)
+
+    def _streamStats(self, decode: bool):
+        while not self._removed:
+            self._poll()
+            stats = self._stats()
+            yield stats if decode else json.dumps(stats).encode("utf-8")
+            time.sleep(NETNS_STATS_INTERVAL_SECS)
+
+
+class NetnsContainers:
+    def __init__(self, client):
+        self.client = client
+        self.by_id = dict()
+
+    def create(self, image: str, command=None, name: str = None, **kwargs):
+        with self.client.lock:
+            if name is None:
+                name = f"netns-{uuid.uuid4().hex[:12]}"
+            if any(c.name == name for c in self.by_id.values()):
+                raise docker.errors.APIError(f"Conflict: name {name} is in use")
+            c = self.client.container_class(self.client, name, image, command, **kwargs)
+            self.by_id[c.id] = c
+        return c
+
+    def run(self, image: str, command=None, detach: bool = False, **kwargs):
+        c = self.create(image, command, **kwargs)
+        try:
+            c.start()
+        except Exception:
+            c.remove(force=True)
+            raise
+        return c
+
+    def get(self, container_id: str) -> NetnsContainer:
+        with self.client.lock:
+            containers = list(self.by_id.values())
+        for c in containers:
+            if container_id in (c.id, c.name) or (
+                len(container_id) >= 12 and c.id.startswith(container_id)
+            ):
+                return c
+        raise docker.errors.NotFound(f"No such container: {container_id}")
+
+    def list(self, all: bool = False, filters: dict = None, **kwargs) -> list:
+        filters = filters or dict()
+        with self.client.lock:
+            containers = list(self.by_id.values())
+        ret = list()
+        for c in containers:
+            c._poll()
+            if c._removed or (not all and c.status != "running"):
+                continue
+            if "status" in filters and c.status != filters["status"]:
+                continue
+            if "id" in filters and not c.id.startswith(filters["id"]):
+                continue
+            if "name" in filters and filters["name"] not in c.name:
+                continue
+            if not _matchLabels(c.labels, filters.get("label", [])):
+                continue
+            ret.append(c)
+        return ret
+
+
+class NetnsImage:
+    def __init__(self, name: str):
+        name = normalizeImageName(name)
+        self.id = "sha256:" + hashlib.sha256(name.encode("utf-8")).hexdigest()
+        self.tags = [name]
+        # Nothing is stored for an image.
+        self.attrs = {"Id": self.id, "RepoTags": self.tags, "Size": 0}
+
+
+class NetnsImages:
+    """Images of the netns runtime. Containers run on the root filesystem of
+    ComNetsEmu, so every image is available."""
+
+    def __init__(self, client):
+        self.client = client
+        self._images = dict()
+
+    def get(self, name: str) -> NetnsImage:
+        with self.client.lock:
+            image = self._images.get(normalizeImageName(name), None)
+            if image is None:
+                image = NetnsImage(name)
+                self._images[image.tags[0]] = image
+            return image
+
+    def list(self, **kwargs) -> list:
+        with self.client.lock:
+            return list(self._images.values())
+
+    def load(self, data) -> list:
+        debug("Image archives are not used by the netns runtime\n")
+        return []
+
+
+class NetnsAPI:
+    """The low-level API used with the client.api of Docker-py."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def containers(self, all: bool = False, filters: dict = None, **kwargs) -> list:
+        containers = self.client.containers.list(all=all, filters=filters)
+        return [{"Id": c.id, "Names": [c.attrs["Name"]]} for c in containers]
+
+
+class NetnsRuntime:
+    """Client of the netns runtime: Containers are processes in new Linux
+    namespaces without Docker, images and resource limits.
+
+    It is a lightweight replacement of the Docker client for control-plane
+    and scaling tests and dry-runs of large topologies. The root filesystem
+    is shared with ComNetsEmu, so the image of a container is ignored and its
+    command must be available on the system. Resource limits are recorded,
+    but not enforced. There is no default bridge network, the network
+    namespace of a container is empty except the interfaces added by
+    Mininet. Processes in containers are killed when the client is closed.
+    Like the daemon, it requires root privileges.
+    """
+
+    exec_modes = ("nsenter",)
+    # The shell is the bash of the system. Without --noediting, bash >= 5.1
+    # prints the escape sequences of bracketed paste into command outputs.
+    ishell_args = "--norc --noediting -is"
+    container_class = NetnsContainer
+
+    def __init__(self, log_dir: str = None):
+        """Create a NetnsRuntime client.
+
+        :param log_dir: Directory of the output logs of containers. A new
+            temporary directory is used if it is None.
+        :type log_dir: str
+        """
+        self._own_log_dir = log_dir is None
+        self.log_dir = log_dir or tempfile.mkdtemp(prefix="comnetsemu-netns-")
+        self.lock = threading.Lock()
+        self.containers = NetnsContainers(self)
+        self.images = NetnsImages(self)
+        self.api = NetnsAPI(self)
+        self._streams = list()
+
+    def events(self, decode: bool = None, filters: dict = None, **kwargs):
+        stream = NetnsEventStream(filters, self._removeStream)
+        with self.lock:
+            self._streams.append(stream)
+        return stream
+
+    def _removeStream(self, stream: NetnsEventStream):
+        with self.lock:
+            if stream in self._streams:
+                self._streams.remove(stream)
+
+    def emit(self, container: NetnsContainer, action: str):
+        """Publish an event of a container to the event streams."""
+        with self.lock:
+            streams = tuple(self._streams)
+        e = {"id": container.id, "status": action, "Action": action}
+        for stream in streams:
+            if stream.accepts(container, action):
+                stream.put(e)
+
+    def close(self):
+        """Remove all containers and close the event streams."""
+        with self.lock:
+            containers = list(self.containers.by_id.values())
+        for c in containers:
+            try:
+                c.remove(force=True)
+            except docker.errors.APIError as e:
+                debug(f"Failed to remove container {c.name}: {e}\n")
+        with self.lock:
+            streams, self._streams = self._streams, list()
+        for stream in streams:
+            stream.close()
+        if self._own_log_dir:
+            shutil.rmtree(self.log_dir, ignore_errors=True)
+
+
+# OCI runtimes tried in this order if no binary is given to OciRuntime.
+OCI_RUNTIMES = ("crun", "runc")
+# Directory of unpacked images, bundles and the state of the OCI runtime.
+OCI_DEFAULT_ROOT = "/var/lib/comnetsemu/oci"
+OCI_DEFAULT_PATH = "/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin"
+
+# Capabilities of containers, the same as the defaults of Docker.
+OCI_DEFAULT_CAPS = (
+    "CAP_CHOWN",
+    "CAP_DAC_OVERRIDE",
+    "CAP_FSETID",
+    "CAP_FOWNER",
+    "CAP_MKNOD",
+    "CAP_NET_RAW",
+    "CAP_SETGID",
+    "CAP_SETUID",
+    "CAP_SETFCAP",
+    "CAP_SETPCAP",
+    "CAP_NET_BIND_SERVICE",
+    "CAP_SYS_CHROOT",
+    "CAP_KILL",
+    "CAP_AUDIT_WRITE",
+)
+# All capabilities in the order of their numbers, for privileged containers.
+OCI_ALL_CAPS = (
+    "CAP_CHOWN",
+    "CAP_DAC_OVERRIDE",
+    "CAP_DAC_READ_SEARCH",
+    "CAP_FOWNER",
+    "CAP_FSETID",
+    "CAP_KILL",
+    "CAP_SETGID",
+    "CAP_SETUID",
+    "CAP_SETPCAP",
+    "CAP_LINUX_IMMUTABLE",
+    "CAP_NET_BIND_SERVICE",
+    "CAP_NET_BROADCAST",
+    "CAP_NET_ADMIN",
+    "CAP_NET_RAW",
+    "CAP_IPC_LOCK",
+    "CAP_IPC_OWNER",
+    "CAP_SYS_MODULE",
+    "CAP_SYS_RAWIO",
+    "CAP_SYS_CHROOT",
+    "CAP_SYS_PTRACE",
+    "CAP_SYS_PACCT",
+    "CAP_SYS_ADMIN",
+    "CAP_SYS_BOOT",
+    "CAP_SYS_NICE",
+    "CAP_SYS_RESOURCE",
+    "CAP_SYS_TIME",
+    "CAP_SYS_TTY_CONFIG",
+    "CAP_MKNOD",
+    "CAP_LEASE",
+    "CAP_AUDIT_WRITE",
+    "CAP_AUDIT_CONTROL",
+    "CAP_SETFCAP",
+    "CAP_MAC_OVERRIDE",
+    "CAP_MAC_ADMIN",
+    "CAP_SYSLOG",
+    "CAP_WAKE_ALARM",
+    "CAP_BLOCK_SUSPEND",
+    "CAP_AUDIT_READ",
+    "CAP_PERFMON",
+    "CAP_BPF",
+    "CAP_CHECKPOINT_RESTORE",
+)
+
+# Docker-py arguments -> options of the update command of OCI runtimes.
+OCI_UPDATE_OPTIONS = {
+    "blkio_weight": "--blkio-weight",
+    "cpu_period": "--cpu-period",
+    "cpu_quota": "--cpu-quota",
+    "cpu_shares": "--cpu-share",
+    "cpuset_cpus": "--cpuset-cpus",
+    "cpuset_mems": "--cpuset-mems",
+    "mem_limit": "--memory",
+    "mem_reservation": "--memory-reservation",
+    "memswap_limit": "--memory-swap",
+}
+
+
+def _ociResources(args: dict) -> dict:
+    """Convert Docker-py resource arguments to linux.resources of an OCI
+    runtime spec."""
+    cpu = {
+        "period": args.get("cpu_period", None),
+        "quota": args.get("cpu_quota", None),
+        "shares": args.get("cpu_shares", None),
+        "cpus": args.get("cpuset_cpus", None),
+        "mems": args.get("cpuset_mems", None),
+    }
+    if cpu["quota"] is not None and cpu["quota"] <= 0:
+        cpu["quota"] = None
+    memory = {
+        "limit": args.get("mem_limit", None),
+        "reservation": args.get("mem_reservation", None),
+        "swap": args.get("memswap_limit", None),
+    }
+    memory = {
+        k: docker.utils.parse_bytes(v) for k, v in memory.items() if v is not None
+    }
+    resources = {"cpu": {k: v for k, v in cpu.items() if v is not None}}
+    if memory:
+        resources["memory"] = memory
+    if args.get("blkio_weight", None):
+        resources["blockIO"] = {"weight": args["blkio_weight"]}
+    return resources
+
+
+def _ociBindMounts(args: dict) -> list:
+    """Convert the volumes or binds of Docker-py arguments to bind mounts of
+    an OCI runtime spec. Like Docker, missing host directories are created.
+
+    :raise docker.errors.APIError: A volume is not a bind mount of an
+        absolute host path, e.g. a named volume.
+    """
+    binds = list()
+    for key in ("volumes", "binds"):
+        volumes = args.get(key, None) or []
+        if isinstance(volumes, dict):
+            for source, opts in volumes.items():
+                opts = opts if isinstance(opts, dict) else {"bind": opts}
+                binds.append((source, opts["bind"], opts.get("mode", "rw")))
+        else:
+            for volume in volumes:
+                source, _, rest = volume.partition(":")
+                dest, _, mode = rest.partition(":")
+                binds.append((source, dest, mode or "rw"))
+    mounts = list()
+    for source, dest, mode in binds:
+        if not (os.path.isabs(source) and os.path.isabs(dest)):
+            raise docker.errors.APIError(
+                f"Volume {source}:{dest} is not supported by the OCI runtime, "
+                "only bind mounts of absolute host paths are"
+            )
+        if not os.path.exists(source):
+            os.makedirs(source)
+        options = ["rbind", "ro" if "ro" in mode.split(",") else "rw"]
+        mounts.append(
+            {"destination": dest, "type": "bind", "source": source, "options": options}
+        )
+    return mounts
+
+
+# Symbolic links followed at most to resolve a path in a root filesystem.
+MAX_SYMLINKS = 40
+
+
+def _rootfsPath(rootfs: str, name: str) -> str:
+    """Resolve a path inside rootfs like the kernel does in a chroot: Symbolic
+    links of the parent directories are followed with rootfs as root and ".."
+    does not leave rootfs. The last component is not followed.
+
+    :param rootfs: Path of the root filesystem.
+    :type rootfs: str
+    :param name: Path relative to rootfs, e.g. the name of a tar member.
+    :type name: str
+
+    :return: The resolved path, all its parents inside rootfs are directories
+        or do not exist.
+    :rtype: str
+    :raise ValueError: Too many symbolic links are followed.
+    """
+    parts = [p for p in name.split("/") if p not in ("", ".")]
+    resolved = list()
+    links = 0
+    while parts:
+        part = parts.pop(0)
+        if part == "..":
+            if resolved:
+                resolved.pop()
+            continue
+        path = os.path.join(rootfs, *resolved, part)
+        if parts and os.path.islink(path):
+            links += 1
+            if links > MAX_SYMLINKS:
+                raise ValueError(f"Too many symbolic links in {name}")
+            target = os.readlink(path)
+            if target.startswith("/"):
+                resolved = list()
+            parts = [p for p in target.split("/") if p not in ("", ".")] + parts
+            continue
+        resolved.append(part)
+    return os.path.join(rootfs, *resolved)
+
+
+def _removePath(path: str):
+    """Remove a file, link or directory tree if it exists."""
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def _extractLayer(layer, rootfs: str):
+    """Extract a layer tar stream of an image into rootfs and apply the
+    whiteout files of the layer.
+
+    All paths are resolved with _rootfsPath(), so neither ".." in member names
+    nor symbolic links of the image (e.g. etc -> /) reach files of the host.
+    """
+    with tarfile.open(fileobj=layer, mode="r|*") as tar:
+        if hasattr(tarfile, "fully_trusted_filter"):
+            # Layers contain device files, absolute links and setuid files.
+            # Paths are checked below.
+            tar.extraction_filter = tarfile.fully_trusted_filter
+        for member in tar:
+            path = _rootfsPath(rootfs, member.name)
+            head, base = os.path.split(path)
+            if base == ".wh..wh..opq":
+                # Opaque directory: Drop the content of the lower layers.
+                if os.path.isdir(head) and not os.path.islink(head):
+                    for entry in os.listdir(head):
+                        _removePath(os.path.join(head, entry))
+                continue
+            if base.startswith(".wh."):
+                _removePath(os.path.join(head, base.partition(".wh.")[2]))
+                continue
+            if path == rootfs:
+                continue
+            # Like Docker, only a directory is kept, a link to one is replaced.
+            if not (member.isdir() and os.path.isdir(path)) or os.path.islink(path):
+                _removePath(path)
+            member.name = os.path.relpath(path, rootfs)
+            if member.islnk():
+                member.linkname = os.path.relpath(
+                    _rootfsPath(rootfs, member.linkname), rootfs
+                )
+            tar.extract(member, rootfs, numeric_owner=True)
+
+
+class OciImage:
+    """An unpacked image of the OCI runtime."""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "image.json"), "r") as f:
+            meta = json.load(f)
+        self.path = path
+        self.rootfs = meta["rootfs"]
+        self.config = meta["config"]
+        self.id = meta["id"]
+        self.tags = meta["tags"]
+        self.attrs = {"Id": self.id, "RepoTags": self.tags, "Size": meta["size"]}
+
+
+class OciImages:
+    """Images of the OCI runtime: Root filesystems in the images directory of
+    the runtime. They are added from image archives created by docker save
+    or from already unpacked root filesystems."""
+
+    def __init__(self, client):
+        self.client = client
+        self.root = os.path.join(client.root, "images")
+        self._lock = threading.Lock()
+
+    def _path(self, name: str) -> str:
+        name = normalizeImageName(name)
+        return os.path.join(self.root, name.replace("/", "_").replace(":", "_"))
+
+    def get(self, name: str) -> OciImage:
+        path = self._path(name)
+        if not os.path.exists(os.path.join(path, "image.json")):
+            raise docker.errors.ImageNotFound(f"No such image: {name}")
+        return OciImage(path)
+
+    def list(self, **kwargs) -> list:
+        if not os.path.isdir(self.root):
+            return []
+        images = list()
+        for entry in sorted(os.listdir(self.root)):
+            path = os.path.join(self.root, entry)
+            if os.path.exists(os.path.join(path, "image.json")):
+                images.append(OciImage(path))
+        return images
+
+    def add(self, name: str, rootfs: str, config: dict = None) -> OciImage:
+        """Add an unpacked root filesystem as an image.
+
+        :param name: Name of the image.
+        :type name: str
+        :param rootfs: Path of the root filesystem. It is used in place.
+        :type rootfs: str
+        :param config: The config of the image, e.g. Entrypoint, Cmd, Env and
+            WorkingDir, in the format of the Docker image config.
+        :type config: dict
+        """
+        name = normalizeImageName(name)
+        path = self._path(name)
+        rootfs = os.path.abspath(rootfs)
+        size = sum(
+            os.path.getsize(os.path.join(root, f))
+            for root, _, files in os.walk(rootfs)
+            for f in files
+            if not os.path.islink(os.path.join(root, f))
+        )
+        meta = {
+            "id": "sha256:" + hashlib.sha256(rootfs.encode("utf-8")).hexdigest(),
+            "tags": [name],
+            "rootfs": rootfs,
+            "config": config or dict(),
+            "size": size,
+        }
+        with self._lock:
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, "image.json"), "w") as f:
+                json.dump(meta, f)
+        return OciImage(path)
+
+    def load(self, data) -> list:
+        """Unpack the images in an archive created by docker save.
+
+        :param data: The archive as bytes or a file object.
+        :return: A list of the loaded OciImage.
+        """
+        if isinstance(data, bytes):
+            data = io.BytesIO(data)
+        images = list()
+        with tarfile.open(fileobj=data, mode="r:*") as tar:
+            manifest = json.load(tar.extractfile("manifest.json"))
+            for entry in manifest:
+                config = json.load(tar.extractfile(entry["Config"]))
+                for tag in entry.get("RepoTags", None) or []:
+                    info(f"*** Unpacking image {tag}\n")
+                    rootfs = os.path.join(self._path(tag), "rootfs")
+                    shutil.rmtree(rootfs, ignore_errors=True)
+                    os.makedirs(rootfs)
+                    for layer in entry["Layers"]:
+                        _extractLayer(tar.extractfile(layer), rootfs)
+                    images.append(self.add(tag, rootfs, config.get("config", None)))
+        return images
+
+
+class OciContainer(NetnsContainer):
+    """A container of the OCI runtime.
+
+    It is created from an OCI bundle with an overlay of the image as root
+    filesystem and run in the foreground by the OCI runtime. So its init
+    process has its own namespaces, cgroup and root filesystem like a Docker
+    container.
+    """
+
+    own_cgroup = True
+
+    def __init__(self, client, name: str, image: str, command=None, **kwargs):
+        self._image = client.images.get(image)
+        # Docker-py arguments including the latest resource limits.
+        self.docker_args = dict(kwargs)
+        super(OciContainer, self).__init__(client, name, image, command, **kwargs)
+        self.bundle = os.path.join(client.root, "bundles", self.id)
+        self._bind_mounts = _ociBindMounts(self.docker_args)
+
+    def _command(self, command) -> list:
+        config = self._image.config
+        if isinstance(command, str):
+            command = shlex.split(command)
+        command = command or config.get("Cmd", None) or []
+        command = (config.get("Entrypoint", None) or []) + command
+        if not command:
+            raise docker.errors.APIError(f"No command specified for {self.name}")
+        return command
+
+    def _env(self) -> dict:
+        env = {"PATH": OCI_DEFAULT_PATH}
+        env.update(e.split("=", 1) for e in self._image.config.get("Env", None) or [])
+        env.update(super(OciContainer, self)._env())
+        env["PATH"] = env.get("PATH", OCI_DEFAULT_PATH)
+        return env
+
+    def _runtime(self, *args, check: bool = True) -> str:
+        """Run a command of the OCI runtime for this container."""
+        ret = subprocess.run(
+            [self.client.binary, "--root", self.client.state_dir]
+            + list(args)
+            + [self.id],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            check=False,
+        )
+        if check and ret.returncode != 0:
+            raise docker.errors.APIError(
+                "{} {} failed: {}".format(
+                    self.client.binary, args[0], ret.stderr.strip()
+                )
+            )
+        return ret.stdout
+
+    def _spec(self) -> dict:
+        """Get the OCI runtime spec of the bundle."""
+        privileged = self.docker_args.get("privileged", False)
+        namespaces = [{"type": t} for t in ("pid", "ipc", "uts", "mount")]
+        if self.network_mode and self.network_mode.startswith("container:"):
+            other = self.client.containers.get(self.network_mode.split(":", 1)[1])
+            if not other.attrs["State"]["Running"]:
+                raise docker.errors.APIError(
+                    f"Container {other.name} of the network is not running"
+                )
+            namespaces.append({"type": "network", "path": f"/proc/{other._pid}/ns/net"})
+        elif self.network_mode != "host":
+            namespaces.append({"type": "network"})
+        if privileged:
+            with open("/proc/sys/kernel/cap_last_cap", "r") as f:
+                caps = list(OCI_ALL_CAPS[: int(f.read()) + 1])
+        else:
+            caps = list(OCI_DEFAULT_CAPS)
+        # Like Docker, APP containers are placed in the cgroup of their host.
+        parent = self.docker_args.get("cgroup_parent", None) or "/docker"
+        resources = _ociResources(self.docker_args)
+        resources["devices"] = [{"allow": bool(privileged), "access": "rwm"}]
+        return {
+            "ociVersion": "1.0.2",
+            "process": {
+                "terminal": False,
+                "user": {"uid": 0, "gid": 0},
+                "args": self.command,
+                "env": [f"{k}={v}" for k, v in self._env().items()],
+                "cwd": self._image.config.get("WorkingDir", None) or "/",
+                "capabilities": {
+                    k: caps for k in ("bounding", "effective", "permitted")
+                },
+                "noNewPrivileges": False,
+            },
+            "root": {"path": "rootfs", "readonly": False},
+            "hostname": self.attrs["Config"]["Hostname"],
+            "mounts": [
+                {"destination": "/proc", "type": "proc", "source": "proc"},
+                {
+                    "destination": "/dev",
+                    "type": "tmpfs",
+                    "source": "tmpfs",
+                    "options": ["nosuid", "strictatime", "mode=755", "size=65536k"],
+                },
+                {
+                    "destination": "/dev/pts",
+                    "type": "devpts",
+                    "source": "devpts",
+                    "options": ["nosuid", "noexec", "newinstance", "ptmxmode=0666"],
+                },
+                {
+                    "destination": "/dev/shm",
+                    "type": "tmpfs",
+                    "source": "shm",
+                    "options": ["nosuid", "noexec", "nodev", "size=65536k"],
+                },
+                {
+                    "destination": "/dev/mqueue",
+                    "type": "mqueue",
+                    "source": "mqueue",
+                    "options": ["nosuid", "noexec", "nodev"],
+                },
+                {
+                    "destination": "/sys",
+                    "type": "sysfs",
+                    "source": "sysfs",
+                    "options": ["nosuid", "noexec", "nodev"]
+                    + ([] if privileged else ["ro"]),
+                },
+            ]
+            + self._bind_mounts,
+            "linux": {
+                "namespaces": namespaces,
+                "cgroupsPath": f"{parent.rstrip('/')}/{self.id}",
+                "resources": resources,
+            },
+        }
+
+    def _spawnArgs(self) -> list:
+        rootfs = os.path.join(self.bundle, "rootfs")
+        upper = os.path.join(self.bundle, "upper")
+        work = os.path.join(self.bundle, "work")
+        for path in (rootfs, upper, work):
+            os.makedirs(path, exist_ok=True)
+        if not os.path.ismount(rootfs):
+            subprocess.run(
+                [
+                    "mount",
+                    "-t",
+                    "overlay",
+                    "overlay",
+                    "-o",
+                    f"lowerdir={self._image.rootfs},upperdir={upper},workdir={work}",
+                    rootfs,
+                ],
+                check=True,
+            )
+        with open(os.path.join(self.bundle, "config.json"), "w") as f:
+            json.dump(self._spec(), f)
+        return [
+            self.client.binary,
+            "--root",
+            self.client.state_dir,
+            "run",
+            "--bundle",
+            self.bundle,
+            "--pid-file",
+            os.path.join(self.bundle, "pid"),
+            self.id,
+        ]
+
+    def _initPid(self) -> int:
+        """Get the PID of the init process from the PID file written by the
+        runtime."""
+        path = os.path.join(self.bundle, "pid")
+        while True:
+            try:
+                with open(path, "r") as f:
+                    pid = f.read().strip()
+            except FileNotFoundError:
+                pid = ""
+            if pid:
+                return int(pid)
+            if self.proc.poll() is not None:
+                with open(self._log_path, "r", errors="replace") as f:
+                    log = f.read().strip()
+                raise docker.errors.APIError(
+                    f"Failed to start container {self.name}: {log}"
+                )
+            time.sleep(0.001)
+
+    def _release(self):
+        # The runtime deletes a container which is run in the foreground
+        # after its exit, but not if the runtime process is killed.
+        self._runtime("delete", "--force", check=False)
+        rootfs = os.path.join(self.bundle, "rootfs")
+        if os.path.ismount(rootfs):
+            subprocess.run(["umount", "-l", rootfs], check=False)
+        shutil.rmtree(self.bundle, ignore_errors=True)
+
+    def pause(self):
+        self._poll()
+        if self.status != "running":
+            raise docker.errors.APIError(f"Container {self.name} is not running")
+        self._runtime("pause")
+        self.attrs["State"]["Status"] = "paused"
+
+    def unpause(self):
+        if self.status != "paused":
+            raise docker.errors.APIError(f"Container {self.name} is not paused")
+        self._runtime("resume")
+        self.attrs["State"]["Status"] = "running"
+
+    def update(self, **kwargs):
+        """Update the resource limits, they are enforced by the cgroup of the
+        container."""
+        if self.attrs["State"]["Running"]:
+            options = list()
+            for key, value in kwargs.items():
+                if key in OCI_UPDATE_OPTIONS:
+                    if key in ("mem_limit", "mem_reservation", "memswap_limit"):
+                        value = docker.utils.parse_bytes(value)
+                    options.append(f"{OCI_UPDATE_OPTIONS[key]}={value}")
+            if options:
+                self._runtime("update", *options)
+        self.docker_args.update(kwargs)
+        return super(OciContainer, self).update(**kwargs)
+
+
+class OciRuntime(NetnsRuntime):
+    """Client of the OCI runtime: Containers are run by an OCI runtime like
+    crun or runc directly, without a daemon.
+
+    Images are unpacked root filesystems, see OciImages. They are loaded
+    from archives created by docker save, e.g. with
+    comnetsemu.dockerapi.ensureImages(). Containers have their own
+    namespaces, an overlay of the image as root filesystem and a cgroup with
+    the resource limits given in docker_args. Volumes in docker_args must be
+    bind mounts of absolute host paths, named volumes are not supported. Like
+    the netns runtime, there is no default bridge network and the containers
+    are removed when the client is closed.
+    """
+
+    container_class = OciContainer
+
+    def __init__(self, root: str = None, binary: str = None, log_dir: str = None):
+        """Create an OciRuntime client.
+
+        :param root: Directory of images, bundles and the state of the OCI
+            runtime. OCI_DEFAULT_ROOT is used if it is None.
+        :type root: str
+        :param binary: Name or path of the OCI runtime. The first one of
+            OCI_RUNTIMES found in PATH is used if it is None.
+        :type binary: str
+        :param log_dir: Directory of the output logs of containers. A new
+            temporary directory is used if it is None.
+        :type log_dir: str
+        """
+        for name in [binary] if binary else OCI_RUNTIMES:
+            path = shutil.which(name)
+            if path:
+                break
+        else:
+            raise docker.errors.DockerException(
+                "No OCI runtime found. Tried: {}".format(
+                    ", ".join([binary] if binary else OCI_RUNTIMES)
+                )
+            )
+        self.binary = path
+        self.root = root or OCI_DEFAULT_ROOT
+        self.state_dir = os.path.join(self.root, "state")
+        os.makedirs(self.state_dir, exist_ok=True)
+        super(OciRuntime, self).__init__(log_dir)
+        self.images = OciImages(self)
@@ -0,0 +1,445 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+About: Resource-aware placement of APP containers on DockerHosts.
+
+       The capacity of a DockerHost is given by the CPU and memory limits and
+       the cpuset in its docker_args. The demand of an APP container is given
+       by the same keys in its docker_args. The latest resource samples of
+       monitored APP containers are used if they are higher than the demand.
+
+       All DockerHosts run on the same machine: Resources of the machine
+       which are not limited by a DockerHost are split evenly among the
+       DockerHosts without a limit, and a CPU dedicated to a container is
+       not given to any other container. The allocated resources are computed
+       from the docker_args of the running APP containers on each placement,
+       so several schedulers of the same manager do not overcommit.
+"""
+
+import os
+from collections import namedtuple
+
+import docker
+
+from comnetsemu.exceptions import PlacementError
+from comnetsemu.node import DockerHost
+from mininet.log import debug
+
+DEFAULT_CPU_PERIOD = 100000
+
+# Resources requested by a container. cpu: number of CPUs (fraction allowed),
+# mem: memory in bytes, cpuset: set of CPUs the container is limited to or
+# None, cpus: number of dedicated CPUs.
+Demand = namedtuple("Demand", ["cpu", "mem", "cpuset", "cpus"])
+
+# Result of a placement. cpus: set of dedicated CPUs assigned to the container,
+# they are also set as cpuset_cpus in docker_args.
+Placement = namedtuple("Placement", ["name", "dhost", "docker_args", "cpus"])
+
+
+def parseCpuset(cpuset: str) -> set:
+    """Parse a cpuset string like "0-3,6" to a set of CPU numbers."""
+    cpus = set()
+    for part in cpuset.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-")
+            cpus.update(range(int(start), int(end) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus
+
+
+def formatCpuset(cpus) -> str:
+    """Format CPU numbers to a cpuset string like "0,1,2"."""
+    return ",".join(str(c) for c in sorted(cpus))
+
+
+def _hostCpuset() -> set:
+    if hasattr(os, "sched_getaffinity"):
+        return set(os.sched_getaffinity(0))
+    return set(range(os.cpu_count() or 1))
+
+
+def _hostMemory() -> int:
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+def demandOf(docker_args: dict, cpus: int = 0) -> Demand:
+    """Get the resources requested by the given Docker arguments.
+
+    A container limited to a cpuset without a CPU quota can use all CPUs of
+    the cpuset, they are dedicated to it.
+
+    :param docker_args: Docker-py arguments with cpu_quota, cpu_period,
+        nano_cpus, cpuset_cpus or mem_limit.
+    :type docker_args: dict
+    :param cpus: Number of dedicated CPUs.
+    :type cpus: int
+    :rtype: Demand
+    """
+    docker_args = docker_args or dict()
+    cpuset = None
+    if docker_args.get("cpuset_cpus", None):
+        cpuset = parseCpuset(docker_args["cpuset_cpus"])
+    cpu = 0.0
+    if docker_args.get("nano_cpus", None):
+        cpu = docker_args["nano_cpus"] / 1e9
+    elif (docker_args.get("cpu_quota", None) or -1) > 0:
+        period = docker_args.get("cpu_period", None) or DEFAULT_CPU_PERIOD
+        cpu = docker_args["cpu_quota"] / period
+    elif cpus:
+        cpu = float(cpus)
+    if cpuset is not None:
+        if cpu > 0:
+            cpu = min(cpu, len(cpuset))
+        else:
+            cpu, cpus = float(len(cpuset)), len(cpuset)
+    mem = 0
+    if docker_args.get("mem_limit", None):
+        mem = docker.utils.parse_bytes(docker_args["mem_limit"])
+    return Demand(cpu, mem, cpuset, cpus)
+
+
+class HostResources:
+    """Capacity and allocated resources of one DockerHost."""
+
+    def __init__(
+        self, name: str, cpu: float, mem: int, cpuset: set, dedicated: set = None
+    ):
+        self.name = name
+        self.cpu = cpu
+        self.mem = mem
+        self.cpuset = set(cpuset)
+        self.cpu_used = 0.0
+        self.mem_used = 0
+        # CPUs dedicated to one container. The set is shared by the hosts on
+        # the same machine.
+        self.dedicated = dedicated if dedicated is not None else set()
+        # Names of containers on the host.
+        self.containers = set()
+
+    @classmethod
+    def fromDockerArgs(
+        cls,
+        name: str,
+        docker_args: dict,
+        cpu_shares: int = 1,
+        mem_shares: int = 1,
+        dedicated: set = None,
+    ):
+        """Get the capacity of a DockerHost created with the given Docker
+        arguments. A resource without a limit is the one of the system divided
+        by the given number of shares.
+
+        :param cpu_shares: Number of DockerHosts without a CPU limit.
+        :type cpu_shares: int
+        :param mem_shares: Number of DockerHosts without a memory limit.
+        :type mem_shares: int
+        :param dedicated: Dedicated CPUs of the system.
+        :type dedicated: set
+        """
+        demand = demandOf(docker_args)
+        cpuset = demand.cpuset if demand.cpuset is not None else _hostCpuset()
+        return cls(
+            name,
+            demand.cpu if demand.cpu > 0 else len(cpuset) / max(1, cpu_shares),
+            demand.mem if demand.mem > 0 else _hostMemory() // max(1, mem_shares),
+            cpuset,
+            dedicated,
+        )
+
+    @property
+    def cpu_free(self) -> float:
+        return self.cpu - self.cpu_used
+
+    @property
+    def mem_free(self) -> int:
+        return self.mem - self.mem_used
+
+    def fits(self, demand: Demand) -> bool:
+        """The demand fits into the free resources."""
+        if demand.cpu > self.cpu_free + 1e-9 or demand.mem > self.mem_free:
+            return False
+        if demand.cpuset is not None:
+            return demand.cpuset.issubset(self.cpuset - self.dedicated)
+        # A container without dedicated CPUs runs on the shared ones.
+        return len(self.cpuset - self.dedicated) >= max(demand.cpus, 1)
+
+    def allocate(self, name: str, demand: Demand) -> set:
+        """Allocate the demand of a container.
+
+        :return: The dedicated CPUs assigned to the container.
+        :rtype: set
+        """
+        self.cpu_used += demand.cpu
+        self.mem_used += demand.mem
+        self.containers.add(name)
+        assigned = set()
+        if demand.cpus and demand.cpuset is None:
+            assigned = set(sorted(self.cpuset - self.dedicated)[: demand.cpus])
+            self.dedicated |= assigned
+        elif demand.cpus:
+            self.dedicated |= demand.cpuset
+        return assigned
+
+    def score(self, demand: Demand) -> float:
+        """Share of the free CPU and memory left after the demand is
+        allocated."""
+        return (self.cpu_free - demand.cpu) / self.cpu + (
+            self.mem_free - demand.mem
+        ) / self.mem
+
+
+class Scheduler:
+    """Choose DockerHosts for APP containers of an APPContainerManager.
+
+    Policies:
+
+    - binpack: The host with the least free resources left, so that hosts
+      are filled one by one.
+    - spread: The host with the most free resources left.
+
+    Affinity constraints keep a container on the same host as the given
+    containers and anti-affinity constraints keep it away from their hosts.
+    """
+
+    policies = ("binpack", "spread")
+
+    def __init__(self, mgr, policy: str = "binpack", dhosts: list = None):
+        """Create a Scheduler.
+
+        :param mgr: The APPContainerManager.
+        :param policy: Default policy, one of policies.
+        :type policy: str
+        :param dhosts: Names of candidate DockerHosts. All DockerHosts of the
+            network if it is None.
+        :type dhosts: list
+        """
+        self._checkPolicy(policy)
+        self.mgr = mgr
+        self.policy = policy
+        self.dhosts = dhosts
+
+    def _checkPolicy(self, policy: str):
+        if policy not in self.policies:
+            raise ValueError(
+                f"Unknown placement policy: {policy}. Supported: {self.policies}"
+            )
+
+    def _candidates(self) -> list:
+        if self.dhosts is not None:
+            return [self.mgr.net.get(n) for n in self.dhosts]
+        return [h for h in self.mgr.net.hosts if isinstance(h, DockerHost)]
+
+    def getResources(self) -> dict:
+        """Get the capacity and allocated resources of candidate DockerHosts.
+
+        :return: A dict from name of DockerHost to HostResources.
+        :rtype: dict
+        """
+        dhosts = self._candidates()
+        demands = [demandOf(dhost.docker_args) for dhost in dhosts]
+        cpu_shares = sum(1 for d in demands if d.cpu <= 0)
+        mem_shares = sum(1 for d in demands if d.mem <= 0)
+        dedicated = set()
+        resources = dict()
+        for dhost in dhosts:
+            resources[dhost.name] = HostResources.fromDockerArgs(
+                dhost.name, dhost.docker_args, cpu_shares, mem_shares, dedicated
+            )
+        # Dedicated CPUs are the cpusets of the running containers, which
+        # also include the ones placed by other schedulers.
+        for c in self.mgr._registry.snapshot():
+            res = resources.get(c.dhost, None)
+            if res is None:
+                continue
+            demand = demandOf(c.docker_args)
+            sample = self.mgr.monitor.latest(c.name)
+            if sample is not None:
+                demand = demand._replace(
+                    cpu=max(demand.cpu, sample.cpu / 100.0),
+                    mem=max(demand.mem, int(sample.mem * 1024**2)),
+                )
+            res.allocate(c.name, demand)
+        return resources
+
+    def _choose(self, resources, name, demand, policy, affinity, anti_affinity):
+        candidates = list()
+        for res in resources.values():
+            if affinity and not set(affinity).issubset(res.containers):
+                continue
+            if anti_affinity and set(anti_affinity) & res.containers:
+                continue
+            if res.fits(demand):
+                candidates.append(res)
+        if not candidates:
+            raise PlacementError(
+                name,
+                "no DockerHost with {:.2f} CPUs, {:.1f} MB memory and {} "
+                "dedicated CPUs left".format(
+                    demand.cpu, demand.mem / (1024**2), demand.cpus
+                ),
+            )
+        if policy == "binpack":
+            return min(candidates, key=lambda r: r.score(demand))
+        return max(candidates, key=lambda r: r.score(demand))
+
+    def _placeAll(self, specs: list, policy: str) -> list:
+        policy = policy or self.policy
+        self._checkPolicy(policy)
+        resources = self.getResources()
+        demands = [
+            demandOf(s.get("docker_args", None), s.get("cpus", 0)) for s in specs
+        ]
+        # Place large containers first, it packs tighter. The order of the
+        # returned placements is the one of the specs.
+        order = sorted(
+            range(len(specs)),
+            key=lambda i: (demands[i].cpus, demands[i].cpu, demands[i].mem),
+            reverse=True,
+        )
+        names = {s["name"] for s in specs}
+        placed = set()
+        placements = [None] * len(specs)
+        for i in order:
+            spec = specs[i]
+            name = spec["name"]
+            # Affinity to a member of the same batch which is not placed yet
+            # is applied when that member is placed.
+            affinity = [
+                a
+                for a in spec.get("affinity", None) or ()
+                if a in placed or a not in names
+            ]
+            res = self._choose(
+                resources,
+                name,
+                demands[i],
+                policy,
+                affinity,
+                spec.get("anti_affinity", None),
+            )
+            assigned = res.allocate(name, demands[i])
+            placed.add(name)
+            docker_args = dict(spec.get("docker_args", None) or dict())
+            if assigned:
+                docker_args["cpuset_cpus"] = formatCpuset(assigned)
+            placements[i] = Placement(name, res.name, docker_args, assigned)
+            debug(f"Place container {name} on {res.name} ({policy})\n")
+        # Deferred affinities: members placed before their affine partner
+        # must share its host.
+        hosts = {p.name: p.dhost for p in placements}
+        for spec in specs:
+            for a in spec.get("affinity", None) or ():
+                if a in hosts and hosts[a] != hosts[spec["name"]]:
+                    raise PlacementError(spec["name"], f"not on the same host as {a}")
+        return placements
+
+    def place(
+        self,
+        name: str,
+        docker_args: dict = None,
+        policy: str = None,
+        affinity: list = None,
+        anti_affinity: list = None,
+        cpus: int = 0,
+    ) -> Placement:
+        """Choose a DockerHost for one container.
+
+        :param name: Name of the container.
+        :type name: str
+        :param docker_args: Docker arguments of the container.
+        :type docker_args: dict
+        :param policy: Placement policy. The default policy is used if None.
+        :type policy: str
+        :param affinity: Names of containers which must be on the same host.
+        :type affinity: list
+        :param anti_affinity: Names of containers which must not be on the
+            same host.
+        :type anti_affinity: list
+        :param cpus: Number of dedicated CPUs. They are written to cpuset_cpus
+            of the returned docker_args.
+        :type cpus: int
+
+        :rtype: Placement
+        :raise comnetsemu.exceptions.PlacementError: No host fits.
+        """
+        spec = {
+            "name": name,
+            "docker_args": docker_args,
+            "affinity": affinity,
+            "anti_affinity": anti_affinity,
+            "cpus": cpus,
+        }
+        return self._placeAll([spec], policy)[0]
+
+    def placeChain(self, specs: list, policy: str = None) -> list:
+        """Choose DockerHosts for all containers of a service chain at once.
+
+        Either all containers are placed or PlacementError is raised.
+
+        :param specs: A list of dicts with the name and optional docker_args,
+            affinity, anti_affinity and cpus keys of each container, see
+            place().
+        :type specs: list
+        :param policy: Placement policy. The default policy is used if None.
+        :type policy: str
+
+        :return: A list of Placement in the order of specs.
+        :rtype: list
+        :raise comnetsemu.exceptions.PlacementError: A container does not fit.
+        """
+        return self._placeAll(specs, policy)
+
+    def addContainer(
+        self, name: str, dimage: str, dcmd: str, docker_args: dict = None, **kwargs
+    ):
+        """Place and add one container. kwargs are given to place().
+
+        :return: The added APPContainer.
+        """
+        p = self.place(name, docker_args, **kwargs)
+        return self.mgr.addContainer(name, p.dhost, dimage, dcmd, p.docker_args)
+
+    def addChain(self, specs: list, policy: str = None) -> list:
+        """Place and add all containers of a service chain. The containers are
+        created concurrently. If one of them fails, the others are removed.
+
+        :param specs: See placeChain(). Each dict also has the dimage and
+            dcmd keys.
+        :type specs: list
+        :param policy: Placement policy. The default policy is used if None.
+        :type policy: str
+
+        :return: A list of added APPContainer in the order of specs.
+        :rtype: list
+        """
+        placements = self.placeChain(specs, policy)
+        futures = list()
+        failure = None
+        for p, s in zip(placements, specs):
+            try:
+                futures.append(
+                    self.mgr.addContainerAsync(
+                        p.name, p.dhost, s["dimage"], s["dcmd"], p.docker_args
+                    )
+                )
+            except Exception as e:
+                # E.g. ContainerExists, the submitted ones are removed below.
+                failure = e
+                break
+        containers = list()
+        for f in futures:
+            try:
+                containers.append(f.result())
+            except Exception as e:
+                failure = failure or e
+        if failure is not None:
+            for c in containers:
+                self.mgr.removeContainer(c.name)
+            raise failure
+        return containers
@@ -0,0 +1,85 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+About: Benchmark the per-command latency of DockerHost.popen, cmd and pexec
+       with the docker and nsenter exec modes.
+
+Usage: sudo python3 ./bench_exec.py [-n NUM] [--json FILE]
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+
+from comnetsemu.clean import cleanup
+from comnetsemu.net import Containernet
+from mininet.log import info, setLogLevel
+
+
+def measure(func, num: int) -> dict:
+    """Call func num times and return latency statistics in milliseconds."""
+    lat = list()
+    for _ in range(num):
+        start = time.perf_counter()
+        func()
+        lat.append((time.perf_counter() - start) * 1e3)
+    lat.sort()
+    return {
+        "num": num,
+        "min": lat[0],
+        "mean": statistics.mean(lat),
+        "median": statistics.median(lat),
+        "p99": lat[min(len(lat) - 1, int(len(lat) * 0.99))],
+        "max": lat[-1],
+    }
+
+
+def bench_mode(exec_mode: str, num: int, dimage: str) -> dict:
+    """Run the benchmark on one DockerHost with the given exec mode."""
+    net = Containernet(controller=None)
+    try:
+        h1 = net.addDockerHost("h1", dimage=dimage, exec_mode=exec_mode)
+        net.start()
+        return {
+            "popen": measure(lambda: h1.popen("true").wait(), num),
+            "cmd": measure(lambda: h1.cmd("true"), num),
+            "pexec": measure(lambda: h1.pexec("true"), num),
+        }
+    finally:
+        net.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", type=int, default=100, help="Commands per method")
+    parser.add_argument("--dimage", default="dev_test", help="Docker image")
+    parser.add_argument("--json", default=None, help="Write results to file")
+    args = parser.parse_args()
+
+    results = dict()
+    for exec_mode in ("docker", "nsenter"):
+        info(f"*** Benchmark exec mode: {exec_mode}\n")
+        results[exec_mode] = bench_mode(exec_mode, args.n, args.dimage)
+
+    print(f"{'mode':<8} {'method':<6} {'mean':>9} {'median':>9} {'p99':>9} (ms)")
+    for exec_mode, methods in results.items():
+        for method, r in methods.items():
+            print(
+                f"{exec_mode:<8} {method:<6} {r['mean']:>9.3f} {r['median']:>9.3f} {r['p99']:>9.3f}"
+            )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    setLogLevel("info")
+    try:
+        main()
+    except KeyboardInterrupt:
+        cleanup()
+        sys.exit(1)
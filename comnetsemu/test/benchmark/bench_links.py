@@ -0,0 +1,98 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+About: Benchmark the creation of veth pairs with one ip process per link
+       (makeIntfPair) and with one ip batch for all links (makeIntfPairs).
+
+Usage: sudo python3 ./bench_links.py [-l 100 1000 5000] [--json FILE]
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from comnetsemu.clean import cleanup
+from comnetsemu.overrides import makeIntfPairFixed, makeIntfPairs
+from mininet.log import info, setLogLevel
+from mininet.node import Host
+
+
+def _pairs(num: int, node1, node2) -> list:
+    return [
+        (f"{node1.name}-eth{i}", f"{node2.name}-eth{i}", None, None, node1, node2)
+        for i in range(num)
+    ]
+
+
+def create_each(pairs: list):
+    for intf1, intf2, addr1, addr2, node1, node2 in pairs:
+        makeIntfPairFixed(intf1, intf2, addr1, addr2, node1, node2, deleteIntfs=False)
+
+
+def create_batch(pairs: list):
+    failed = makeIntfPairs(pairs)
+    if failed:
+        raise RuntimeError(f"Failed to create {len(failed)} veth pairs")
+    # Claim the created pairs like Link does.
+    create_each(pairs)
+
+
+def bench(method, num: int) -> float:
+    """Create num veth pairs between two new hosts and return the time in
+    seconds."""
+    h1, h2 = Host("bl1"), Host("bl2")
+    try:
+        pairs = _pairs(num, h1, h2)
+        start = time.perf_counter()
+        method(pairs)
+        duration = time.perf_counter() - start
+        # All veth pairs must exist.
+        created = h1.cmd("ls /sys/class/net/ | grep -c bl1-eth").strip()
+        if int(created or 0) != num:
+            raise RuntimeError(f"Only {created} of {num} veth pairs are created")
+        return duration
+    finally:
+        # The veth pairs are deleted with the network namespaces.
+        h1.terminate()
+        h2.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "-l",
+        type=int,
+        nargs="+",
+        default=[100, 1000, 5000],
+        help="Numbers of links",
+    )
+    parser.add_argument("--json", default=None, help="Write results to file")
+    args = parser.parse_args()
+
+    results = dict()
+    for num in args.l:
+        results[num] = dict()
+        for name, method in (("each", create_each), ("batch", create_batch)):
+            info(f"*** Create {num} veth pairs: {name}\n")
+            results[num][name] = bench(method, num)
+
+    print(f"{'links':>6} {'each':>9} {'batch':>9} {'speedup':>8} (s)")
+    for num, r in results.items():
+        print(
+            f"{num:>6} {r['each']:>9.3f} {r['batch']:>9.3f} {r['each'] / r['batch']:>8.1f}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    setLogLevel("info")
+    try:
+        main()
+    except KeyboardInterrupt:
+        cleanup()
+        sys.exit(1)
@@ -0,0 +1,261 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+About: Load test of the REST API of APPContainerManager.
+
+       A stub of the Docker API is used, so neither root privileges nor a
+       Docker daemon are required. The stub sleeps to emulate slow container
+       starts and removals. Requests per second and latencies of container
+       creation, status queries, listing and batch removal are measured.
+
+Usage: python3 ./bench_rest.py [-c CLIENTS] [-n REQUESTS] [--json FILE]
+"""
+
+import argparse
+import http.client
+import json
+import queue
+import statistics
+import threading
+import time
+import uuid
+
+import docker
+
+from comnetsemu import dockerapi
+from comnetsemu.net import APPContainerManager
+from comnetsemu.util import concurrentMap
+from mininet.log import setLogLevel
+
+START_DELAY_SECS = 0.2
+REMOVE_DELAY_SECS = 0.05
+
+
+class StubEventStream:
+    """Stream of container events like the one returned by client.events()."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def __iter__(self):
+        while True:
+            e = self._queue.get()
+            if e is None:
+                return
+            yield e
+
+    def put(self, e):
+        self._queue.put(e)
+
+    def close(self):
+        self._queue.put(None)
+
+
+class StubContainer:
+    def __init__(self, client, name, **kwargs):
+        self.client = client
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.attrs = {"State": {"Running": False, "Status": "created"}}
+
+    def start(self):
+        time.sleep(self.client.start_delay)
+        self.attrs["State"] = {"Running": True, "Status": "running"}
+        self.client.emit(self.id, "start")
+
+    def reload(self):
+        pass
+
+    def remove(self, force=False):
+        time.sleep(self.client.remove_delay)
+        with self.client.lock:
+            self.client.containers.by_name.pop(self.name, None)
+        self.client.emit(self.id, "destroy")
+
+
+class StubContainers:
+    def __init__(self, client):
+        self.client = client
+        self.by_name = dict()
+
+    def create(self, **kwargs):
+        with self.client.lock:
+            if kwargs["name"] in self.by_name:
+                raise docker.errors.APIError("Conflict")
+            c = StubContainer(self.client, **kwargs)
+            self.by_name[c.name] = c
+        return c
+
+    def get(self, name):
+        with self.client.lock:
+            for c in self.by_name.values():
+                if name in (c.id, c.name):
+                    return c
+        raise docker.errors.NotFound(name)
+
+
+class StubClient:
+    """Stub of docker.DockerClient with the API used by APPContainerManager."""
+
+    def __init__(self, start_delay, remove_delay):
+        self.start_delay = start_delay
+        self.remove_delay = remove_delay
+        self.lock = threading.Lock()
+        self.containers = StubContainers(self)
+        self.streams = list()
+
+    def events(self, decode=True, filters=None):
+        stream = StubEventStream()
+        self.streams.append(stream)
+        return stream
+
+    def emit(self, cid, action):
+        for stream in self.streams:
+            stream.put({"id": cid, "status": action})
+
+    def close(self):
+        pass
+
+
+class StubHost:
+    def __init__(self, name):
+        self.name = name
+        self.dins = StubContainer(None, name)
+
+
+class StubNet:
+    def __init__(self, host_num):
+        self.hosts = {f"h{i}": StubHost(f"h{i}") for i in range(1, host_num + 1)}
+
+    def get(self, name):
+        return self.hosts[name]
+
+
+def request(port: int, method: str, path: str, body=None):
+    """Send one request and return (status, data, latency in milliseconds)."""
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    start = time.perf_counter()
+    headers = {}
+    if body is not None:
+        body = json.dumps(body)
+        headers["Content-Type"] = "application/json"
+    conn.request(method, path, body=body, headers=headers)
+    resp = conn.getresponse()
+    data = resp.read()
+    latency = (time.perf_counter() - start) * 1e3
+    conn.close()
+    return resp.status, data, latency
+
+
+def run_phase(port: int, clients: int, reqs: list, expected: int) -> dict:
+    """Send the (method, path, body) requests with the given number of
+    concurrent clients."""
+    start = time.perf_counter()
+    results = concurrentMap(lambda r: request(port, *r), reqs, clients)
+    duration = time.perf_counter() - start
+    lat = list()
+    for ret, exc in results:
+        if exc is not None:
+            raise exc
+        status, data, latency = ret
+        if status != expected:
+            raise RuntimeError(f"Unexpected status {status}: {data}")
+        lat.append(latency)
+    lat.sort()
+    return {
+        "requests": len(lat),
+        "rps": len(lat) / duration,
+        "mean": statistics.mean(lat),
+        "p50": statistics.median(lat),
+        "p99": lat[min(len(lat) - 1, int(len(lat) * 0.99))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-c", type=int, default=16, help="Concurrent clients")
+    parser.add_argument("-n", type=int, default=200, help="Containers to create")
+    parser.add_argument("--hosts", type=int, default=8, help="Number of DockerHosts")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Workers creating containers"
+    )
+    parser.add_argument(
+        "--start-delay",
+        type=float,
+        default=START_DELAY_SECS,
+        help="Emulated start time of a container in seconds",
+    )
+    parser.add_argument("--json", default=None, help="Write results to file")
+    args = parser.parse_args()
+
+    dockerapi.setClient(StubClient(args.start_delay, REMOVE_DELAY_SECS))
+    mgr = APPContainerManager(StubNet(args.hosts), max_workers=args.workers)
+    mgr.runRESTServerThread("127.0.0.1", port=0, enable_log=False)
+    port = mgr._httpd.server_address[1]
+
+    names = [f"c{i}" for i in range(args.n)]
+    results = dict()
+    try:
+        results["create"] = run_phase(
+            port,
+            args.c,
+            [
+                (
+                    "POST",
+                    "/containers",
+                    {
+                        "name": name,
+                        "dhost": f"h{i % args.hosts + 1}",
+                        "dimage": "stub",
+                        "dcmd": "bash",
+                        "docker_args": {},
+                    },
+                )
+                for i, name in enumerate(names)
+            ],
+            202,
+        )
+        start = time.perf_counter()
+        while len(mgr.getAllContainers()) < args.n:
+            time.sleep(0.01)
+        results["create"]["all_running_secs"] = time.perf_counter() - start
+        results["status"] = run_phase(
+            port, args.c, [("GET", f"/containers/{n}", None) for n in names], 200
+        )
+        results["list"] = run_phase(
+            port, args.c, [("GET", "/containers", None)] * args.n, 200
+        )
+        bounds = list(range(0, args.n, max(1, args.n // args.c))) + [args.n]
+        results["batch_delete"] = run_phase(
+            port,
+            args.c,
+            [
+                ("DELETE", "/containers:batch", names[start:stop])
+                for start, stop in zip(bounds, bounds[1:])
+            ],
+            200,
+        )
+    finally:
+        mgr.stop()
+        dockerapi.closeClients()
+
+    print(f"{'phase':<13} {'reqs':>6} {'req/s':>9} {'p50':>9} {'p99':>9} (ms)")
+    for phase, r in results.items():
+        print(
+            f"{phase:<13} {r['requests']:>6} {r['rps']:>9.1f} {r['p50']:>9.3f} {r['p99']:>9.3f}"
+        )
+    print(
+        "All containers running {:.3f}s after the last creation request".format(
+            results["create"]["all_running_secs"]
+        )
+    )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    setLogLevel("warning")
+    main()
@@ -0,0 +1,149 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+About: Benchmark the creation latency and memory footprint of DockerHost
+       containers with different container runtimes.
+
+       For each runtime, N containers are created one by one with the
+       arguments of DockerHosts and removed concurrently afterwards. The memory
+       footprint per container is the increase of the used memory of the
+       system (MemTotal - MemAvailable), so it includes e.g. the shim
+       processes of Docker. Each runtime runs in its own process.
+
+       The oci runtime needs crun or runc. Its image is unpacked from the
+       archive given with --archive (created by docker save) if it is not
+       unpacked yet.
+
+Usage: sudo python3 ./bench_runtime.py [-n NUM] [--runtimes docker oci]
+           [--archive FILE] [--json FILE]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+from bench_exec import measure
+
+from comnetsemu import dockerapi
+from comnetsemu.clean import cleanup
+from comnetsemu.node import DockerHost
+from comnetsemu.util import concurrentMap
+from mininet.log import info, setLogLevel
+
+# Time to wait before the used memory is read, e.g. for lazy allocations.
+SETTLE_SECS = 2.0
+
+
+def usedMemory() -> int:
+    """Get the used memory of the system in bytes."""
+    meminfo = dict()
+    with open("/proc/meminfo", "r") as f:
+        for line in f:
+            key, value = line.split(":", 1)
+            meminfo[key] = int(value.split()[0]) * 1024
+    return meminfo["MemTotal"] - meminfo["MemAvailable"]
+
+
+def runOne(args) -> dict:
+    """Create and remove the containers with one runtime."""
+    dockerapi.setRuntime(args.runtimes[0])
+    client = dockerapi.getClient()
+    archives = {args.dimage: args.archive} if args.archive else None
+    dockerapi.ensureImages([args.dimage], archives)
+    # Start the event monitor before it is used by the first container.
+    dockerapi.getEventMonitor()
+
+    containers = list()
+    names = iter(range(args.n))
+
+    def _create():
+        docker_args = DockerHost.buildDockerArgs(
+            f"bench-{next(names)}", args.dimage, None, None
+        )
+        containers.append(DockerHost.runContainer(client, docker_args))
+
+    time.sleep(SETTLE_SECS)
+    mem_before = usedMemory()
+    try:
+        create = measure(_create, args.n)
+        time.sleep(SETTLE_SECS)
+        mem_after = usedMemory()
+    finally:
+        start = time.perf_counter()
+        concurrentMap(lambda c: c.remove(force=True), containers)
+        remove = time.perf_counter() - start
+        dockerapi.closeClients()
+    return {
+        "runtime": args.runtimes[0],
+        "n": args.n,
+        "create": create,
+        "remove_total": remove,
+        "memory_per_container_mb": (mem_after - mem_before) / args.n / 1024**2,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("-n", type=int, default=50, help="Containers per runtime")
+    parser.add_argument(
+        "--runtimes",
+        nargs="+",
+        default=["docker", "oci"],
+        choices=list(dockerapi.RUNTIMES),
+        help="Container runtimes",
+    )
+    parser.add_argument("--dimage", default="dev_test", help="Docker image")
+    parser.add_argument(
+        "--archive", default=None, help="Archive of the image for the oci runtime"
+    )
+    parser.add_argument("--json", default=None, help="Write results to file")
+    # Used to run one runtime in a child process.
+    parser.add_argument("--one", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.one:
+        json.dump(runOne(args), sys.stdout)
+        return
+
+    results = list()
+    for runtime in args.runtimes:
+        info(f"*** Benchmark runtime: {runtime}\n")
+        cmd = [sys.executable, __file__, "--one", f"-n={args.n}"]
+        cmd += [f"--runtimes={runtime}", f"--dimage={args.dimage}"]
+        if args.archive:
+            cmd.append(f"--archive={args.archive}")
+        ret = subprocess.run(
+            cmd, stdout=subprocess.PIPE, universal_newlines=True, check=False
+        )
+        if ret.returncode != 0:
+            print(f"Failed with exit code {ret.returncode}")
+            continue
+        results.append(json.loads(ret.stdout))
+
+    print(
+        f"{'runtime':<8} {'mean':>9} {'median':>9} {'p99':>9} (ms) "
+        f"{'remove(s)':>10} {'MB/container':>13}"
+    )
+    for r in results:
+        c = r["create"]
+        print(
+            f"{r['runtime']:<8} {c['mean']:>9.3f} {c['median']:>9.3f} {c['p99']:>9.3f}      "
+            f"{r['remove_total']:>10.3f} {r['memory_per_container_mb']:>13.2f}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    setLogLevel("warning")
+    try:
+        main()
+    except KeyboardInterrupt:
+        cleanup()
+        sys.exit(1)
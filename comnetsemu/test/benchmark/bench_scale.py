@@ -0,0 +1,352 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+
+"""
+About: Startup and teardown benchmark of Containernet at scale.
+
+       A network with N DockerHosts is built, started, optionally loaded with
+       APP containers and stopped for each given N. Hosts are attached to
+       switches (--hosts-per-switch) which are connected in a line. The wall
+       time of each phase, the peak RSS, the number of processes started by
+       build and start and the number of Docker API calls are recorded. Each
+       network runs in its own process, so the peak RSS of one size does not
+       leak into the next.
+
+       Phases (nested phases are included in their parents):
+       - build: Containernet.build()
+         - container_run: Start the containers of all DockerHosts.
+         - shell_attach: Add the hosts and attach their shells.
+         - switches: Add the switches.
+         - links: Add all links, includes veth and tc.
+           - veth: Create the veth pairs in batch.
+           - tc: Configure traffic control of TCLinks (--bw).
+         - configure: Configure IP addresses of the hosts.
+       - start: Containernet.start()
+         - controller_connect: Wait for the switches to connect (--controller).
+       - app_deploy: Add the APP containers concurrently.
+       - app_remove: Remove the APP containers.
+       - stop: Containernet.stop(), its phases are in stop_phases.
+
+       --runtime selects the container runtime of DockerHosts and APP
+       containers (comnetsemu.runtime). With the netns runtime, they are
+       processes in new namespaces created with unshare, so it runs without a
+       Docker daemon, but still needs root privileges, iproute2 and the
+       switch of Mininet. API calls are only counted for Docker.
+
+       With --lazy-shell, DockerHosts start their shells on first use, so no
+       shell is started by build.
+
+Usage: sudo python3 ./bench_scale.py [--hosts 10 50 100 500] [--apps 0 100]
+           [--runtime netns] [--lazy-shell] [--json FILE]
+"""
+
+import argparse
+import json
+import math
+import os
+import resource
+import signal
+import subprocess
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import partial
+from urllib.parse import urlparse
+
+from comnetsemu import dockerapi
+from comnetsemu import net as cnet
+from comnetsemu.clean import cleanup
+from comnetsemu.link import TCLink
+from comnetsemu.net import Containernet, VNFManager
+from comnetsemu.node import DockerHost
+from comnetsemu.util import PhaseTimer
+from mininet.link import TCIntf
+from mininet.log import setLogLevel
+from mininet.net import Mininet
+from mininet.node import Controller, OVSBridge, OVSSwitch
+from mininet.topo import Topo
+
+DIMAGE = "dev_test"
+HOSTS_PER_SWITCH = 10
+
+# Path segments after these collections are IDs or names, except the ones in
+# API_ACTIONS.
+API_COLLECTIONS = ("containers", "exec", "images", "networks", "volumes")
+API_ACTIONS = ("create", "json", "load", "prune")
+
+
+def apiCallKey(method: str, url: str) -> str:
+    """Get the key of an API call like "POST /containers/{id}/start"."""
+    parts = urlparse(url).path.strip("/").split("/")
+    if parts and parts[0].startswith("v1."):
+        parts = parts[1:]
+    for i in range(1, len(parts)):
+        if parts[i - 1] in API_COLLECTIONS and parts[i] not in API_ACTIONS:
+            parts[i] = "{id}"
+    return "{} /{}".format(method.upper(), "/".join(parts))
+
+
+def countCalls(client) -> Counter:
+    """Count the HTTP requests of a Docker-py client by API call."""
+    calls = Counter()
+    request = client.api.request
+
+    def _request(method, url, *args, **kwargs):
+        calls[apiCallKey(method, url)] += 1
+        return request(method, url, *args, **kwargs)
+
+    client.api.request = _request
+    return calls
+
+
+@contextmanager
+def instrument(timer: PhaseTimer):
+    """Measure the phases of build and start by wrapping the methods."""
+    targets = [
+        (Containernet, "_startDockerHosts", "container_run"),
+        (Containernet, "addHost", "shell_attach"),
+        (Mininet, "addSwitch", "switches"),
+        (Mininet, "addLink", "links"),
+        (cnet, "makeIntfPairs", "veth"),
+        (TCIntf, "config", "tc"),
+        (Mininet, "configHosts", "configure"),
+        (Mininet, "waitConnected", "controller_connect"),
+    ]
+    originals = list()
+    for owner, attr, phase in targets:
+        orig = owner.__dict__[attr]
+
+        def _wrapper(*args, _orig=orig, _phase=phase, **kwargs):
+            with timer.phase(_phase):
+                return _orig(*args, **kwargs)
+
+        originals.append((owner, attr, orig))
+        setattr(owner, attr, _wrapper)
+    try:
+        yield
+    finally:
+        for owner, attr, orig in originals:
+            setattr(owner, attr, orig)
+
+
+def countProcesses() -> int:
+    """Count the processes of the system."""
+    return sum(1 for p in os.listdir("/proc") if p.isdigit())
+
+
+class ScaleTopo(Topo):
+    def build(self, hosts: int, hosts_per_switch: int, bw: float = None):
+        link_opts = {"bw": bw} if bw else {}
+        switches = [
+            self.addSwitch(f"s{i}")
+            for i in range(1, math.ceil(hosts / hosts_per_switch) + 1)
+        ]
+        for prev, cur in zip(switches, switches[1:]):
+            self.addLink(prev, cur, **link_opts)
+        for i in range(hosts):
+            h = self.addHost(f"h{i + 1}")
+            self.addLink(h, switches[i // hosts_per_switch], **link_opts)
+
+
+def runOne(args) -> dict:
+    """Build, start and stop one network and return its measurements."""
+    dockerapi.setRuntime(args.runtime)
+    if dockerapi.RUNTIMES[args.runtime] is None:
+        calls = countCalls(dockerapi.getClient())
+    else:
+        calls = Counter()
+    dhost = partial(
+        DockerHost,
+        dimage=DIMAGE,
+        exec_mode=args.exec_mode,
+        lazy_shell=args.lazy_shell,
+    )
+    topo = ScaleTopo(
+        hosts=args.hosts, hosts_per_switch=args.hosts_per_switch, bw=args.bw
+    )
+    params = dict(
+        topo=topo, host=dhost, build=False, build_workers=args.workers, autoSetMacs=True
+    )
+    if args.bw:
+        params["link"] = TCLink
+    if args.controller:
+        params.update(switch=OVSSwitch, controller=Controller, waitConnected=True)
+    else:
+        params.update(switch=OVSBridge, controller=None)
+
+    timer = PhaseTimer()
+    processes = countProcesses()
+    start = time.time()
+    net = Containernet(**params)
+    mgr = None
+    try:
+        with instrument(timer):
+            with timer.phase("build"):
+                net.build()
+            with timer.phase("start"):
+                net.start()
+        processes = countProcesses() - processes
+        if args.apps:
+            mgr = VNFManager(net, max_workers=args.workers)
+            with timer.phase("app_deploy"):
+                futures = [
+                    mgr.addContainerAsync(
+                        f"app{i}", f"h{i % args.hosts + 1}", DIMAGE, "bash"
+                    )
+                    for i in range(args.apps)
+                ]
+                for f in futures:
+                    f.result()
+    finally:
+        if mgr is not None:
+            with timer.phase("app_remove"):
+                mgr.stop()
+        with timer.phase("stop"):
+            net.stop()
+    total = time.time() - start
+
+    links = args.hosts + math.ceil(args.hosts / args.hosts_per_switch) - 1
+    return {
+        "hosts": args.hosts,
+        "switches": math.ceil(args.hosts / args.hosts_per_switch),
+        "links": links,
+        "apps": args.apps,
+        "runtime": args.runtime,
+        "lazy_shell": args.lazy_shell,
+        "total": total,
+        "phases": timer.durations,
+        "stop_phases": net.stop_times,
+        "processes": processes,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "api_calls_total": sum(calls.values()),
+        "api_calls": dict(calls.most_common()),
+    }
+
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--hosts",
+        type=int,
+        nargs="+",
+        default=[10, 50, 100, 500],
+        help="Numbers of DockerHosts",
+    )
+    parser.add_argument(
+        "--apps", type=int, nargs="+", default=[0], help="Numbers of APP containers"
+    )
+    parser.add_argument(
+        "--hosts-per-switch",
+        type=int,
+        default=HOSTS_PER_SWITCH,
+        help="DockerHosts attached to one switch",
+    )
+    parser.add_argument(
+        "--bw", type=float, default=None, help="Use TCLinks with this bandwidth"
+    )
+    parser.add_argument(
+        "--controller",
+        action="store_true",
+        help="Use OVS switches connected to a controller instead of bridges",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Workers to start containers"
+    )
+    parser.add_argument(
+        "--runtime",
+        default="docker",
+        choices=tuple(dockerapi.RUNTIMES),
+        help="Container runtime of DockerHosts and APP containers",
+    )
+    parser.add_argument(
+        "--exec-mode",
+        default=None,
+        choices=DockerHost.exec_modes,
+        help="Exec mode of DockerHosts, the default one of the runtime if unset",
+    )
+    parser.add_argument(
+        "--lazy-shell",
+        action="store_true",
+        help="Start the shells of DockerHosts on first use",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="Runs of each configuration"
+    )
+    parser.add_argument("--json", default=None, help="Write results to file")
+    # Used by the sweep to run one configuration in a child process.
+    parser.add_argument("--one", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parseArgs()
+    if args.one:
+        args.hosts, args.apps = args.hosts[0], args.apps[0]
+        json.dump(runOne(args), sys.stdout)
+        return
+    # The cleanups after a failed run use the same runtime.
+    dockerapi.setRuntime(args.runtime)
+
+    common = [
+        f"--hosts-per-switch={args.hosts_per_switch}",
+        f"--runtime={args.runtime}",
+    ]
+    if args.exec_mode:
+        common.append(f"--exec-mode={args.exec_mode}")
+    if args.bw:
+        common.append(f"--bw={args.bw}")
+    if args.workers:
+        common.append(f"--workers={args.workers}")
+    for flag in ("controller", "lazy_shell"):
+        if getattr(args, flag):
+            common.append(f"--{flag.replace('_', '-')}")
+
+    results = list()
+    for hosts in args.hosts:
+        for apps in args.apps:
+            for _ in range(args.repeat):
+                print(f"*** {hosts} DockerHosts, {apps} APP containers", flush=True)
+                ret = subprocess.run(
+                    [sys.executable, __file__, "--one", f"--hosts={hosts}"]
+                    + [f"--apps={apps}"]
+                    + common,
+                    stdout=subprocess.PIPE,
+                    universal_newlines=True,
+                    check=False,
+                )
+                if ret.returncode != 0:
+                    print(f"Failed with exit code {ret.returncode}")
+                    cleanup()
+                    continue
+                results.append(json.loads(ret.stdout))
+
+    cols = ("build", "start", "app_deploy", "app_remove", "stop")
+    print(
+        f"{'hosts':>6} {'links':>6} {'apps':>5} "
+        + " ".join(f"{c:>10}" for c in cols)
+        + f" {'total':>8} {'procs':>6} {'rss(MB)':>8} {'api':>7}"
+    )
+    for r in results:
+        print(
+            f"{r['hosts']:>6} {r['links']:>6} {r['apps']:>5} "
+            + " ".join(f"{r['phases'].get(c, 0.0):>10.3f}" for c in cols)
+            + f" {r['total']:>8.3f} {r['processes']:>6} {r['peak_rss_mb']:>8.1f}"
+            + f" {r['api_calls_total']:>7}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    setLogLevel("warning")
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    try:
+        main()
+    except KeyboardInterrupt:
+        cleanup()
+        sys.exit(1)
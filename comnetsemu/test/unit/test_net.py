@@ -7,16 +7,37 @@
 
 import os
 import functools
+import json
+import signal
 import sys
+import tempfile
 import time
 import unittest
 
+import docker
 import pyroute2
 import requests
 
+from comnetsemu import overrides, trace
+from comnetsemu.cgroup import CgroupStats, calculateUsage
 from comnetsemu.clean import cleanup
+from comnetsemu.dockerapi import (
+    containerRunning,
+    ensureImages,
+    getClient,
+    getEventMonitor,
+    setRuntime,
+)
+from comnetsemu.exceptions import (
+    ContainerExists,
+    MissingDockerImages,
+    PlacementError,
+)
+from comnetsemu.link import TCLink
+from comnetsemu.monitor import ResourceMonitor, calculateCpuPercent
 from comnetsemu.net import Containernet, VNFManager
 from comnetsemu.node import DockerHost
+from comnetsemu.scheduler import HostResources, Scheduler, demandOf, parseCpuset
 from mininet.log import setLogLevel
 from mininet.node import OVSBridge
 from mininet.topo import Topo
@@ -68,6 +89,34 @@ def test_ping(self):
         ret = self.net.pingAll()
         self.assertEqual(ret, 0.0)
 
+    def test_dockerhost_startup(self):
+        self.assertEqual(
+            sorted(self.net.dhost_startup_times.keys()),
+            [f"h{i}" for i in range(1, HOST_NUM + 1)],
+        )
+        for h in self.net.hosts:
+            self.assertTrue(h._is_container_running())
+            self.assertGreater(self.net.dhost_startup_times[h.name], 0.0)
+
+    def test_batch_links(self):
+        self.assertEqual(overrides._created_pairs, dict())
+        for h in self.net.hosts:
+            intf = h.defaultIntf()
+            self.assertEqual(intf.name, f"{h.name}-eth0")
+            self.assertIn(intf.MAC(), h.cmd(f"ip link show {intf.name}"))
+        s1 = self.net.get("s1")
+        self.assertEqual(sorted(s1.ports.values()), list(range(1, HOST_NUM + 1)))
+
+    def test_image_check(self):
+        report = self.net.image_report
+        self.assertEqual(list(report.keys()), ["dev_test"])
+        self.assertEqual(report["dev_test"]["containers"], HOST_NUM)
+        self.assertIsNone(report["dev_test"]["mem_limit"])
+        self.assertGreater(report["dev_test"]["size"], 0)
+        with self.assertRaises(MissingDockerImages) as cm:
+            ensureImages(["dev_test", "no_such_image"])
+        self.assertEqual(cm.exception.images, ["no_such_image"])
+
     def test_container_crud(self):
         with self.assertRaises(KeyError):
             self.mgr.addContainer("foo", "foo", "dev_test", "/bin/bash", {})
@@ -89,6 +138,7 @@ def test_container_crud(self):
                 cname_list.append(f"c{i}{j}")
         cname_list_get = self.mgr.getAllContainers()
         self.assertEqual(cname_list, cname_list_get)
+        self.assertEqual(cname_list, self.net._appcontainers)
 
         # Check docker_args works
         c11_ins = self.mgr._getDockerIns("c11")
@@ -103,6 +153,8 @@ def test_container_crud(self):
         for cname in cname_list:
             c_ins = self.mgr._getDockerIns(cname)
             self.assertTrue(c_ins is None)
+        self.assertEqual(self.mgr.getAllContainers(), [])
+        self.assertEqual(self.mgr.getContainersDhost("h1"), [])
 
         d1 = self.mgr.addContainer("d1", "h1", "dev_test", "bash", docker_args={})
         d1_get = self.mgr.getContainerInstance("d1")
@@ -132,6 +184,105 @@ def test_container_crud(self):
                 raise ValueError("Unkown mount is added!")
         self.mgr.removeContainer("d1")
 
+    def test_container_async(self):
+        with self.assertRaises(KeyError):
+            self.mgr.addContainerAsync("foo", "foo", "dev_test", "/bin/bash")
+        futures = [
+            self.mgr.addContainerAsync(f"a{i}", f"h{i}", "dev_test", "/bin/bash")
+            for i in range(1, HOST_NUM + 1)
+        ]
+        # The registry is not blocked by pending creations.
+        self.mgr.getAllContainers()
+        for i, f in enumerate(futures, 1):
+            c = f.result()
+            self.assertEqual(c.name, f"a{i}")
+            self.assertTrue(c.dins.attrs["State"]["Running"])
+            self.assertIs(self.mgr.getContainerInstance(c.name), c)
+        self.assertEqual(
+            sorted(self.mgr.getAllContainers()),
+            [f"a{i}" for i in range(1, HOST_NUM + 1)],
+        )
+        with self.assertRaises(ContainerExists):
+            self.mgr.addContainerAsync("a1", "h1", "dev_test", "/bin/bash")
+        # A failed creation is reported once.
+        with self.assertRaises(docker.errors.APIError):
+            self.mgr.addContainerAsync("f1", "h1", "foo", "/bin/bash").result()
+        self.assertEqual(self.mgr.getContainerStatus("f1")["status"], "failed")
+        self.assertIsNone(self.mgr.getContainerStatus("f1"))
+        for i in range(1, HOST_NUM + 1):
+            self.mgr.removeContainer(f"a{i}")
+        self.assertEqual(self.mgr.getAllContainers(), [])
+
+    def test_container_pool(self):
+        self.mgr.warmPool("h1", "dev_test", 2, wait=True)
+        self.assertEqual(self.mgr.getPoolStatus(), {("h1", "dev_test"): 2})
+        c1 = self.mgr.addContainer(
+            "p1", "h1", "dev_test", "touch /tmp/started", {"cpu_quota": 20000}
+        )
+        c1.dins.reload()
+        # The idle container is renamed and runs the command with exec.
+        self.assertEqual(c1.dins.name, "p1")
+        self.assertEqual(c1.dins.attrs["Config"]["Cmd"], [self.mgr.pool_cmd])
+        self.assertEqual(c1.dins.attrs["State"]["Status"], "running")
+        self.assertEqual(c1.dins.attrs["HostConfig"]["CpuQuota"], 20000)
+        self.assertEqual(c1.dins.exec_run("ls /tmp/started").exit_code, 0)
+        # Containers with other arguments are created from scratch.
+        c2 = self.mgr.addContainer("p2", "h1", "dev_test", "bash", {"ports": {}})
+        self.assertEqual(c2.dins.attrs["Config"]["Cmd"], ["bash"])
+        # Shrink the pool, the surplus is removed.
+        self.mgr.warmPool("h1", "dev_test", 0, wait=True)
+        self.assertEqual(self.mgr.getPoolStatus(), {("h1", "dev_test"): 0})
+        self.mgr.removeContainer("p1")
+        self.mgr.removeContainer("p2")
+
+    @unittest.skipIf((os.cpu_count() or 1) < 4, "Requires at least 4 CPUs")
+    def test_scheduler(self):
+        # DockerHosts without a cpuset share the CPUs of the system.
+        dhosts = ["h4", "h5"]
+        for name in dhosts:
+            self.net.addDockerHost(name, dimage="dev_test")
+        sched = Scheduler(self.mgr, policy="spread", dhosts=dhosts)
+        specs = [
+            {"name": f"s{i}", "dimage": "dev_test", "dcmd": "bash", "cpus": 1}
+            for i in range(1, 3)
+        ]
+        placements = sched.placeChain(specs)
+        self.assertNotEqual(placements[0].dhost, placements[1].dhost)
+        self.assertFalse(placements[0].cpus & placements[1].cpus)
+        placements = sched.placeChain(specs, policy="binpack")
+        self.assertEqual(placements[0].dhost, placements[1].dhost)
+        self.assertNotEqual(placements[0].cpus, placements[1].cpus)
+        specs[1]["anti_affinity"] = ["s1"]
+        containers = sched.addChain(specs, policy="binpack")
+        self.assertNotEqual(containers[0].dhost, containers[1].dhost)
+        self.assertEqual(
+            containers[0].dins.attrs["HostConfig"]["CpusetCpus"],
+            containers[0].docker_args["cpuset_cpus"],
+        )
+        # The dedicated CPUs of the containers are not given out again by
+        # another scheduler.
+        used = set()
+        for c in containers:
+            used |= parseCpuset(c.docker_args["cpuset_cpus"])
+        p = Scheduler(self.mgr, dhosts=dhosts).place("s3", cpus=1)
+        self.assertFalse(p.cpus & used)
+        with self.assertRaises(PlacementError):
+            sched.place("s3", {"mem_limit": "1000000g"})
+        # Shared containers need a CPU which is not dedicated.
+        res = HostResources("h0", 2.0, 1024**3, {0, 1})
+        res.allocate("d1", demandOf({}, cpus=2))
+        self.assertFalse(res.fits(demandOf({"mem_limit": "64m"})))
+        for c in containers:
+            self.mgr.removeContainer(c.name)
+        # Nothing of a chain with a taken name is left.
+        self.mgr.addContainer("s2", "h4", "dev_test", "bash", docker_args={})
+        with self.assertRaises(ContainerExists):
+            sched.addChain(specs)
+        self.assertIsNone(self.mgr.getContainerInstance("s1"))
+        self.mgr.removeContainer("s2")
+        for name in dhosts:
+            self.net.delHost(self.net.get(name))
+
     @unittest.skipIf(len(sys.argv) == 3 and sys.argv[2] == "-quick", "Schneller!")
     def test_container_isolation(self):
         h1 = self.net.get("h1")
@@ -162,12 +313,78 @@ def test_container_isolation(self):
             self.assertTrue(clt_bw > 0.0)
             self.mgr.removeContainer(c1.name)
 
-    # def test_container_migration(self):
-    #     self.mgr.addContainer("c1", "h1", "dev_test", "/bin/bash", {})
-    #     self.mgr.checkpoint("c1")
-    #     from comnetsemu.cli import CLI
-    #     CLI(self.net)
-    #     self.mgr.removeContainer("c1")
+    def test_resource_monitor(self):
+        received = list()
+        self.mgr.subscribeResourceStats(lambda name, s: received.append(name))
+        self.mgr.startMonitor()
+        c1 = self.mgr.addContainer("m1", "h1", "dev_test", "bash", {})
+        samples = self.mgr.monitor.waitSamples("m1", 2, timeout=10)
+        self.assertEqual(len(samples), 2)
+        self.assertGreater(samples[1].timestamp, samples[0].timestamp)
+        self.assertGreater(samples[0].mem, 0.0)
+        self.assertEqual(self.mgr.getResourceSamples("m1", 1), samples[1:])
+        self.assertIn("m1", received)
+        self.mgr.stopMonitor()
+        self.assertFalse(self.mgr.monitor.watching("m1"))
+        # Only monitored during the call.
+        usages = self.mgr.monResourceStats(c1.name, sample_num=2)
+        self.assertEqual(len(usages), 2)
+        self.assertFalse(self.mgr.monitor.watching("m1"))
+        self.mgr.removeContainer(c1.name)
+
+    def test_cgroup_accounting(self):
+        stats = self.net.sampleCgroups()
+        self.assertEqual(sorted(stats), [f"h{i}" for i in range(1, HOST_NUM + 1)])
+        for s in stats.values():
+            self.assertGreater(s.cpu_ns, 0)
+            self.assertGreater(s.mem_bytes, 0)
+        h1 = self.net.get("h1")
+        h1.cmd("timeout 0.5 sh -c 'while true; do :; done'")
+        usage = calculateUsage(stats["h1"], self.net.sampleCgroups(["h1"])["h1"])
+        self.assertGreater(usage.cpu, 0.0)
+        # Both sources report two busy CPUs as 200 percent.
+        usage = calculateUsage(
+            CgroupStats(0, None, None, None, 0.0),
+            CgroupStats(2 * 10**9, None, None, None, 1.0),
+        )
+        stats = {
+            "cpu_stats": {
+                "cpu_usage": {"total_usage": 2 * 10**9},
+                "system_cpu_usage": 4 * 10**9,
+                "online_cpus": 4,
+            },
+            "precpu_stats": {"cpu_usage": {"total_usage": 0}, "system_cpu_usage": 0},
+        }
+        self.assertEqual((usage.cpu, calculateCpuPercent(stats)), (200.0, 200.0))
+
+        monitor = self.mgr.monitor
+        self.mgr.monitor = ResourceMonitor(source="cgroup", interval=0.1)
+        try:
+            self.mgr.addContainer("m1", "h1", "dev_test", "bash", {})
+            usages = self.mgr.monResourceStats("m1", sample_num=3, sample_period=0.1)
+            self.assertEqual(len(usages), 3)
+            self.assertGreater(usages[0][1], 0.0)
+            self.mgr.removeContainer("m1")
+        finally:
+            self.mgr.monitor.stop()
+            self.mgr.monitor = monitor
+
+    def test_container_migration(self):
+        if not self.mgr.dclt.info().get("ExperimentalBuild", False):
+            self.skipTest("Checkpoint requires experimental features of Docker.")
+        c1 = self.mgr.addContainer("c1", "h1", "dev_test", "/bin/bash", {})
+        with self.assertRaises(ValueError):
+            self.mgr.migrateContainer("c1", "h1")
+        report = self.mgr.migrateContainer("c1", "h2", trial_checkpoints=1)
+        self.assertEqual((report["src"], report["dst"]), ("h1", "h2"))
+        self.assertGreater(report["downtime"], 0.0)
+        self.assertGreater(report["size"], 0)
+        c1_new = self.mgr.getContainerInstance("c1")
+        self.assertIsNot(c1_new, c1)
+        self.assertEqual(c1_new.dhost, "h2")
+        self.assertEqual(self.mgr.getContainersDhost("h1"), [])
+        self.assertTrue(c1_new.dins.attrs["State"]["Running"])
+        self.mgr.removeContainer("c1")
 
     def test_appcontainermanager_rest_api(self):
         ip_route = pyroute2.IPRoute()
@@ -203,9 +420,18 @@ def test_appcontainermanager_rest_api(self):
         # Test the lock: c2 must be created earlier than c1.
         self.mgr.addContainer("c2", "h1", "dev_test", "bash", docker_args={})
         r = requests.post(base_url, json=cdata)
-        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.status_code, 202)
+        self.assertEqual(r.headers["Location"], "/containers/c1")
+        self._wait_rest_status(base_url + "/c1")
         r = requests.get(base_url)
         self.assertEqual(r.json(), ["c2", "c1"])
+        r = requests.get(base_url + "/c1")
+        self.assertEqual(r.json()["status"], "running")
+        self.assertEqual(r.json()["dhost"], "h1")
+        r = requests.post(base_url, json=cdata)
+        self.assertEqual(r.status_code, 409)
+        r = requests.get(base_url + "/c3")
+        self.assertEqual(r.status_code, 404)
         r = requests.delete(base_url + "/c3")
         self.assertEqual(r.status_code, 400)
         r = requests.delete(base_url + "/foo/bar")
@@ -213,8 +439,124 @@ def test_appcontainermanager_rest_api(self):
         r = requests.delete(base_url + "/c1")
         self.assertEqual(r.status_code, 200)
 
+        # Batch endpoints
+        batch_url = base_url + ":batch"
+        r = requests.post(batch_url, json=[cdata, {"name": "c3"}])
+        self.assertEqual(r.status_code, 400)
+        batch = [dict(cdata, name=f"b{i}", dhost=f"h{i}") for i in (1, 2)]
+        batch.append(dict(cdata, name="b3", dhost="foo"))
+        r = requests.post(batch_url, json=batch)
+        self.assertEqual(r.status_code, 202)
+        ret = r.json()
+        self.assertEqual(ret[0], {"name": "b1", "status_url": "/containers/b1"})
+        self.assertIn("error", ret[2])
+        for item in ret[:2]:
+            self._wait_rest_status(base_url + "/" + item["name"])
+        self.assertEqual(self.mgr.getAllContainers(), ["c2", "b1", "b2"])
+        r = requests.delete(batch_url, json=["b1", "b2", "b3"])
+        self.assertEqual(r.status_code, 200)
+        ret = r.json()
+        self.assertEqual(ret["b1"], "removed")
+        self.assertEqual(ret["b2"], "removed")
+        self.assertNotEqual(ret["b3"], "removed")
+
         self.mgr.removeContainer("c2")
 
+    @staticmethod
+    def _wait_rest_status(url, status="running"):
+        for _ in range(100):
+            r = requests.get(url)
+            if r.status_code == 200 and r.json()["status"] == status:
+                return
+            time.sleep(0.1)
+        raise TimeoutError(url)
+
+
+class TestContainernetStop(unittest.TestCase):
+    def test_stop(self):
+        dhost_test = functools.partial(DockerHost, dimage="dev_test")
+        net = Containernet(
+            topo=TestTopo(HOST_NUM), switch=OVSBridge, host=dhost_test, controller=None
+        )
+        net.start()
+        dins_list = [h.dins for h in net.hosts]
+        net.stop()
+        self.assertEqual(
+            list(net.stop_times.keys()),
+            ["controllers", "containers", "links", "switches", "hosts"],
+        )
+        for dins in dins_list:
+            with self.assertRaises(docker.errors.NotFound):
+                dins.reload()
+        for h in net.hosts:
+            self.assertIsNone(h.shell)
+            self.assertEqual(h.intfList(), [])
+        links = os.listdir("/sys/class/net/")
+        self.assertFalse(any(link.startswith("s1-eth") for link in links))
+
+    def test_trace(self):
+        dhost_test = functools.partial(DockerHost, dimage="dev_test")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "trace.json")
+            net = Containernet(
+                topo=TestTopo(HOST_NUM),
+                switch=OVSBridge,
+                host=dhost_test,
+                link=TCLink,
+                controller=None,
+                trace=path,
+            )
+            net.start()
+            net.stop()
+            with open(path) as f:
+                events = json.load(f)["traceEvents"]
+        spans = [e for e in events if e["ph"] == "X"]
+        nodes = {e["args"]["node"] for e in spans if e["name"] == "containers.run"}
+        self.assertEqual(nodes, {f"h{i}" for i in range(1, HOST_NUM + 1)})
+        prompts = [e for e in spans if e["name"] == "dhost.waitPrompt"]
+        self.assertEqual(len(prompts), HOST_NUM)
+        links = [e for e in spans if e["name"] == "addLink"]
+        self.assertEqual(len(links), HOST_NUM)
+        intfs = [e for e in spans if e["name"] == "tc.config"]
+        self.assertEqual(len(intfs), 2 * HOST_NUM)
+        self.assertIn("phase.containers", {e["name"] for e in spans})
+        self.assertFalse(trace.tracing())
+
+
+class TestNetnsRuntime(unittest.TestCase):
+    def test_netns_runtime(self):
+        dhost_test = functools.partial(DockerHost, dimage="dev_test")
+        net = Containernet(
+            topo=TestTopo(HOST_NUM),
+            switch=OVSBridge,
+            host=dhost_test,
+            controller=None,
+            runtime="netns",
+        )
+        try:
+            net.start()
+            pids = [h.pid for h in net.hosts]
+            self.assertEqual({h.exec_mode for h in net.hosts}, {"nsenter"})
+            self.assertEqual(net.get("h1").cmd("echo -n foo"), "foo")
+            self.assertEqual(net.pingAll(), 0.0)
+            stream = getClient().events()
+            stream.close()
+            self.assertNotIn(stream, getClient()._streams)
+            mgr = VNFManager(net)
+            c = mgr.addContainer("c1", "h1", "dev_test", "sleep 100")
+            ret = c.dins.exec_run("ip -o link show h1-eth0")
+            self.assertIn(net.get("h1").MAC(), ret.output.decode())
+            # The exit of the init process is noticed without any API call.
+            os.kill(c.dins.attrs["State"]["Pid"], signal.SIGKILL)
+            self.assertTrue(getEventMonitor().waitFor(c.dins.id, "die", timeout=1.0))
+            self.assertFalse(containerRunning(c.dins.id))
+            mgr.stop()
+        finally:
+            net.stop()
+            setRuntime("docker")
+        for pid in pids:
+            self.assertFalse(os.path.exists(f"/proc/{pid}"))
+
 
 if __name__ == "__main__":
     setLogLevel("warning")
@@ -7,9 +7,19 @@
 """
 
 import functools
+import time
 import unittest
 
+from comnetsemu.cgroup import _limitWrites
 from comnetsemu.clean import cleanup
+from comnetsemu.dockerapi import (
+    MAX_DESTROY_EVENTS,
+    DockerEventMonitor,
+    containerRunning,
+    getClient,
+    getEventMonitor,
+)
+from comnetsemu.exceptions import InvalidDockerArgs
 from comnetsemu.net import Containernet, APPContainerManager
 from comnetsemu.node import DockerHost
 from mininet.log import setLogLevel
@@ -50,6 +60,153 @@ def setUpClass(cls):
     def test_appcontainer(self):
         _ = self.mgr.addContainer("c1", "h1", "dev_test", "tcpdump", docker_args={})
 
+    def test_liveness_cache(self):
+        for h in self.net.hosts:
+            self.assertTrue(containerRunning(h.dins.id))
+            self.assertTrue(h._is_container_running())
+            self.assertEqual(h.cmd("echo -n foo"), "foo")
+
+    def test_exec_mode(self):
+        with self.assertRaises(ValueError):
+            self.net.addDockerHost("h0", dimage="dev_test", exec_mode="foo")
+        h4 = self.net.addDockerHost("h4", dimage="dev_test", exec_mode="nsenter")
+        self.assertEqual(
+            h4.cmd("hostname").strip(), h4.dins.attrs["Config"]["Hostname"]
+        )
+        out, _, ret = h4.pexec("echo -n bar")
+        self.assertEqual((out, ret), ("bar", 0))
+        self.net.delHost(h4)
+
+    def test_lazy_shell(self):
+        h5 = self.net.addDockerHost(
+            "h5", dimage="dev_test", lazy_shell=True, shell_idle_timeout=0.5
+        )
+        self.assertIsNone(h5.shell)
+        h5.oneshot_cmds = True
+        self.assertEqual(h5.cmd("echo -n foo"), "foo")
+        self.assertIsNone(h5.shell)
+        h5.oneshot_cmds = False
+        self.assertEqual(h5.cmd("echo -n bar"), "bar")
+        self.assertIsNotNone(h5.shell)
+        # The idle shell is closed and started again by the next command.
+        time.sleep(2)
+        self.assertIsNone(h5.shell)
+        self.assertEqual(h5.cmd("echo -n bar"), "bar")
+        h5.cmd("sleep 10 &")
+        time.sleep(2)
+        self.assertIsNotNone(h5.shell)
+        self.net.delHost(h5)
+
+    def test_update_resources(self):
+        h1 = self.net.get("h1")
+        h1.updateResources(cpu_quota=20000, mem_limit="256m")
+        h1.dins.reload()
+        self.assertEqual(h1.dins.attrs["HostConfig"]["CpuQuota"], 20000)
+        self.assertEqual(h1.docker_args["mem_limit"], "256m")
+        with self.assertRaises(InvalidDockerArgs):
+            h1.updateResources(privileged=False)
+        # Direct cgroup writes bypass the Docker daemon.
+        h1.updateResources(direct=True, cpu_quota=30000)
+        h1.dins.reload()
+        self.assertEqual(h1.dins.attrs["HostConfig"]["CpuQuota"], 20000)
+        # Only the given one of CPU quota and period is changed.
+        self.assertEqual(
+            _limitWrites(2, {"cpu_period": 50000}, "30000 100000\n"),
+            [("cpu", "cpu.max", "30000 50000")],
+        )
+        self.assertEqual(
+            _limitWrites(2, {"cpu_quota": -1}, "30000 50000\n"),
+            [("cpu", "cpu.max", "max 50000")],
+        )
+        self.assertEqual(
+            _limitWrites(1, {"cpu_quota": 30000}),
+            [("cpu", "cpu.cfs_quota_us", 30000)],
+        )
+
+        c1 = self.mgr.addContainer("u1", "h2", "dev_test", "bash", docker_args={})
+        failed = self.net.updateResources(
+            {"h1": {"cpu_quota": -1}, "h2": {"cpu_shares": 512}}
+        )
+        self.assertEqual(failed, dict())
+        self.assertEqual(self.mgr.updateResources({"u1": {"cpuset_cpus": "0"}}), {})
+        c1.dins.reload()
+        self.assertEqual(c1.dins.attrs["HostConfig"]["CpusetCpus"], "0")
+        self.mgr.removeContainer("u1")
+
+    def test_cmds(self):
+        h1 = self.net.get("h1")
+        outputs = h1.cmds(["echo foo", "cd /tmp", "pwd", ""])
+        self.assertEqual([o.strip() for o in outputs], ["foo", "", "/tmp", ""])
+        self.assertEqual(h1.cmd("echo -n bar"), "bar")
+        with self.assertRaises(ValueError):
+            h1.cmds(["echo foo\necho bar"])
+        # The outputs of a large batch exceed the buffers of the tty.
+        outputs = h1.cmds([f"seq {i} {i + 100}" for i in range(1000)])
+        self.assertEqual(len(outputs), 1000)
+        self.assertEqual(outputs[999].split(), [str(i) for i in range(999, 1100)])
+
+        ret = self.net.cmdsAll(["hostname", "echo done"])
+        self.assertEqual(sorted(ret.keys()), [f"h{i}" for i in range(1, HOST_NUM + 1)])
+        for name, outputs in ret.items():
+            h = self.net.get(name)
+            self.assertEqual(outputs[0].strip(), h.dins.attrs["Config"]["Hostname"])
+            self.assertEqual(outputs[1].strip(), "done")
+
+    def test_cmd_all(self):
+        start = time.time()
+        ret = self.net.cmdAll("sleep 1; echo foo")
+        self.assertLess(time.time() - start, HOST_NUM * 1.0)
+        self.assertEqual(len(ret), HOST_NUM)
+        for output in ret.values():
+            self.assertEqual(output.strip(), "foo")
+
+        ret = self.net.cmdAll("sleep 10; echo bar", hosts=["h1"], timeout=0.5)
+        self.assertNotIn("bar", ret["h1"])
+        self.assertEqual(self.net.timed_out_hosts, ["h1"])
+        self.assertEqual(self.net.get("h1").cmd("echo -n bar"), "bar")
+
+        ret = self.net.cmdsAll(
+            ["echo foo", "sleep 10", "echo bar"], hosts=["h1", "h2"], timeout=0.5
+        )
+        self.assertEqual(sorted(self.net.timed_out_hosts), ["h1", "h2"])
+        for outputs in ret.values():
+            self.assertEqual(outputs[0].strip(), "foo")
+            self.assertEqual(len(outputs), 2)
+        self.assertEqual(
+            self.net.cmdsAll(["echo -n bar"], hosts=["h2"]), {"h2": ["bar"]}
+        )
+        self.assertEqual(self.net.timed_out_hosts, [])
+        self.assertEqual(self.net.get("h1").cmd("echo -n bar"), "bar")
+
+        done = [h.name for h, data in self.net.cmdAllIter("hostname") if data is None]
+        self.assertEqual(sorted(done), [f"h{i}" for i in range(1, HOST_NUM + 1)])
+
+    def test_shared_client(self):
+        dclient = getClient()
+        for h in self.net.hosts:
+            self.assertIs(h.dclient, dclient)
+        self.assertIs(self.mgr.dclt, dclient)
+
+    def test_event_monitor(self):
+        dclient = getClient()
+        monitor = getEventMonitor()
+        self.assertTrue(monitor.alive)
+        c2 = self.mgr.addContainer("c2", "h2", "dev_test", "bash", docker_args={})
+        self.assertTrue(monitor.waitFor(c2.dins.id, "start", timeout=1.0))
+        self.mgr.removeContainer("c2")
+        self.assertTrue(monitor.waitFor(c2.dins.id, "destroy", timeout=1.0))
+        self.assertFalse(monitor.waitFor(c2.dins.id, "start", timeout=0.1))
+        # Only the latest destroy events are kept.
+        monitor = DockerEventMonitor(client=dclient)
+        monitor._run(
+            [
+                {"id": f"c{i}", "status": "destroy"}
+                for i in range(MAX_DESTROY_EVENTS + 10)
+            ]
+        )
+        self.assertEqual(len(monitor._events), MAX_DESTROY_EVENTS)
+        self.assertNotIn(("c0", "destroy"), monitor._events)
+
     @classmethod
     def tearDownClass(cls):
         cls.net.stop()
@@ -0,0 +1,189 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+About: Tracing spans of slow operations in ComNetsEmu.
+
+       Spans are recorded around e.g. container starts, shell attaches, veth
+       pair creations and traffic control configurations. They are written
+       as a Chrome trace-event JSON file (viewable in chrome://tracing or
+       Perfetto) or exported with OpenTelemetry if it is installed.
+
+       Tracing is enabled with startTracing(), the trace argument of
+       Containernet or the COMNETSEMU_TRACE environment variable. If it is
+       disabled, span() returns a shared no-op context manager.
+"""
+
+import json
+import os
+import threading
+import time
+
+from mininet.log import info
+
+# Path of a Chrome trace file or "otel" to use OpenTelemetry.
+TRACE_ENV = "COMNETSEMU_TRACE"
+OTEL_TARGET = "otel"
+
+
+class _NullSpan:
+    """Span used when tracing is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _ChromeSpan:
+    def __init__(self, tracer, name: str, attrs: dict):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        if exc_type is not None:
+            self.attrs["error"] = repr(exc)
+        self.tracer.add(self.name, self.start, end, self.attrs)
+        return False
+
+
+class ChromeTracer:
+    """Collect spans as complete events of the Chrome trace-event format and
+    write them to a JSON file on close()."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._pid = os.getpid()
+        self._origin = time.perf_counter()
+        # list.append is atomic, the lock only guards thread names.
+        self._events = list()
+        self._lock = threading.Lock()
+        self._threads = dict()
+
+    def span(self, name: str, attrs: dict):
+        return _ChromeSpan(self, name, attrs)
+
+    def add(self, name: str, start: float, end: float, attrs: dict):
+        """Add a span with perf_counter() start and end times."""
+        tid = threading.get_ident()
+        if tid not in self._threads:
+            with self._lock:
+                self._threads[tid] = threading.current_thread().name
+        self._events.append(
+            {
+                "name": name,
+                "cat": name.split(".", 1)[0],
+                "ph": "X",
+                "ts": (start - self._origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": self._pid,
+                "tid": tid,
+                "args": attrs,
+            }
+        )
+
+    def close(self):
+        """Write all spans to the trace file."""
+        meta = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": self._pid,
+                "tid": tid,
+                "args": {"name": name},
+            }
+            for tid, name in self._threads.items()
+        ]
+        with open(self.path, "w") as f:
+            json.dump(
+                {"traceEvents": meta + self._events, "displayTimeUnit": "ms"},
+                f,
+                default=str,
+            )
+        info(f"*** Wrote {len(self._events)} trace events to {self.path}\n")
+
+
+class OTelTracer:
+    """Create spans with the OpenTelemetry API. The SDK and exporters are
+    configured by the application, e.g. with opentelemetry-instrument."""
+
+    def __init__(self):
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            raise ImportError(
+                "OpenTelemetry tracing requires the opentelemetry-api package."
+            )
+        self._tracer = trace.get_tracer("comnetsemu")
+
+    def span(self, name: str, attrs: dict):
+        return self._tracer.start_as_current_span(
+            name, attributes={k: v for k, v in attrs.items() if v is not None}
+        )
+
+    def close(self):
+        pass
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def span(name: str, **attrs):
+    """Get a context manager which records a span with the given name and
+    attributes, e.g. span("dhost.startShell", node="h1").
+
+    It returns a shared no-op context manager if tracing is disabled.
+    """
+    tracer = _tracer
+    if tracer is None:
+        return _NULL_SPAN
+    return tracer.span(name, attrs)
+
+
+def tracing() -> bool:
+    """Tracing is enabled."""
+    return _tracer is not None
+
+
+def startTracing(target: str = None) -> bool:
+    """Enable tracing for the whole process.
+
+    :param target: Path of the Chrome trace file or "otel". The value of the
+        COMNETSEMU_TRACE environment variable is used if it is None.
+    :type target: str
+
+    :return: True if tracing is enabled by this call, False if it was already
+        enabled or no target is given.
+    :rtype: bool
+    """
+    global _tracer
+    if target is None:
+        target = os.environ.get(TRACE_ENV, None)
+    if not target:
+        return False
+    with _tracer_lock:
+        if _tracer is not None:
+            return False
+        _tracer = OTelTracer() if target == OTEL_TARGET else ChromeTracer(target)
+        return True
+
+
+def stopTracing():
+    """Disable tracing and write the trace file."""
+    global _tracer
+    with _tracer_lock:
+        tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.close()
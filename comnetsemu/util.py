@@ -5,3 +5,97 @@
 About: Utilities/Helpers for ComNetsEmu.
        Should be used in ComNetsEmu's Python modules
 """
+
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from comnetsemu.trace import span
+
+# Same default as concurrent.futures.ThreadPoolExecutor. Most of the work
+# done in worker threads is waiting for the Docker daemon or the kernel.
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+
+def concurrentMap(func, items, max_workers: int = None) -> list:
+    """Call func on every item with a bounded pool of worker threads.
+
+    Exceptions raised by func are caught and returned instead of being raised,
+    so that the caller can decide whether one failed item should abort the
+    whole operation (e.g. startup) or not (e.g. teardown).
+
+    :param func: The callable applied to each item.
+    :param items: An iterable of items.
+    :param max_workers: Maximal number of worker threads.
+    :type max_workers: int
+
+    :return: A list of (result, exception) tuples in the same order as items.
+    :rtype: list
+    """
+    items = list(items)
+    if not items:
+        return []
+    if max_workers is None:
+        max_workers = DEFAULT_WORKERS
+    max_workers = max(1, min(max_workers, len(items)))
+
+    def _call(item):
+        try:
+            return (func(item), None)
+        except Exception as e:
+            return (None, e)
+
+    if max_workers == 1:
+        return [_call(i) for i in items]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_call, items))
+
+
+def ipBatch(cmds: list) -> str:
+    """Run many iproute2 commands with one ip process.
+
+    Commands are given without the leading "ip", e.g. "link del dev s1-eth1".
+    The -force option is used, so ip continues on errors of single commands.
+
+    :param cmds: A list of iproute2 commands in string format.
+    :type cmds: list
+
+    :return: The error output of ip.
+    :rtype: str
+    """
+    if not cmds:
+        return ""
+    ret = subprocess.run(
+        ["ip", "-force", "-batch", "-"],
+        input="\n".join(cmds) + "\n",
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=False,
+    )
+    return ret.stderr
+
+
+class PhaseTimer:
+    """Measure the wall-clock time spent in named phases."""
+
+    def __init__(self):
+        # Phase name -> time in seconds. Time of repeated phases is summed up.
+        self.durations = dict()
+
+    @contextmanager
+    def phase(self, name: str):
+        """Context manager that adds the time spent in its body to the given
+        phase. The body is also traced as a span named phase.<name>."""
+        start = time.time()
+        try:
+            with span(f"phase.{name}"):
+                yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0.0) + (time.time() - start)
+
+    def report(self) -> str:
+        """Get the durations of all phases in one line."""
+        return ", ".join(f"{k}: {v:.3f}s" for k, v in self.durations.items())